@@ -0,0 +1,233 @@
+"""
+/***************************************************************************
+ address_parser
+                                 A QGIS plugin
+ 住所の自由入力検索
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+ 「津市丸の内1-2」のような1つの入力を市町村・大字・小字・街区と地番に分割して検索する。
+ 階層の名称は市町村配下の階層データまたは階層スナップショット（取得済みであればDBに問い合わせない）と
+ 前方一致で照合し、地番は分割の候補すべての検索キーを大字ごとにまとめて1回の検索で取得する
+"""
+import re
+
+from .batch_geocoder import HierarchyLookup, PREFECTURE_PATTERN, nameKey
+from .result_model import ResultTableModel
+
+
+# 漢数字
+KANJI_DIGITS = {"〇": 0, "一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+KANJI_UNITS = {"十": 10, "百": 100, "千": 1000}
+KANJI_NUMERAL_PATTERN = re.compile(f"[{''.join(KANJI_DIGITS)}{''.join(KANJI_UNITS)}]+")
+# 住所の比較で算用数字に揃える漢数字（「一丁目」「二十三番地」など、後に数の単位が続くもの）
+ADDRESS_NUMERAL_PATTERN = re.compile(f"{KANJI_NUMERAL_PATTERN.pattern}(?=丁目|丁|番町|番地|番|号|条|線|地割)")
+
+# 数字の間のハイフン類（NFKC変換後）
+NUMBER_HYPHEN_PATTERN = re.compile(r"(?<=\d)[‐‑‒–—―−ー-](?=\d)")
+# 数字の間の区切り（「1番地2」「1番2号」「1の2」はハイフンとみなす）
+NUMBER_SEPARATOR_PATTERN = re.compile(r"(?<=\d)(番地の?|番の?|号の?|の)(?=\d)")
+# 末尾の「番地」「番」「号」（街区の「1番」と入力の「1」を一致させる）
+NUMBER_SUFFIX_PATTERN = re.compile(r"(?<=\d)(番地|番|号)$")
+# 名称の前の「大字」「字」（入力で省略されることが多い）
+AZA_PREFIX_PATTERN = re.compile(r"^(大字|字)")
+
+# 階層（一致した階層の数 -> 一致レベル）
+ADDRESS_LEVELS = ["none", "city", "ooaza", "koaza", "gaiku"]
+
+# 検索結果の列（地番検索の結果と同じく0列目に住所、2・3列目に座標）
+CANDIDATE_FIELDS = ["address", "level", "x", "y", "score", "city_code", "ooaza_code", "koaza_code", "gaiku_code"]
+
+
+def kanjiNumber(text):
+    """
+    漢数字を数値に変換する（「二十三」→23、「一〇五」→105）
+
+    @param text 漢数字
+    @return 数値
+    """
+    if not any(c in KANJI_UNITS for c in text):
+        # 位取りの漢数字
+        return int("".join(str(KANJI_DIGITS[c]) for c in text))
+    total = 0
+    digit = None
+    for c in text:
+        if c in KANJI_UNITS:
+            total += (1 if digit is None else digit) * KANJI_UNITS[c]
+            digit = None
+        else:
+            digit = KANJI_DIGITS[c]
+    return total + (digit or 0)
+
+
+def kanjiNumerals(text, pattern=KANJI_NUMERAL_PATTERN):
+    """
+    文字列中の漢数字を算用数字に変換する
+
+    @param text 文字列
+    @param pattern 変換する漢数字のパターン
+    @return 変換後の文字列
+    """
+    return pattern.sub(lambda match: str(kanjiNumber(match.group())), text)
+
+
+def addressKey(text):
+    """
+    住所・名称の比較用のキーを作成する
+    nameKeyの正規化に加え、「一丁目」などの漢数字を算用数字に、数字の間のハイフン類・「番地」「の」などを「-」に揃える
+    （「千代田」などの名称の漢字は変換しない）
+
+    @param text 住所または名称
+    @return キー
+    """
+    key = kanjiNumerals(nameKey(text), ADDRESS_NUMERAL_PATTERN)
+    key = NUMBER_HYPHEN_PATTERN.sub("-", key)
+    key = NUMBER_SEPARATOR_PATTERN.sub("-", key)
+    return NUMBER_SUFFIX_PATTERN.sub("", key)
+
+
+class AddressPath:
+    """
+    入力の分割の候補（先頭から一致した階層と、残りの地番の部分）
+    """
+    def __init__(self, entries, rest):
+        """
+        @param entries 一致した階層の(コード, 名称, X座標, Y座標)のタプル
+        @param rest 残りの部分
+        """
+        self.entries = entries
+        self.rest = rest
+
+    def codes(self):
+        return [entry[0] for entry in self.entries]
+
+    def address(self):
+        return "".join(str(entry[1]) for entry in self.entries)
+
+
+class AddressSearch:
+    """
+    1つの入力で住所を検索するクラス
+
+    入力を正規化して先頭から階層の名称と照合し、一致する名称が複数ある場合は
+    max_paths件まで分割の候補を保持する。残りの部分は、一致した階層の配下の地番
+    （街区まで一致した場合は街区内の地番）として大字ごとに1回で検索する。
+    候補は入力のうち一致した文字数の割合で順位付けする
+    """
+    def __init__(self, db_util, max_paths=8):
+        """
+        @param db_util 検索に使用するDbUtil（検索するエリアを設定済みのもの）
+        @param max_paths 保持する分割の候補の最大数
+        """
+        self.db_util = db_util
+        self.max_paths = max_paths
+        self.lookup = HierarchyLookup(db_util, addressKey)
+
+    def matchChildren(self, rest, codes):
+        """
+        残りの部分の先頭に一致する子の階層の項目を長い順に探す
+
+        @param rest 残りの部分
+        @param codes 親の階層のコード
+        @return (項目, 一致した部分を除いた残り)のリスト
+        """
+        self.lookup.children(*codes)
+        matches = []
+        for text in dict.fromkeys((rest, AZA_PREFIX_PATTERN.sub("", rest))):
+            for key, entry in self.lookup.prefixes[tuple(codes)]:
+                if not text.startswith(key):
+                    continue
+                remaining = text[len(key):]
+                if key[-1].isdigit() and remaining[:1].isdigit():
+                    # 「1」は「12」の先頭には一致させない
+                    continue
+                matches.append((entry, remaining.lstrip("-")))
+        return matches
+
+    def parse(self, text, city_code=None):
+        """
+        入力を階層と地番に分割する
+
+        @param text 入力
+        @param city_code 入力に市町村名がない場合の市町村コード
+        @return (正規化した入力, AddressPathのリスト)
+        """
+        key = PREFECTURE_PATTERN.sub("", addressKey(text))
+        paths = []
+        states = [AddressPath((), key)]
+        for level in range(4):
+            next_states = []
+            for state in states:
+                matches = self.matchChildren(state.rest, state.codes())
+                if level == 0 and len(matches) == 0 and city_code:
+                    entry = self.lookup.find(city_code)
+                    if entry is not None:
+                        matches = [(entry, state.rest)]
+                if level > 0:
+                    # 下の階層を省略した入力（大字の直下の地番など）の候補としても残す
+                    paths.append(state)
+                for entry, rest in matches:
+                    next_states.append(AddressPath(state.entries + (entry,), rest))
+            states = next_states[:self.max_paths]
+            if len(states) == 0:
+                break
+        paths.extend(states)
+        return key, paths
+
+    def search(self, text, city_code=None, limit=20):
+        """
+        入力に該当する住所の候補を順位付けして取得する
+
+        @param text 入力
+        @param city_code 入力に市町村名がない場合の市町村コード
+        @param limit 取得する最大件数
+        @return フィールドCANDIDATE_FIELDSの候補（順位の高い順）
+        """
+        key, paths = self.parse(text, city_code)
+        if len(key) == 0:
+            return ResultTableModel(CANDIDATE_FIELDS, [])
+
+        # 大字ごとに地番の検索キーをまとめる
+        groups = {}
+        for path in paths:
+            codes = path.codes()
+            if len(codes) >= 2 and path.rest:
+                groups.setdefault((codes[0], codes[1]), set()).add(self.db_util.normalizeChiban(path.rest))
+        found = {}
+        for (city, ooaza), keys in groups.items():
+            model = self.db_util.getChibanBatch(city, ooaza, sorted(keys))
+            if model is None:
+                continue
+            for row in model.rows:
+                found.setdefault((city, ooaza, row[0]), []).append(row)
+
+        candidates = {}
+        for path in paths:
+            codes = path.codes()
+            padding = [""] * (4 - len(codes))
+            rows = []
+            if len(codes) >= 2 and path.rest:
+                rows = found.get((codes[0], codes[1], self.db_util.normalizeChiban(path.rest)), [])
+                if len(codes) >= 3:
+                    rows = [row for row in rows if row[1] == codes[2]]
+                if len(codes) >= 4:
+                    rows = [row for row in rows if row[2] == codes[3]]
+            if len(rows) > 0:
+                # 入力のすべてが一致した地番
+                for _, koaza_code, gaiku_code, address, x, y in rows:
+                    score = 1.0 + 0.01 * len(codes)
+                    candidate = (address, "chiban", x, y, round(score, 3), codes[0], codes[1], koaza_code, gaiku_code)
+                    if candidate[0] not in candidates or candidates[candidate[0]][4] < score:
+                        candidates[candidate[0]] = candidate
+            elif len(codes) > 0:
+                # 一致した最も下の階層（残りの部分がある場合は一致した割合で下げる）
+                entry = path.entries[-1]
+                score = (len(key) - len(path.rest)) / len(key) * 0.9 + 0.01 * len(codes)
+                address = path.address()
+                candidate = (address, ADDRESS_LEVELS[len(codes)], entry[2], entry[3], round(score, 3)) + tuple(codes + padding)
+                if address not in candidates or candidates[address][4] < score:
+                    candidates[address] = candidate
+
+        rows = sorted(candidates.values(), key=lambda candidate: (-candidate[4], candidate[0]))
+        return ResultTableModel(CANDIDATE_FIELDS, rows[:limit])
@@ -0,0 +1,128 @@
+"""
+/***************************************************************************
+ address_tree
+                                 A QGIS plugin
+ 市町村配下の階層データ
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+from .hierarchy_snapshot import HIERARCHY_FIELDS
+from .result_model import ResultTableModel
+
+
+# HIERARCHY_FIELDSの列位置
+CITY_CODE, OOAZA_CODE, KOAZA_CODE, GAIKU_CODE, NAME, KANA, HEADER, INITIAL, X, Y = range(len(HIERARCHY_FIELDS))
+
+
+class AddressTree:
+    """
+    1市町村分の大字、小字、街区を保持するクラス
+
+    1回の検索で取得した階層データから、コンボボックスや字選択ダイアログの
+    データモデルと名称をDBに問い合わせることなく作成する
+    メソッドはDbUtil・HierarchySnapshotの同名メソッドと同じ列のモデルを返す
+    """
+    def __init__(self, city_code, rows):
+        """
+        @param city_code 市町村コード
+        @param rows HIERARCHY_FIELDSの順の行データ
+        """
+        self.city_code = city_code
+        self.city_rows = []
+        self.ooaza_rows = []
+        # 大字コード -> 小字の行
+        self.koaza_rows = {}
+        # (大字コード, 小字コード) -> 街区の行
+        self.gaiku_rows = {}
+
+        for row in rows:
+            if row[OOAZA_CODE] == "":
+                self.city_rows.append(row)
+            elif row[KOAZA_CODE] == "":
+                self.ooaza_rows.append(row)
+            elif row[GAIKU_CODE] == "":
+                self.koaza_rows.setdefault(row[OOAZA_CODE], []).append(row)
+            else:
+                self.gaiku_rows.setdefault((row[OOAZA_CODE], row[KOAZA_CODE]), []).append(row)
+
+    def contains(self, city_code):
+        """
+        指定市町村の階層データか判定する
+        """
+        return self.city_code == city_code
+
+    def rowCount(self):
+        """
+        保持している行数
+        """
+        return (len(self.city_rows) + len(self.ooaza_rows)
+                + sum(len(rows) for rows in self.koaza_rows.values())
+                + sum(len(rows) for rows in self.gaiku_rows.values()))
+
+    @staticmethod
+    def makeModel(fields, rows, columns, sort_column, distinct=False):
+        """
+        行データから指定列のデータモデルを作成する
+
+        @param fields モデルの列名
+        @param rows 行データ
+        @param columns 行データから取り出す列位置
+        @param sort_column 並べ替えに使用するモデルの列位置
+        @param distinct 重複行を除く場合はTrue
+        @return データモデル
+        """
+        values = [tuple(row[column] for column in columns) for row in rows]
+        if distinct:
+            values = list(dict.fromkeys(values))
+        values.sort(key=lambda value: "" if value[sort_column] is None else str(value[sort_column]))
+        return ResultTableModel(fields, values)
+
+    def getOoazaModel(self, city_code):
+        """大字情報"""
+        return self.makeModel(["name", "code", "x", "y"], self.ooaza_rows, (NAME, OOAZA_CODE, X, Y), 1)
+
+    def getKoazaModel(self, city_code, ooaza_code):
+        """小字情報"""
+        rows = self.koaza_rows.get(ooaza_code, [])
+        return self.makeModel(["name", "code", "x", "y"], rows, (NAME, KOAZA_CODE, X, Y), 1, True)
+
+    def getGaikuModel(self, city_code, ooaza_code, koaza_code):
+        """街区情報"""
+        rows = self.gaiku_rows.get((ooaza_code, koaza_code), [])
+        return self.makeModel(["name", "code", "x", "y"], rows, (NAME, GAIKU_CODE, X, Y), 1, True)
+
+    def getOoazaDataJSyllabary(self, city_code):
+        """50音順の大字データ"""
+        return self.makeModel(["initial_group", "name", "kana", "initial", "code"],
+                              self.ooaza_rows, (HEADER, NAME, KANA, INITIAL, OOAZA_CODE), 2, True)
+
+    def getKoazaDataJSyllabary(self, city_code, ooaza_code):
+        """50音順の小字データ"""
+        rows = self.koaza_rows.get(ooaza_code, [])
+        return self.makeModel(["initial_group", "name", "kana", "initial", "code"],
+                              rows, (HEADER, NAME, KANA, INITIAL, KOAZA_CODE), 2, True)
+
+    def getGaikuData(self, city_code, ooaza_code, koaza_code):
+        """街区データ"""
+        rows = [row for row in self.gaiku_rows.get((ooaza_code, koaza_code), []) if row[GAIKU_CODE] != "0"]
+        return self.makeModel(["name", "code"], rows, (NAME, GAIKU_CODE), 1, True)
+
+    def getCityName(self, city_code):
+        """市町村名"""
+        return self.city_rows[0][NAME] if self.city_rows else None
+
+    def getOoazaName(self, city_code, ooaza_code):
+        """大字名"""
+        for row in self.ooaza_rows:
+            if row[OOAZA_CODE] == ooaza_code:
+                return row[NAME]
+        return None
+
+    def getKoazaName(self, city_code, ooaza_code, koaza_code):
+        """小字名"""
+        for row in self.koaza_rows.get(ooaza_code, []):
+            if row[KOAZA_CODE] == koaza_code:
+                return row[NAME]
+        return None
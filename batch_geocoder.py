@@ -0,0 +1,445 @@
+"""
+/***************************************************************************
+ batch_geocoder
+                                 A QGIS plugin
+ 住所の一括検索
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+ CSVファイルの住所（市町村、大字、小字、街区、地番の列、または住所の列）を
+ 先頭から順に読み込み、batch_size行ごとに大字単位でまとめて地番を検索する。
+ 結果は入力の列に座標と一致レベルを加えてCSVファイルに出力する
+
+ 使用方法（ローカルファイルを検索する場合）:
+   python -m search_zmap.batch_geocoder input.csv output.csv --local-file area.gpkg
+"""
+import argparse
+import csv
+import math
+import re
+import time
+import unicodedata
+
+from qgis.core import QgsMessageLog
+
+
+# 一括検索で1回に検索する地番の数（DbUtil.getChibanBatchはこの数に揃えてバインドする）
+CHIBAN_BATCH_SIZES = [16, 64, 256]
+
+# 逆検索で地番をまとめて取得する格子の一辺（最大距離に対する倍率）
+REVERSE_CELL_SCALE = 50
+
+# 入力の列名（英字またはCSVの見出し）
+COLUMN_ALIASES = {
+    "city": ["city", "市町村", "市区町村"],
+    "ooaza": ["ooaza", "大字", "町名"],
+    "koaza": ["koaza", "小字", "字"],
+    "gaiku": ["gaiku", "街区"],
+    "chiban": ["chiban", "地番"],
+    "address": ["address", "住所", "所在地"],
+}
+
+# 一致レベル（地番で一致、以下は一致した階層の代表点）
+MATCH_LEVELS = ["chiban", "gaiku", "koaza", "ooaza", "city", "none"]
+
+# 出力に加える列
+OUTPUT_FIELDS = ["x", "y", "match_level", "matched_address"]
+
+# 住所の先頭の都道府県名
+PREFECTURE_PATTERN = re.compile(r"^(東京都|北海道|京都府|大阪府|.{2,3}県)")
+
+# 住所の地番の前の区切り（「番地」「番」「の」は地番のハイフンとみなす）
+CHIBAN_SEPARATOR_PATTERN = re.compile(r"(番地|番|の)")
+
+
+def nameKey(text):
+    """
+    名称の比較用のキーを作成する
+    NFKCで全角英数字・半角カナを揃え、空白を除く
+
+    @param text 名称
+    @return キー
+    """
+    if text is None:
+        return ""
+    return re.sub(r"\s", "", unicodedata.normalize("NFKC", str(text)))
+
+
+def detectEncoding(path):
+    """
+    CSVファイルの文字コードを判定する（UTF-8でなければShift_JISとみなす）
+
+    @param path ファイルパス
+    @return 文字コード名
+    """
+    with open(path, "rb") as f:
+        sample = f.read(65536)
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # 読み込んだ範囲の末尾で文字が途切れた場合はUTF-8とみなす
+        if e.start < len(sample) - 3:
+            return "cp932"
+    return "utf-8-sig"
+
+
+class HierarchyLookup:
+    """
+    市町村・大字・小字・街区の名称またはコードからコードと代表点を求めるクラス
+    階層ごとのデータモデルはDbUtilから一度だけ取得して保持する
+    """
+    def __init__(self, db_util, key=nameKey):
+        """
+        @param db_util 検索に使用するDbUtil
+        @param key 名称の比較用のキーを作成する関数
+        """
+        self.db_util = db_util
+        self.key = key
+        # 親のコード -> (名称キーまたはコード -> (コード, 名称, X座標, Y座標))
+        self.entries = {}
+        # 親のコード -> 名称キーが長い順の(名称キー, 項目)のリスト（住所の前方一致用）
+        self.prefixes = {}
+
+    def children(self, *parent_codes):
+        """
+        親の階層の配下の項目を取得する
+
+        @param parent_codes 親の階層のコード（市町村の場合は省略）
+        @return 名称キーまたはコード -> (コード, 名称, X座標, Y座標)
+        """
+        entries = self.entries.get(parent_codes)
+        if entries is not None:
+            return entries
+
+        methods = [self.db_util.getCityModel, self.db_util.getOoazaModel, self.db_util.getKoazaModel, self.db_util.getGaikuModel]
+        model = methods[len(parent_codes)](*parent_codes)
+        entries = {}
+        prefixes = []
+        if model is not None:
+            name_column, code_column = model.fieldIndex("name"), model.fieldIndex("code")
+            x_column, y_column = model.fieldIndex("x"), model.fieldIndex("y")
+            for row in model.rows:
+                entry = (row[code_column], row[name_column], row[x_column], row[y_column])
+                key = self.key(row[name_column])
+                entries.setdefault(str(row[code_column]), entry)
+                if key:
+                    entries.setdefault(key, entry)
+                    prefixes.append((key, entry))
+                    if len(parent_codes) == 3 and key.endswith("番"):
+                        # 街区は「1」でも「1番」でも一致させる
+                        entries.setdefault(key[:-1], entry)
+        prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+        self.entries[parent_codes] = entries
+        self.prefixes[parent_codes] = prefixes
+        return entries
+
+    def find(self, value, *parent_codes):
+        """
+        名称またはコードで項目を探す
+
+        @param value 名称またはコード
+        @param parent_codes 親の階層のコード
+        @return (コード, 名称, X座標, Y座標)。該当なしの場合はNone
+        """
+        key = self.key(value)
+        if not key:
+            return None
+        return self.children(*parent_codes).get(key)
+
+    def matchPrefix(self, text, *parent_codes):
+        """
+        住所の先頭に一致する最も長い名称の項目を探す
+
+        @param text 住所の残りの部分（keyで正規化したもの）
+        @param parent_codes 親の階層のコード
+        @return (項目, 一致した部分を除いた残り)。該当なしの場合は(None, text)
+        """
+        self.children(*parent_codes)
+        for key, entry in self.prefixes[parent_codes]:
+            if text.startswith(key):
+                return entry, text[len(key):]
+        return None, text
+
+
+class BatchGeocoder:
+    """
+    CSVファイルの住所を一括で検索するクラス
+
+    入力を先頭から読み込み、batch_size行ごとに市町村～街区の名称をコードに変換し、
+    地番は大字ごとにまとめてDbUtil.getChibanBatchで検索する（1大字につき1回、地番が多い場合は分割）。
+    地番が見つからない場合は一致した最も下の階層の代表点を出力する
+    """
+    def __init__(self, db_util, batch_size=5000, progress_interval=2.0, progress=None):
+        """
+        @param db_util 検索に使用するDbUtil（検索するエリアを設定済みのもの）
+        @param batch_size まとめて検索する行数
+        @param progress_interval 進捗をログに出力する間隔（秒）
+        @param progress 進捗の通知先。処理済み行数と1秒あたりの行数を引数に呼び出す
+        """
+        self.db_util = db_util
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.progress = progress
+        self.lookup = HierarchyLookup(db_util)
+
+    def run(self, input_path, output_path, is_cancelled=None):
+        """
+        CSVファイルの住所を検索し、座標を付けて出力する
+
+        @param input_path 入力のCSVファイル（見出し行が必要。UTF-8またはShift_JIS）
+        @param output_path 出力先のCSVファイル（UTF-8、BOM付き）
+        @param is_cancelled 中止する場合にTrueを返す関数
+        @return rows, matched, levels, seconds, rows_per_secの辞書
+        """
+        started = time.perf_counter()
+        reported = started
+        levels = {level: 0 for level in MATCH_LEVELS}
+        count = 0
+
+        with open(input_path, newline="", encoding=detectEncoding(input_path)) as input_file, \
+                open(output_path, "w", newline="", encoding="utf-8-sig") as output_file:
+            reader = csv.reader(input_file)
+            writer = csv.writer(output_file)
+            header = next(reader, None)
+            if header is None:
+                raise ValueError(f"{input_path}に見出し行がありません")
+            columns = self.mapColumns(header)
+            writer.writerow(header + OUTPUT_FIELDS)
+
+            batch = []
+            for values in reader:
+                batch.append(values)
+                if len(batch) < self.batch_size:
+                    continue
+                count += self.writeBatch(writer, batch, columns, levels)
+                batch = []
+                now = time.perf_counter()
+                if now - reported >= self.progress_interval:
+                    self.reportProgress(count, now - started)
+                    reported = now
+                if is_cancelled is not None and is_cancelled():
+                    break
+            else:
+                count += self.writeBatch(writer, batch, columns, levels)
+
+        seconds = time.perf_counter() - started
+        self.reportProgress(count, seconds)
+        return {
+            "rows": count,
+            "matched": levels["chiban"],
+            "levels": levels,
+            "seconds": round(seconds, 3),
+            "rows_per_sec": round(count / seconds, 1) if seconds > 0 else 0,
+        }
+
+    def reportProgress(self, count, seconds):
+        """
+        進捗（処理済み行数と1秒あたりの行数）を通知する
+        """
+        rate = count / seconds if seconds > 0 else 0
+        QgsMessageLog.logMessage(f"住宅地図検索:住所一括検索 {count}件 {rate:.0f}件/秒")
+        if self.progress is not None:
+            self.progress(count, rate)
+
+    def mapColumns(self, header):
+        """
+        見出し行から入力の列の位置を求める
+
+        @param header 見出し行
+        @return 列の種類（city, ooaza, koaza, gaiku, chiban, address） -> 列番号
+        """
+        names = [nameKey(name).lower() for name in header]
+        columns = {}
+        for column, aliases in COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in names:
+                    columns[column] = names.index(alias)
+                    break
+        if "address" not in columns and not all(column in columns for column in ("city", "ooaza", "chiban")):
+            raise ValueError("入力に住所の列、または市町村・大字・地番の列がありません")
+        return columns
+
+    def writeBatch(self, writer, batch, columns, levels):
+        """
+        まとめた行を検索して出力する
+
+        @param writer 出力先
+        @param batch 入力の行のリスト
+        @param columns 入力の列の位置
+        @param levels 一致レベルごとの件数（加算する）
+        @return 出力した行数
+        """
+        for values, result in zip(batch, self.geocode([self.rowFields(values, columns) for values in batch])):
+            x, y, level, address = result
+            levels[level] += 1
+            writer.writerow(values + ["" if x is None else x, "" if y is None else y, level, address])
+        return len(batch)
+
+    @staticmethod
+    def rowFields(values, columns):
+        """
+        入力の行から列の種類ごとの値を取り出す
+        """
+        return {column: values[index].strip() if index < len(values) else "" for column, index in columns.items()}
+
+    def resolve(self, fields):
+        """
+        名称（または住所）を市町村～街区のコードと地番の検索キーに変換する
+
+        @param fields 列の種類ごとの値
+        @return (コードのリスト, 地番の検索キー, 一致した最も下の階層の(コード, 名称, X座標, Y座標))
+        """
+        codes = []
+        entry = None
+        if fields.get("address") and not fields.get("city"):
+            # 住所を市町村、大字、小字、街区の名称の前方一致で分割し、残りを地番とする
+            rest = PREFECTURE_PATTERN.sub("", nameKey(fields["address"]))
+            for _ in range(4):
+                child, rest = self.lookup.matchPrefix(rest, *codes)
+                if child is None:
+                    break
+                entry = child
+                codes.append(child[0])
+            chiban = CHIBAN_SEPARATOR_PATTERN.sub("-", rest).strip("-") if len(codes) >= 2 else ""
+        else:
+            for column in ("city", "ooaza", "koaza", "gaiku"):
+                child = self.lookup.find(fields.get(column), *codes)
+                if child is None:
+                    break
+                entry = child
+                codes.append(child[0])
+            chiban = fields.get("chiban", "")
+
+        chiban_key = self.db_util.normalizeChiban(chiban) if chiban else ""
+        return codes, chiban_key, entry
+
+    def geocode(self, rows):
+        """
+        複数行の住所を検索する
+
+        @param rows 列の種類ごとの値の辞書のリスト
+        @return (X座標, Y座標, 一致レベル, 一致した住所)のリスト
+        """
+        resolved = [self.resolve(fields) for fields in rows]
+
+        # 大字ごとに地番の検索キーをまとめる
+        groups = {}
+        for codes, chiban_key, entry in resolved:
+            if len(codes) >= 2 and chiban_key:
+                groups.setdefault((codes[0], codes[1]), set()).add(chiban_key)
+
+        # (市町村コード, 大字コード, 地番の検索キー) -> 該当する地番の行
+        found = {}
+        limit = CHIBAN_BATCH_SIZES[-1]
+        for (city_code, ooaza_code), keys in groups.items():
+            keys = sorted(keys)
+            for start in range(0, len(keys), limit):
+                model = self.db_util.getChibanBatch(city_code, ooaza_code, keys[start:start + limit])
+                if model is None:
+                    continue
+                for row in model.rows:
+                    found.setdefault((city_code, ooaza_code, row[0]), []).append(row)
+
+        results = []
+        for codes, chiban_key, entry in resolved:
+            candidates = found.get((codes[0], codes[1], chiban_key), []) if len(codes) >= 2 else []
+            # 小字・街区を指定した場合は一致するもののみ
+            if len(codes) >= 3:
+                candidates = [row for row in candidates if row[1] == codes[2]]
+            if len(codes) >= 4:
+                candidates = [row for row in candidates if row[2] == codes[3]]
+            if len(candidates) > 0:
+                _, _, _, address, x, y = candidates[0]
+                results.append((x, y, "chiban", address))
+            elif entry is not None:
+                level = ["city", "ooaza", "koaza", "gaiku"][len(codes) - 1]
+                results.append((entry[2], entry[3], level, entry[1]))
+            else:
+                results.append((None, None, "none", ""))
+        return results
+
+
+class ReverseGeocoder:
+    """
+    座標から最も近い地番を求めるクラス（逆検索）
+
+    座標を格子（一辺はmax_distanceのREVERSE_CELL_SCALE倍）ごとにまとめ、格子の範囲に
+    max_distanceを加えた範囲の地番をDbUtil.getChibanInExtentで1回取得して、
+    その中から最も近い地番を選ぶ
+    """
+    def __init__(self, db_util, max_distance):
+        """
+        @param db_util 検索に使用するDbUtil（検索するエリアを設定済みのもの）
+        @param max_distance 地番とみなす最大の距離（住所データの座標系の単位）
+        """
+        self.db_util = db_util
+        self.max_distance = max_distance
+
+    def lookup(self, points):
+        """
+        複数の座標に最も近い地番を求める
+
+        @param points (X座標, Y座標)のリスト（座標がない場合はNone）
+        @return 地番の行（address, chiban, city_code, ooaza_code, koaza_code, gaiku_code, x, y）と距離のタプルのリスト。
+                max_distance以内に地番がない場合は(None, None)
+        """
+        results = [(None, None)] * len(points)
+        cell_size = self.max_distance * REVERSE_CELL_SCALE
+        groups = {}
+        for index, point in enumerate(points):
+            if point is not None:
+                groups.setdefault((int(point[0] // cell_size), int(point[1] // cell_size)), []).append(index)
+
+        for indexes in groups.values():
+            xs = [points[index][0] for index in indexes]
+            ys = [points[index][1] for index in indexes]
+            model = self.db_util.getChibanInExtent(min(xs) - self.max_distance, min(ys) - self.max_distance,
+                                                   max(xs) + self.max_distance, max(ys) + self.max_distance)
+            if model is None or model.rowCount() == 0:
+                continue
+
+            # 地番をmax_distance四方の格子に分け、座標の周囲の格子のみ比較する
+            grid = {}
+            for row in model.rows:
+                if row[6] is not None and row[7] is not None:
+                    grid.setdefault((int(row[6] // self.max_distance), int(row[7] // self.max_distance)), []).append(row)
+            for index in indexes:
+                x, y = points[index]
+                column, line = int(x // self.max_distance), int(y // self.max_distance)
+                nearest, nearest_distance = None, self.max_distance
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        for row in grid.get((column + dx, line + dy), ()):
+                            distance = math.hypot(row[6] - x, row[7] - y)
+                            if distance <= nearest_distance:
+                                nearest, nearest_distance = row, distance
+                if nearest is not None:
+                    results[index] = (nearest, nearest_distance)
+        return results
+
+
+def main():
+    # db_utilはこのモジュールを読み込むため、実行時に読み込む
+    from .db_backend import SqliteBackend
+    from .db_util import DbUtil
+
+    parser = argparse.ArgumentParser(description="住所の一括検索")
+    parser.add_argument("input", help="入力のCSVファイル")
+    parser.add_argument("output", help="出力先のCSVファイル")
+    parser.add_argument("--local-file", required=True, help="検索するローカルファイル（エリアのローカルファイル出力で作成したもの）")
+    parser.add_argument("--batch-size", type=int, default=5000, help="まとめて検索する行数")
+    args = parser.parse_args()
+
+    db_util = DbUtil()
+    db_util.setBackend(SqliteBackend(args.local_file))
+    db_util.use_snapshot = False
+    db_util.setSchema(db_util.getSchemaNames()[0])
+    geocoder = BatchGeocoder(db_util, args.batch_size,
+                             progress=lambda count, rate: print(f"{count} rows {rate:.0f} rows/s"))
+    result = geocoder.run(args.input, args.output)
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+"""
+/***************************************************************************
+ benchmark
+                                 A QGIS plugin
+ 性能計測スクリプト
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+ プラグインフォルダの親フォルダで、QGISのPython環境から次のように実行する
+   python -m search_zmap.benchmark.select_aza_paint
+
+ DbUtilの検索は、生成した住所データ（SQLite）に対してPostgreSQLなしで計測できる
+   python -m search_zmap.benchmark.synthetic_address benchmark.sqlite
+   python -m search_zmap.benchmark.db_util_scenarios benchmark.sqlite --output baseline.json
+"""
@@ -0,0 +1,248 @@
+"""
+/***************************************************************************
+ db_util_scenarios
+                                 A QGIS plugin
+ DbUtilの検索の性能計測
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+ synthetic_addressで生成した住所データに対して、DbUtilのget*Modelなどの検索と
+ 字選択ダイアログ・地番検索の操作の流れを、次の3通りの構成で計測する
+   server    : 毎回v_address_listを検索する（スナップショット、市町村配下の一括取得を使用しない）
+   city_tree : 市町村配下の階層データを一括で取得して使用する
+   snapshot  : 階層スナップショットを使用する
+
+ 結果はJSONに出力でき、以前の結果（ベースライン）を指定すると中央値を比較する
+
+ 使用方法:
+   python -m search_zmap.benchmark.synthetic_address benchmark.sqlite
+   python -m search_zmap.benchmark.db_util_scenarios benchmark.sqlite [--iterations 50] [--output result.json] [--baseline baseline.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import time
+
+from ..kana_index import KANA_DISC, KanaIndex
+from .sqlite_backend import SqliteDbUtil
+
+
+# 構成名 -> (スナップショットを使用する, 市町村配下を一括で取得する)
+MODES = {
+    "server": (False, False),
+    "city_tree": (False, True),
+    "snapshot": (True, False),
+}
+
+
+def loadTargets(path, count, seed):
+    """
+    計測で検索する小字と地番を住所データから無作為に選ぶ
+
+    @param path SQLiteファイル
+    @param count 選ぶ件数
+    @param seed 乱数の種
+    @return (市町村コード, 大字コード, 小字コード, 地番の入力, 住所の入力)のリスト
+    """
+    conn = sqlite3.connect(path)
+    try:
+        koaza_rows = conn.execute(
+            "SELECT city_code, ooaza_code, koaza_code FROM v_address_list"
+            " WHERE koaza_code != '' AND gaiku_code = ''").fetchall()
+        honban_rows = conn.execute("SELECT DISTINCT honban FROM v_address_list WHERE honban IS NOT NULL").fetchall()
+        address_rows = conn.execute("SELECT address FROM v_address_list WHERE chiban != '' AND setai_name = ''").fetchall()
+    finally:
+        conn.close()
+    if len(koaza_rows) == 0 or len(honban_rows) == 0:
+        raise ValueError(f"{path}に住所データがありません")
+
+    rand = random.Random(seed)
+    targets = []
+    for _ in range(count):
+        city_code, ooaza_code, koaza_code = rand.choice(koaza_rows)
+        # 地番の入力は本番の先頭1～2桁（部分一致で複数件該当する）
+        chiban = str(rand.choice(honban_rows)[0])[:rand.choice((1, 2))]
+        # 住所の入力は地番までの住所（自由入力検索用）
+        targets.append((city_code, ooaza_code, koaza_code, chiban, rand.choice(address_rows)[0]))
+    return targets
+
+
+def dialogNavigation(db_util, city_code, ooaza_code, koaza_code):
+    """
+    字選択ダイアログで市町村→大字→小字→街区と選択する流れ
+    各階層でデータを取得し、50音索引を作成して行ごとに絞り込む
+    """
+    for model in (db_util.getCityDataJSyllabary(),
+                  db_util.getOoazaDataJSyllabary(city_code),
+                  db_util.getKoazaDataJSyllabary(city_code, ooaza_code)):
+        kana_index = KanaIndex(model)
+        for gyo in KANA_DISC:
+            kana_index.rowsOfGyo(gyo)
+    db_util.getGaikuData(city_code, ooaza_code, koaza_code)
+
+
+def dockNavigation(db_util, city_code, ooaza_code, koaza_code, chiban):
+    """
+    地番検索で大字→小字→街区のコンボボックスを作成し、地番を検索する流れ
+    """
+    db_util.getOoazaModel(city_code)
+    db_util.getKoazaModel(city_code, ooaza_code)
+    gaiku_model = db_util.getGaikuModel(city_code, ooaza_code, koaza_code)
+    db_util.getOoazaName(city_code, ooaza_code)
+    db_util.getKoazaName(city_code, ooaza_code, koaza_code)
+    gaiku_code = gaiku_model.value(0, "code") if gaiku_model is not None and gaiku_model.rowCount() > 0 else None
+    db_util.getChibanPage(city_code, ooaza_code, koaza_code, gaiku_code, chiban)
+    db_util.getChibanCount(city_code, ooaza_code, koaza_code, gaiku_code, chiban)
+
+
+# シナリオ名 -> 計測する処理（DbUtilと検索対象を引数にとる）
+SCENARIOS = {
+    "getCityModel": lambda db, c, o, k, n, a: db.getCityModel(),
+    "getOoazaModel": lambda db, c, o, k, n, a: db.getOoazaModel(c),
+    "getKoazaModel": lambda db, c, o, k, n, a: db.getKoazaModel(c, o),
+    "getGaikuModel": lambda db, c, o, k, n, a: db.getGaikuModel(c, o, k),
+    "getChibanModel": lambda db, c, o, k, n, a: db.getChibanModel(c, o, k, None, n),
+    "getChibanPage": lambda db, c, o, k, n, a: db.getChibanPage(c, o, k, None, n),
+    "getChibanCount": lambda db, c, o, k, n, a: db.getChibanCount(c, o, k, None, n),
+    "getChibanExtent": lambda db, c, o, k, n, a: db.getChibanExtent(c, o, k, None, n),
+    "getOoazaDataJSyllabary": lambda db, c, o, k, n, a: db.getOoazaDataJSyllabary(c),
+    "getKoazaDataJSyllabary": lambda db, c, o, k, n, a: db.getKoazaDataJSyllabary(c, o),
+    "getGaikuData": lambda db, c, o, k, n, a: db.getGaikuData(c, o, k),
+    "dialogNavigation": lambda db, c, o, k, n, a: dialogNavigation(db, c, o, k),
+    "dockNavigation": lambda db, c, o, k, n, a: dockNavigation(db, c, o, k, n),
+    "searchAddress": lambda db, c, o, k, n, a: db.searchAddress(a),
+}
+
+
+def statistics(times):
+    """
+    処理時間の統計を求める
+
+    @param times 処理時間（ミリ秒）のリスト
+    @return count, mean_ms, p50_ms, p95_ms, max_msの辞書
+    """
+    times = sorted(times)
+    return {
+        "count": len(times),
+        "mean_ms": round(sum(times) / len(times), 3),
+        "p50_ms": round(times[len(times) // 2], 3),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        "max_ms": round(times[-1], 3),
+    }
+
+
+def runMode(path, mode, targets, scenario_names):
+    """
+    1つの構成ですべてのシナリオを計測する
+
+    @param path SQLiteファイル
+    @param mode 構成名
+    @param targets 検索対象のリスト
+    @param scenario_names 計測するシナリオ名のリスト
+    @return シナリオ名 -> 統計
+    """
+    use_snapshot, prefetch_city = MODES[mode]
+    db_util = SqliteDbUtil(path)
+    db_util.use_snapshot = use_snapshot
+    db_util.prefetch_city = prefetch_city
+    results = {}
+    try:
+        if use_snapshot:
+            # スナップショットの作成（初回のみ）
+            start = time.perf_counter()
+            db_util.prepareSnapshot()
+            results["prepareSnapshot"] = statistics([(time.perf_counter() - start) * 1000])
+
+        for name in scenario_names:
+            scenario = SCENARIOS[name]
+            times = []
+            for target in targets:
+                start = time.perf_counter()
+                scenario(db_util, *target)
+                times.append((time.perf_counter() - start) * 1000)
+            results[name] = statistics(times)
+    finally:
+        db_util.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    ベースラインと中央値を比較して出力する
+
+    @param results 計測結果
+    @param baseline ベースラインの計測結果
+    @param tolerance 許容する悪化の割合
+    @return 許容を超えて悪化したシナリオ数
+    """
+    regressions = 0
+    print(f"{'mode':10s} {'scenario':24s} {'baseline':>10s} {'current':>10s} {'ratio':>7s}")
+    for mode, scenarios in results.items():
+        for name, stats in scenarios.items():
+            base = baseline.get(mode, {}).get(name)
+            if base is None or base["p50_ms"] <= 0:
+                continue
+            ratio = stats["p50_ms"] / base["p50_ms"]
+            mark = ""
+            if ratio > 1 + tolerance:
+                mark = " REGRESSION"
+                regressions += 1
+            print(f"{mode:10s} {name:24s} {base['p50_ms']:10.3f} {stats['p50_ms']:10.3f} {ratio:7.2f}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DbUtilの検索の性能計測")
+    parser.add_argument("path", help="synthetic_addressで生成したSQLiteファイル")
+    parser.add_argument("--iterations", type=int, default=50, help="シナリオごとの検索回数")
+    parser.add_argument("--mode", action="append", choices=list(MODES), help="計測する構成（省略時はすべて）")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="計測するシナリオ（省略時はすべて）")
+    parser.add_argument("--seed", type=int, default=1, help="乱数の種")
+    parser.add_argument("--output", help="計測結果を出力するJSONファイル")
+    parser.add_argument("--baseline", help="比較するベースラインのJSONファイル")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="ベースラインから許容する悪化の割合")
+    args = parser.parse_args()
+
+    targets = loadTargets(args.path, args.iterations, args.seed)
+    scenario_names = args.scenario or list(SCENARIOS)
+    with sqlite3.connect(args.path) as conn:
+        row_count = conn.execute("SELECT COUNT(*) FROM v_address_list").fetchone()[0]
+
+    results = {}
+    for mode in args.mode or list(MODES):
+        results[mode] = runMode(args.path, mode, targets, scenario_names)
+        for name, stats in results[mode].items():
+            print(f"{mode:10s} {name:24s} mean {stats['mean_ms']:9.3f} p50 {stats['p50_ms']:9.3f}"
+                  f" p95 {stats['p95_ms']:9.3f} max {stats['max_ms']:9.3f} ms")
+
+    if args.output:
+        document = {
+            "meta": {
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "data": os.path.basename(args.path),
+                "rows": row_count,
+                "iterations": args.iterations,
+                "seed": args.seed,
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.tolerance) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+/***************************************************************************
+ select_aza_paint
+                                 A QGIS plugin
+ 字選択ダイアログの50音列の描画性能計測
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+ 字選択ダイアログと同じ構成のテーブルビュー（50音フィルター＋前行と同値を表示しない50音列）を
+ スクロールしながら再描画し、1画面あたりの描画時間を計測する。
+ 比較のため、前行の値を描画のたびに取得する従来の描画委任クラスでも計測する
+
+ 使用方法:
+   QT_QPA_PLATFORM=offscreen python -m search_zmap.benchmark.select_aza_paint [--rows 3000] [--frames 300]
+"""
+import argparse
+import time
+
+from qgis.PyQt.QtCore import Qt, QModelIndex
+from qgis.PyQt.QtWidgets import QApplication, QTableView, QStyledItemDelegate, QStyleOptionViewItem
+
+from ..kana_index import KANA_DISC, KanaIndex
+from ..result_model import ResultTableModel
+from ..select_aza_dialog import JSyllabaryFilterProxyModel, EquivalentBlankColumnDelegate
+
+
+class LegacyBlankColumnDelegate(QStyledItemDelegate):
+    """
+    比較用：描画のたびに前行の値を取得して比較する描画委任クラス
+    """
+    def paint(self, painter, option: QStyleOptionViewItem, index: QModelIndex):
+        if index.row() > 0:
+            prev_index = index.model().index(index.row() - 1, index.column())
+            if str(index.model().data(prev_index, Qt.DisplayRole)) == str(index.model().data(index, Qt.DisplayRole)):
+                new_option = QStyleOptionViewItem()
+                self.initStyleOption(new_option, index)
+                new_option.text = ""
+                super().paint(painter, new_option, index)
+                return
+
+        super().paint(painter, option, index)
+
+
+def makeModel(row_count):
+    """
+    50音順の大字データを模したデータモデルを作成する
+
+    @param row_count 行数
+    @return データモデル
+    """
+    kanas = "".join(KANA_DISC.values())
+    rows = []
+    for row in range(row_count):
+        kana = kanas[row * len(kanas) // row_count]
+        gyo = next(gyo for gyo, dan in KANA_DISC.items() if kana in dan)
+        rows.append((gyo, f"大字{row:05d}", f"{kana}あざ{row:05d}", kana, f"{row:05d}"))
+    return ResultTableModel(["initial_group", "name", "kana", "initial", "code"], rows)
+
+
+def measure(view, frames):
+    """
+    スクロールしながら再描画し、1画面あたりの描画時間を計測する
+
+    @param view テーブルビュー
+    @param frames 再描画回数
+    @return 1画面あたりの時間（ミリ秒）
+    """
+    scroll_bar = view.verticalScrollBar()
+    step = max(1, scroll_bar.maximum() // max(1, frames))
+    start = time.perf_counter()
+    for frame in range(frames):
+        scroll_bar.setValue((frame * step) % (scroll_bar.maximum() + 1))
+        view.viewport().repaint()
+    return (time.perf_counter() - start) * 1000 / frames
+
+
+def run(row_count, frames):
+    """
+    計測を実行し、結果を出力する
+
+    @param row_count 行数
+    @param frames 再描画回数
+    """
+    app = QApplication.instance() or QApplication([])
+    model = makeModel(row_count)
+    kana_index = KanaIndex(model)
+
+    results = {}
+    for name, delegate_class in (("legacy", LegacyBlankColumnDelegate), ("group_start", EquivalentBlankColumnDelegate)):
+        proxy = JSyllabaryFilterProxyModel(None)
+        proxy.setKanaIndex(kana_index)
+        proxy.setSourceModel(model)
+
+        view = QTableView()
+        view.resize(400, 600)
+        view.setModel(proxy)
+        delegate = delegate_class(view)
+        view.setItemDelegateForColumn(0, delegate)
+        view.show()
+        app.processEvents()
+
+        start = time.perf_counter()
+        for gyo in KANA_DISC:
+            proxy.filterGyo(gyo)
+        proxy.clearFilter()
+        filter_ms = (time.perf_counter() - start) * 1000 / (len(KANA_DISC) + 1)
+
+        results[name] = (measure(view, frames), filter_ms)
+        view.close()
+
+    print(f"rows={row_count} frames={frames}")
+    for name, (paint_ms, filter_ms) in results.items():
+        print(f"{name:12s} repaint {paint_ms:8.3f} ms/frame  filter {filter_ms:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="字選択ダイアログの50音列の描画性能計測")
+    parser.add_argument("--rows", type=int, default=3000, help="行数")
+    parser.add_argument("--frames", type=int, default=300, help="再描画回数")
+    args = parser.parse_args()
+    run(args.rows, args.frames)
+
+
+if __name__ == "__main__":
+    main()
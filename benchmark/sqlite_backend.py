@@ -0,0 +1,47 @@
+"""
+/***************************************************************************
+ sqlite_backend
+                                 A QGIS plugin
+ 性能計測用のSQLiteによるDbUtil
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+ synthetic_addressで生成したSQLiteファイルをSqliteBackendでスキーマ名にATTACHし、
+ DbUtilの検索（{スキーマ名}.v_address_listに対するSQL）をそのまま実行する。
+ PostGISの関数（ST_Centroid、ST_X、ST_Y、ST_Extentなど）とPostgreSQLの関数（hashtext、CONCAT_WS）は
+ SqliteBackendが登録するPythonの関数で代用する
+"""
+import shutil
+import tempfile
+
+from ..db_backend import SqliteBackend
+from ..db_util import DbUtil
+
+
+class SqliteDbUtil(DbUtil):
+    """
+    SQLiteファイルを検索するDbUtil
+
+    SQLの作成、階層データ・スナップショット・名称キャッシュの使用はDbUtilのまま、
+    SQLの実行のみSQLiteで行う
+    """
+    def __init__(self, path, schema_name="ja_bench"):
+        """
+        @param path synthetic_addressで生成したSQLiteファイル
+        @param schema_name ATTACHするスキーマ名
+        """
+        super().__init__()
+        self.setBackend(SqliteBackend(path, schema_name))
+        self.schema_name = schema_name
+        self.snapshot_dir = tempfile.mkdtemp(prefix="search_zmap_bench_")
+
+    def snapshotDir(self):
+        return self.snapshot_dir
+
+    def close(self):
+        """
+        接続を閉じ、スナップショットの保存先を削除する
+        """
+        self.setBackend(None)
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
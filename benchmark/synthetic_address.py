@@ -0,0 +1,213 @@
+"""
+/***************************************************************************
+ synthetic_address
+                                 A QGIS plugin
+ 性能計測用の住所データ生成
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+ v_address_listと同じ列構成の住所データ（市町村、大字、小字、街区、地番、世帯）を
+ 乱数で生成し、SQLiteファイルに書き出す。ジオメトリはWKTの矩形で保持する。
+ 件数は市町村数×大字数×小字数×街区数×地番数で、数百万行まで生成できる
+
+ 使用方法:
+   python -m search_zmap.benchmark.synthetic_address benchmark.sqlite [--cities 4] [--ooaza 60] [--koaza 3] [--gaiku 8] [--chiban 25]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+
+from ..kana_index import KANA_GYO, kanaInitial
+
+
+# v_address_listの列
+ADDRESS_FIELDS = ["city_code", "ooaza_code", "koaza_code", "gaiku_code", "chiban", "setai_name",
+                  "name", "kana", "header", "address",
+                  "honban", "edaban", "magoban", "himagoban", "yasyagoban", "kigo", "the_geom"]
+
+# 名称に使用する漢字とよみ
+NAME_PARTS = [("青", "あお"), ("赤", "あか"), ("石", "いし"), ("上", "うえ"), ("大", "おお"),
+              ("川", "かわ"), ("北", "きた"), ("栗", "くり"), ("小", "こ"), ("桜", "さくら"),
+              ("新", "しん"), ("杉", "すぎ"), ("関", "せき"), ("高", "たか"), ("千", "ち"),
+              ("鶴", "つる"), ("寺", "てら"), ("富", "とみ"), ("中", "なか"), ("西", "にし"),
+              ("沼", "ぬま"), ("根", "ね"), ("野", "の"), ("原", "はら"), ("東", "ひがし"),
+              ("藤", "ふじ"), ("本", "ほん"), ("松", "まつ"), ("南", "みなみ"), ("村", "むら"),
+              ("森", "もり"), ("山", "やま"), ("雪", "ゆき"), ("横", "よこ"), ("竜", "りゅう"),
+              ("若", "わか"), ("岡", "おか"), ("田", "た"), ("島", "しま"), ("浜", "はま")]
+
+# 街区の幅（度）
+GAIKU_SIZE = 0.002
+
+# 一度に書き込む行数
+BATCH_SIZE = 10000
+
+WIDE_DIGITS = str.maketrans("0123456789", "０１２３４５６７８９")
+
+
+def makeName(rand, suffix, used):
+    """
+    重複しない名称とよみを作成する
+
+    @param rand 乱数
+    @param suffix 名称の末尾（町、村など）と、そのよみのタプル
+    @param used 作成済みの名称の集合
+    @return (名称, よみ)
+    """
+    while True:
+        parts = rand.sample(NAME_PARTS, rand.choice((1, 2, 2, 3)))
+        name = "".join(part[0] for part in parts) + suffix[0]
+        if name not in used:
+            used.add(name)
+            return name, "".join(part[1] for part in parts) + suffix[1]
+
+
+def polygonWkt(x, y, size):
+    """
+    矩形のWKTを作成する
+
+    @param x 左下のX座標
+    @param y 左下のY座標
+    @param size 幅
+    @return WKT
+    """
+    return (f"POLYGON(({x:.6f} {y:.6f},{x + size:.6f} {y:.6f},{x + size:.6f} {y + size:.6f},"
+            f"{x:.6f} {y + size:.6f},{x:.6f} {y:.6f}))")
+
+
+def generateRows(cities, ooaza_count, koaza_count, gaiku_count, chiban_count, seed=1):
+    """
+    住所データを階層順に生成する
+
+    @param cities 市町村数
+    @param ooaza_count 市町村ごとの大字数
+    @param koaza_count 大字ごとの小字数
+    @param gaiku_count 小字ごとの街区数
+    @param chiban_count 街区ごとの地番数（10件に1件は世帯の行も作成する）
+    @param seed 乱数の種
+    @return ADDRESS_FIELDSの順の行を返すジェネレーター
+    """
+    rand = random.Random(seed)
+    used = set()
+
+    def row(codes, name, kana, address, geom, chiban="", setai_name="", keys=(None, None, None, None, None, "")):
+        header = KANA_GYO.get(kanaInitial(kana), "")
+        return codes + (chiban, setai_name, name, kana, header, address) + keys + (geom,)
+
+    for city in range(cities):
+        city_code = f"{13101 + city}"
+        city_name, city_kana = makeName(rand, ("市", "し"), used)
+        city_x, city_y = 139.0 + city * 0.5, 35.0
+        city_size = GAIKU_SIZE * gaiku_count * koaza_count * 2 * max(1, int(ooaza_count ** 0.5) + 1)
+        yield row((city_code, "", "", ""), city_name, city_kana, city_name, polygonWkt(city_x, city_y, city_size))
+
+        columns = max(1, int(ooaza_count ** 0.5) + 1)
+        for ooaza in range(ooaza_count):
+            ooaza_code = f"{ooaza + 1:03d}"
+            ooaza_name, ooaza_kana = makeName(rand, ("町", "まち"), used)
+            ooaza_x = city_x + (ooaza % columns) * GAIKU_SIZE * gaiku_count * 2
+            ooaza_y = city_y + (ooaza // columns) * GAIKU_SIZE * koaza_count * 2
+            ooaza_address = city_name + ooaza_name
+            yield row((city_code, ooaza_code, "", ""), ooaza_name, ooaza_kana, ooaza_address,
+                      polygonWkt(ooaza_x, ooaza_y, GAIKU_SIZE * gaiku_count * 2))
+
+            for koaza in range(koaza_count):
+                koaza_code = f"{koaza + 1:02d}"
+                koaza_name, koaza_kana = makeName(rand, ("", ""), used)
+                koaza_y = ooaza_y + koaza * GAIKU_SIZE * 2
+                koaza_address = ooaza_address + koaza_name
+                yield row((city_code, ooaza_code, koaza_code, ""), koaza_name, koaza_kana, koaza_address,
+                          polygonWkt(ooaza_x, koaza_y, GAIKU_SIZE * gaiku_count))
+
+                for gaiku in range(gaiku_count):
+                    gaiku_code = f"{gaiku + 1}"
+                    gaiku_name = f"{gaiku + 1}番".translate(WIDE_DIGITS)
+                    gaiku_x = ooaza_x + gaiku * GAIKU_SIZE
+                    gaiku_address = koaza_address + gaiku_name
+                    codes = (city_code, ooaza_code, koaza_code, gaiku_code)
+                    yield row(codes, gaiku_name, "", gaiku_address, polygonWkt(gaiku_x, koaza_y, GAIKU_SIZE))
+
+                    size = GAIKU_SIZE / (int(chiban_count ** 0.5) + 1)
+                    columns_in_gaiku = int(chiban_count ** 0.5) + 1
+                    honban = gaiku * 100 + 1
+                    for number in range(chiban_count):
+                        edaban = rand.choice((None, None, 1, 2, 3))
+                        kigo = rand.choice(("", "", "", "イ", "ロ"))
+                        chiban = f"{honban}" if edaban is None else f"{honban}-{edaban}"
+                        chiban = (chiban + kigo).translate(WIDE_DIGITS).replace("-", "‐")
+                        x = gaiku_x + (number % columns_in_gaiku) * size
+                        y = koaza_y + (number // columns_in_gaiku) * size
+                        keys = (honban, edaban, None, None, None, kigo)
+                        address = gaiku_address + chiban
+                        yield row(codes, chiban, "", address, polygonWkt(x, y, size), chiban, "", keys)
+                        if number % 10 == 0:
+                            yield row(codes, chiban, "", address, polygonWkt(x, y, size), chiban, f"世帯{number:04d}", keys)
+                        if rand.random() < 0.7:
+                            honban += 1
+
+
+def generate(path, cities=4, ooaza_count=60, koaza_count=3, gaiku_count=8, chiban_count=25, seed=1):
+    """
+    住所データを生成し、SQLiteファイルのv_address_listテーブルに書き出す
+    既存のファイルは置き換える
+
+    @param path 出力先のファイルパス
+    @param cities 市町村数
+    @param ooaza_count 市町村ごとの大字数
+    @param koaza_count 大字ごとの小字数
+    @param gaiku_count 小字ごとの街区数
+    @param chiban_count 街区ごとの地番数
+    @param seed 乱数の種
+    @return 行数
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "CREATE TABLE v_address_list (city_code TEXT, ooaza_code TEXT, koaza_code TEXT, gaiku_code TEXT,"
+            " chiban TEXT, setai_name TEXT, name TEXT, kana TEXT, header TEXT, address TEXT,"
+            " honban INTEGER, edaban INTEGER, magoban INTEGER, himagoban INTEGER, yasyagoban INTEGER, kigo TEXT,"
+            " the_geom TEXT)")
+        insert = f"INSERT INTO v_address_list VALUES ({', '.join('?' * len(ADDRESS_FIELDS))})"
+        count = 0
+        batch = []
+        for values in generateRows(cities, ooaza_count, koaza_count, gaiku_count, chiban_count, seed):
+            batch.append(values)
+            if len(batch) >= BATCH_SIZE:
+                conn.executemany(insert, batch)
+                count += len(batch)
+                batch = []
+        conn.executemany(insert, batch)
+        count += len(batch)
+        # サーバーの索引に相当する索引
+        conn.execute("CREATE INDEX v_address_list_code_idx ON v_address_list (city_code, ooaza_code, koaza_code, gaiku_code)")
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能計測用の住所データ生成")
+    parser.add_argument("path", help="出力先のSQLiteファイル")
+    parser.add_argument("--cities", type=int, default=4, help="市町村数")
+    parser.add_argument("--ooaza", type=int, default=60, help="市町村ごとの大字数")
+    parser.add_argument("--koaza", type=int, default=3, help="大字ごとの小字数")
+    parser.add_argument("--gaiku", type=int, default=8, help="小字ごとの街区数")
+    parser.add_argument("--chiban", type=int, default=25, help="街区ごとの地番数")
+    parser.add_argument("--seed", type=int, default=1, help="乱数の種")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = generate(args.path, args.cities, args.ooaza, args.koaza, args.gaiku, args.chiban, args.seed)
+    print(f"{count} rows -> {args.path} ({time.perf_counter() - start:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
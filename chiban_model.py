@@ -0,0 +1,40 @@
+"""
+/***************************************************************************
+ chiban_model
+                                 A QGIS plugin
+ 地番検索結果データモデル
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+from .db_util import CHIBAN_KEY_COLUMNS
+from .result_model import PagedResultModel
+
+
+class ChibanResultModel(PagedResultModel):
+    """
+    地番検索結果をページ単位で取得するテーブルモデル
+
+    検索条件はDbUtil.getChibanPageの(市町村コード, 大字コード, 小字コード, 街区コード, 地番)。
+    続きは前ページ最終行の並び順の列の値から取得する（キーセット方式）
+    """
+    channel_prefix = "chiban"
+    page_method = "getChibanPage"
+
+    # 最終行の並び順の列の値と、その値の取得済み行数
+    last_key = None
+    last_key_count = 0
+
+    def pageArgs(self):
+        return self.last_key, self.last_key_count
+
+    def updatePosition(self, rows):
+        key_columns = [self.fieldIndex(column) for column in CHIBAN_KEY_COLUMNS]
+        for row in rows:
+            key = tuple(row[column] for column in key_columns)
+            if key == self.last_key:
+                self.last_key_count += 1
+            else:
+                self.last_key = key
+                self.last_key_count = 1
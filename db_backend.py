@@ -0,0 +1,437 @@
+"""
+/***************************************************************************
+ db_backend
+                                 A QGIS plugin
+ ローカルファイル（SQLite/GeoPackage）の検索
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+from qgis.core import QgsMessageLog
+
+
+# 出力ファイルの住所データのテーブル（DbUtilは重心座標を持つaddress_centroidを優先して検索する）
+EXPORT_TABLE = "address_centroid"
+
+# 出力ファイルの地番検索ビュー（DbUtilは地番検索キーを持つchiban_searchを優先して検索する）
+EXPORT_CHIBAN_VIEW = "chiban_search"
+
+# 出力ファイルの属性テーブル
+EXPORT_META_TABLE = "search_zmap_meta"
+
+# 出力する住所データの列（v_address_listの列）
+EXPORT_FIELDS = ["city_code", "ooaza_code", "koaza_code", "gaiku_code", "chiban", "setai_name",
+                 "name", "kana", "header", "address",
+                 "honban", "edaban", "magoban", "himagoban", "yasyagoban", "kigo"]
+
+# 出力する重心座標と外接矩形の列（サーバーのaddress_centroidと同じ列）
+EXPORT_COORDINATE_FIELDS = ["x", "y", "xmin", "ymin", "xmax", "ymax"]
+
+# 出力ファイルの形式。変更した場合は再出力が必要
+EXPORT_VERSION = "1"
+
+# GeoPackageのapplication_id（"GPKG"）とuser_version（1.3）
+GPKG_APPLICATION_ID = 0x47504B47
+GPKG_USER_VERSION = 10300
+
+NUMBER_PATTERN = re.compile(r"-?[0-9.]+")
+
+
+def stCentroid(wkt):
+    """
+    ST_Centroidの代用。WKTの頂点（閉じる点を除く）の平均をPOINTのWKTで返す
+    """
+    if wkt is None:
+        return None
+    values = [float(value) for value in NUMBER_PATTERN.findall(wkt)]
+    if len(values) > 2 and values[:2] == values[-2:]:
+        values = values[:-2]
+    count = len(values) // 2
+    if count == 0:
+        return None
+    return f"POINT({sum(values[0::2]) / count} {sum(values[1::2]) / count})"
+
+
+def stX(wkt):
+    """
+    ST_Xの代用。POINTのWKTのX座標を返す
+    """
+    if wkt is None:
+        return None
+    return float(NUMBER_PATTERN.findall(wkt)[0])
+
+
+def stY(wkt):
+    """
+    ST_Yの代用。POINTのWKTのY座標を返す
+    """
+    if wkt is None:
+        return None
+    return float(NUMBER_PATTERN.findall(wkt)[1])
+
+
+def wktBounds(wkt):
+    """
+    WKT（BOXを含む）の頂点の外接矩形を返す
+
+    @param wkt WKT
+    @return (最小X座標, 最小Y座標, 最大X座標, 最大Y座標)。頂点がない場合はNone
+    """
+    if wkt is None:
+        return None
+    values = [float(value) for value in NUMBER_PATTERN.findall(wkt)]
+    if len(values) < 2:
+        return None
+    return min(values[0::2]), min(values[1::2]), max(values[0::2]), max(values[1::2])
+
+
+def boundsFunction(position):
+    """
+    ST_XMin、ST_YMin、ST_XMax、ST_YMaxの代用の関数を作成する
+
+    @param position wktBoundsの値の位置
+    """
+    def function(wkt):
+        bounds = wktBounds(wkt)
+        return None if bounds is None else bounds[position]
+    return function
+
+
+class StExtent:
+    """
+    ST_Extentの代用の集約関数。外接矩形をBOXのWKTで返す
+    """
+    def __init__(self):
+        self.bounds = None
+
+    def step(self, wkt):
+        bounds = wktBounds(wkt)
+        if bounds is None:
+            return
+        if self.bounds is None:
+            self.bounds = bounds
+        else:
+            self.bounds = (min(self.bounds[0], bounds[0]), min(self.bounds[1], bounds[1]),
+                           max(self.bounds[2], bounds[2]), max(self.bounds[3], bounds[3]))
+
+    def finalize(self):
+        if self.bounds is None:
+            return None
+        return "BOX({} {},{} {})".format(*self.bounds)
+
+
+def hashText(value):
+    """
+    hashtextの代用。文字列の32ビットの符号付きハッシュ値を返す
+    """
+    hash_value = zlib.crc32(str(value).encode("utf-8"))
+    return hash_value - 0x100000000 if hash_value >= 0x80000000 else hash_value
+
+
+def concatWs(separator, *values):
+    """
+    CONCAT_WSの代用。NULLを除いて区切り文字で連結する
+    """
+    return str(separator).join(str(value) for value in values if value is not None)
+
+
+def registerFunctions(conn):
+    """
+    DbUtilのSQLで使用するPostGIS・PostgreSQLの関数の代用をSQLiteの接続に登録する
+    ジオメトリはWKTの文字列として扱う
+
+    @param conn SQLiteの接続
+    """
+    conn.create_function("ST_Centroid", 1, stCentroid, deterministic=True)
+    conn.create_function("ST_X", 1, stX, deterministic=True)
+    conn.create_function("ST_Y", 1, stY, deterministic=True)
+    for position, name in enumerate(("ST_XMin", "ST_YMin", "ST_XMax", "ST_YMax")):
+        conn.create_function(name, 1, boundsFunction(position), deterministic=True)
+    conn.create_aggregate("ST_Extent", 1, StExtent)
+    conn.create_function("hashtext", 1, hashText, deterministic=True)
+    conn.create_function("CONCAT_WS", -1, concatWs, deterministic=True)
+
+
+def gpkgPoint(x, y, srs_id):
+    """
+    点をGeoPackageのジオメトリ（ヘッダー＋WKB）に変換する
+
+    @param x X座標
+    @param y Y座標
+    @param srs_id 空間参照系ID
+    @return ジオメトリのバイト列。座標がない場合はNone
+    """
+    if x is None or y is None:
+        return None
+    # flags 0x01: リトルエンディアン、外接矩形なし
+    return b"GP" + struct.pack("<BBi", 0, 1, srs_id) + struct.pack("<BIdd", 1, 1, x, y)
+
+
+class SqliteBackend:
+    """
+    DbUtilの検索をローカルのSQLiteファイルで実行するクラス
+
+    ファイルはスキーマ名でATTACHするため、DbUtilが作成するSQL（{スキーマ名}.テーブル名）を
+    そのまま実行できる。DbUtil.setBackendで設定すると、DbUtilはDBサーバーの代わりに使用する
+    """
+    def __init__(self, path: str, schema_name=None):
+        """
+        @param path SQLiteファイル（exportAreaで出力したGeoPackageなど）
+        @param schema_name ATTACHするスキーマ名。省略時はファイルに記録したスキーマ名
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        if schema_name is None:
+            schema_name = SqliteBackend.fileSchemaName(path)
+        self.schema_name = schema_name
+        self.conn.execute(f"ATTACH DATABASE ? AS {schema_name}", (path,))
+        registerFunctions(self.conn)
+
+    @staticmethod
+    def fileSchemaName(path: str):
+        """
+        出力ファイルに記録したスキーマ名を取得する
+
+        @param path ファイルパス
+        @return スキーマ名。記録がない場合はファイル名
+        """
+        conn = sqlite3.connect(path)
+        try:
+            row = conn.execute(f"SELECT value FROM {EXPORT_META_TABLE} WHERE key = 'schema_name'").fetchone()
+        except sqlite3.Error:
+            row = None
+        finally:
+            conn.close()
+        if row is not None:
+            return row[0]
+        return re.sub(r"[^0-9A-Za-z_]", "_", os.path.splitext(os.path.basename(path))[0])
+
+    def databaseKey(self):
+        """
+        ファイルを識別する文字列を取得する
+        """
+        return f"local_{os.path.abspath(self.path)}"
+
+    def schemaNames(self):
+        """
+        スキーマ名のリストを取得する
+        """
+        return [self.schema_name]
+
+    def hasRelation(self, relation_name, schema_name):
+        """
+        ファイルに指定のテーブル・ビューがあるか判定する
+
+        @param relation_name テーブル・ビュー名
+        @param schema_name スキーマ名
+        @return 存在すればTrue
+        """
+        if schema_name != self.schema_name:
+            return False
+        with self.lock:
+            row = self.conn.execute(f"SELECT 1 FROM {schema_name}.sqlite_master WHERE name = ?", (relation_name,)).fetchone()
+        return row is not None
+
+    def hasColumn(self, relation_name, column_name, schema_name):
+        """
+        ファイルのテーブル・ビューに指定の列があるか判定する
+
+        @param relation_name テーブル・ビュー名
+        @param column_name 列名
+        @param schema_name スキーマ名
+        @return 存在すればTrue
+        """
+        if schema_name != self.schema_name:
+            return False
+        with self.lock:
+            rows = self.conn.execute(f"PRAGMA {schema_name}.table_info({relation_name})").fetchall()
+        return any(row[1] == column_name for row in rows)
+
+    def execute(self, sql, params=None):
+        """
+        SQLを実行する
+
+        @param sql SQL
+        @param params プレースホルダ名と値の辞書
+        @return 更新件数。エラー時はNone
+        """
+        with self.lock:
+            try:
+                cursor = self.conn.execute(sql, params or {})
+                self.conn.commit()
+                return max(cursor.rowcount, 0)
+            except sqlite3.Error as e:
+                QgsMessageLog.logMessage(f"地番検索エラー：{e}")
+                return None
+
+    def select(self, sql, params=None):
+        """
+        SQLを実行し、全行を取得する
+
+        @param sql SQL
+        @param params プレースホルダ名と値の辞書
+        @return (列名のリスト, 行のリスト)。エラー時はNone
+        """
+        with self.lock:
+            try:
+                cursor = self.conn.execute(sql, params or {})
+                rows = cursor.fetchall()
+            except sqlite3.Error as e:
+                QgsMessageLog.logMessage(f"地番検索エラー：{e}")
+                return None
+        return [description[0] for description in cursor.description], rows
+
+    def close(self):
+        """
+        ファイルを閉じる
+        """
+        with self.lock:
+            self.conn.close()
+
+
+class AreaExporter:
+    """
+    エリア（スキーマ）の住所データを1つのGeoPackageファイルに出力するクラス
+
+    住所データは重心の点ジオメトリと重心座標・外接矩形、地番検索キーを持つaddress_centroidテーブルに、
+    地番は地番検索ビュー(chiban_search)として出力し、検索に使用する列に索引を作成する。
+    出力したファイルはSqliteBackendで検索でき、QGISでは点レイヤとして表示できる
+    """
+    def __init__(self, path: str, schema_name: str, srs_id: int, srs_definition: str, chiban_key_table):
+        """
+        @param path 出力先のファイルパス（既存のファイルは置き換える）
+        @param schema_name スキーマ名
+        @param srs_id 空間参照系ID
+        @param srs_definition 空間参照系の定義（WKT）
+        @param chiban_key_table 地番検索キーの変換テーブル（DbUtil.chiban_key_table）
+        """
+        self.path = path
+        self.schema_name = schema_name
+        self.srs_id = srs_id
+        self.chiban_key_table = chiban_key_table
+        self.count = 0
+        self.extent = None
+
+        self.temp_path = path + ".tmp"
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self.conn = sqlite3.connect(self.temp_path)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(f"PRAGMA application_id={GPKG_APPLICATION_ID}")
+        self.conn.execute(f"PRAGMA user_version={GPKG_USER_VERSION}")
+        self.createTables(srs_definition)
+
+    def createTables(self, srs_definition):
+        """
+        GeoPackageの管理テーブルと住所データのテーブルを作成する
+        """
+        conn = self.conn
+        conn.execute(
+            "CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY,"
+            " organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL,"
+            " definition TEXT NOT NULL, description TEXT)")
+        srs_rows = [("Undefined cartesian SRS", -1, "NONE", -1, "undefined", None),
+                    ("Undefined geographic SRS", 0, "NONE", 0, "undefined", None)]
+        if self.srs_id not in (-1, 0):
+            srs_rows.append((f"EPSG:{self.srs_id}", self.srs_id, "EPSG", self.srs_id, srs_definition or "undefined", None))
+        conn.executemany("INSERT OR REPLACE INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)", srs_rows)
+        conn.execute(
+            "CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL,"
+            " identifier TEXT UNIQUE, description TEXT DEFAULT '',"
+            " last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),"
+            " min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER)")
+        conn.execute(
+            "CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL,"
+            " geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,"
+            " PRIMARY KEY (table_name, column_name))")
+
+        columns = ", ".join(f"{field} {'INTEGER' if field in ('honban', 'edaban', 'magoban', 'himagoban', 'yasyagoban') else 'TEXT'}"
+                            for field in EXPORT_FIELDS)
+        conn.execute(
+            f"CREATE TABLE {EXPORT_TABLE} (fid INTEGER PRIMARY KEY AUTOINCREMENT, geom POINT,"
+            f" {columns}, chiban_key TEXT, {', '.join(f'{field} DOUBLE' for field in EXPORT_COORDINATE_FIELDS)})")
+        conn.execute(f"CREATE TABLE {EXPORT_META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+
+    def addRows(self, rows):
+        """
+        住所データを追加する
+
+        @param rows EXPORT_FIELDS、EXPORT_COORDINATE_FIELDSの順の値の行のリスト
+        """
+        coordinate_count = len(EXPORT_COORDINATE_FIELDS)
+        values = []
+        for row in rows:
+            x, y = row[len(EXPORT_FIELDS)], row[len(EXPORT_FIELDS) + 1]
+            if x is not None and y is not None:
+                if self.extent is None:
+                    self.extent = [x, y, x, y]
+                else:
+                    self.extent = [min(self.extent[0], x), min(self.extent[1], y),
+                                   max(self.extent[2], x), max(self.extent[3], y)]
+            chiban = row[EXPORT_FIELDS.index("chiban")]
+            chiban_key = chiban.translate(self.chiban_key_table) if chiban else chiban
+            values.append((gpkgPoint(x, y, self.srs_id),) + tuple(row[:len(EXPORT_FIELDS)]) + (chiban_key,)
+                          + tuple(row[len(EXPORT_FIELDS):len(EXPORT_FIELDS) + coordinate_count]))
+        fields = ", ".join(EXPORT_FIELDS + ["chiban_key"] + EXPORT_COORDINATE_FIELDS)
+        placeholders = ", ".join("?" * (len(EXPORT_FIELDS) + coordinate_count + 2))
+        self.conn.executemany(f"INSERT INTO {EXPORT_TABLE} (geom, {fields}) VALUES ({placeholders})", values)
+        self.count += len(values)
+
+    def finish(self, source):
+        """
+        索引とビューを作成し、出力先のファイルに置き換える
+
+        @param source 出力元（接続先DB）を表す文字列
+        """
+        conn = self.conn
+        # 階層の絞り込み（市町村、大字、小字、街区）
+        conn.execute(f"CREATE INDEX {EXPORT_TABLE}_code_idx ON {EXPORT_TABLE} (city_code, ooaza_code, koaza_code, gaiku_code)")
+        # 座標による逆検索
+        conn.execute(f"CREATE INDEX {EXPORT_TABLE}_xy_idx ON {EXPORT_TABLE} (x, y)")
+        # 市町村の一覧（ooaza_code = ''の行のみの部分索引）
+        conn.execute(f"CREATE INDEX {EXPORT_TABLE}_city_idx ON {EXPORT_TABLE} (city_code) WHERE ooaza_code = ''")
+        # 大字内の地番順の並べ替え（sql/prepare_chiban_search.sqlのchiban_search_order_idxと同じ式）
+        conn.execute(f"CREATE INDEX {EXPORT_TABLE}_chiban_idx ON {EXPORT_TABLE}"
+                     " (city_code, ooaza_code, COALESCE(honban, -1), COALESCE(edaban, -1), COALESCE(magoban, -1),"
+                     " COALESCE(himagoban, -1), COALESCE(yasyagoban, -1), COALESCE(kigo, ''), COALESCE(address, ''))")
+        conn.execute(
+            f"CREATE VIEW {EXPORT_CHIBAN_VIEW} AS SELECT city_code, ooaza_code, koaza_code, gaiku_code, address, chiban,"
+            f" honban, edaban, magoban, himagoban, yasyagoban, kigo, chiban_key,"
+            f" {', '.join(EXPORT_COORDINATE_FIELDS)} FROM {EXPORT_TABLE} WHERE chiban != ''")
+
+        extent = self.extent or [None, None, None, None]
+        conn.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, min_x, min_y, max_x, max_y, srs_id)"
+                     " VALUES (?, 'features', ?, ?, ?, ?, ?, ?)", (EXPORT_TABLE, self.schema_name, *extent, self.srs_id))
+        conn.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', 'POINT', ?, 0, 0)", (EXPORT_TABLE, self.srs_id))
+        conn.executemany(f"INSERT INTO {EXPORT_META_TABLE} VALUES (?, ?)", [
+            ("schema_name", self.schema_name),
+            ("source", source),
+            ("exported_at", time.strftime("%Y-%m-%dT%H:%M:%S")),
+            ("version", EXPORT_VERSION),
+            ("rows", str(self.count)),
+        ])
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        """
+        出力を中止し、作成中のファイルを削除する
+        """
+        self.conn.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
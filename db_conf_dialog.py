@@ -79,6 +79,52 @@ class DbConfDialog(QDialog, FORM_CLASS):
 
         return super().accept()
 
+    @staticmethod
+    def connectionSettings() -> dict:
+        """
+        設定ファイルよりDB接続情報を取得する
+
+        @return host_name, database_name, user_name, passwordの辞書
+        """
+        settings = QSettings(os.path.join(os.path.dirname(__file__), "conf.ini"), QSettings.IniFormat)
+        settings.beginGroup("DB")
+        params = {
+            "host_name": settings.value("host_name", ""),
+            "database_name": settings.value("database_name", ""),
+            "user_name": settings.value("user_name", ""),
+            "password": settings.value("password", ""),
+        }
+        settings.endGroup()
+        return params
+
+    @staticmethod
+    def hasConnectionSettings(params: dict) -> bool:
+        """
+        DB接続情報がすべて設定されているか判定する
+
+        @param params DB接続情報
+        """
+        return all(len(params.get(key, "")) > 0 for key in ("host_name", "database_name", "user_name", "password"))
+
+    @staticmethod
+    def addDatabase(params: dict, connection_name: str = None) -> QSqlDatabase:
+        """
+        DB接続情報を設定したDB接続を作成する（接続は行わない）
+
+        @param params DB接続情報
+        @param connection_name 接続名。省略時は既定の接続
+        @return DB接続
+        """
+        if connection_name is None:
+            db = QSqlDatabase.addDatabase("QPSQL")
+        else:
+            db = QSqlDatabase.addDatabase("QPSQL", connection_name)
+        db.setHostName(params["host_name"])
+        db.setDatabaseName(params["database_name"])
+        db.setUserName(params["user_name"])
+        db.setPassword(params["password"])
+        return db
+
 
     def connectDB(self, iface = None) -> bool:
         """
@@ -90,13 +136,11 @@ class DbConfDialog(QDialog, FORM_CLASS):
         """
 
         # 設定ファイルより接続情報を取得
-        settings = QSettings(os.path.join(os.path.dirname(__file__), "conf.ini"), QSettings.IniFormat)
-        settings.beginGroup("DB")
-        host_name = settings.value("host_name", "")
-        database_name = settings.value("database_name", "")
-        user_name = settings.value("user_name", "")
-        password = settings.value("password", "")
-        settings.endGroup()
+        params = self.connectionSettings()
+        host_name = params["host_name"]
+        database_name = params["database_name"]
+        user_name = params["user_name"]
+        password = params["password"]
 
         success = False
 
@@ -121,11 +165,7 @@ class DbConfDialog(QDialog, FORM_CLASS):
 
         # データベース名、ユーザー名、パスワードが揃っていればDB接続
         if len(host_name) > 0 and len(database_name) > 0 and len(user_name) > 0 and len(password) > 0:
-            db = QSqlDatabase.addDatabase("QPSQL")
-            db.setHostName(host_name)
-            db.setDatabaseName(database_name)
-            db.setUserName(user_name)
-            db.setPassword(password)
+            db = self.addDatabase({"host_name": host_name, "database_name": database_name, "user_name": user_name, "password": password})
 
             QgsApplication.setOverrideCursor(Qt.WaitCursor)
             if iface is not None:
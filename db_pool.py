@@ -0,0 +1,224 @@
+"""
+/***************************************************************************
+ db_pool
+                                 A QGIS plugin
+ DB接続プール
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import itertools
+import threading
+import time
+
+from qgis.PyQt.QtSql import QSqlDatabase, QSqlQuery
+
+from qgis.core import QgsMessageLog
+
+
+# 接続名の連番（QSqlDatabaseの接続名はプロセス全体で共有されるため、プールごとではなくモジュールで採番する）
+CONNECTION_SEQUENCE = itertools.count(1)
+
+
+class PooledConnection:
+    """
+    接続プールが管理する名前付きDB接続
+    """
+    def __init__(self, connection_name: str):
+        """
+        @param connection_name 接続名
+        """
+        self.connection_name = connection_name
+        # サーバープロセスID（キャンセル用）
+        self.backend_pid = None
+        self.last_used = time.time()
+        self.last_checked = 0
+
+    def database(self):
+        """
+        DB接続を取得する
+        """
+        return QSqlDatabase.database(self.connection_name, False)
+
+    def isOpen(self):
+        """
+        接続済みか判定する
+        """
+        db = self.database()
+        return db.isValid() and db.isOpen()
+
+
+class ConnectionPool:
+    """
+    スレッドごとの名前付きDB接続を管理するクラス
+
+    接続は各スレッドの初回の取得時に作成し、以降は同じスレッドで使い回す。
+    QSqlDatabaseの接続は作成したスレッドでのみ使用できるため、接続の作成・確認・破棄は
+    その接続を使用するスレッドで行う。同時に存在できる接続数はmax_sizeまでとし、
+    上限に達している場合は他のスレッドが接続を返却するまで待つ
+    """
+    def __init__(self, max_size=5, idle_timeout=300, check_interval=60, on_close=None, retry_count=3):
+        """
+        @param max_size 最大接続数
+        @param idle_timeout この秒数使用されなかった接続は破棄する
+        @param check_interval この秒数以上使用されなかった接続は使用前に接続を確認する
+        @param on_close 接続を閉じる前に接続名を引数に呼び出す関数
+        @param retry_count 接続に失敗した場合に再試行する回数（間隔は1秒から倍にしていく）
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.on_close = on_close
+        self.retry_count = retry_count
+        # 接続情報（host_name, database_name, user_name, password）。Noneの場合は既定の接続と同じ接続先
+        self.parameters = None
+
+        self.condition = threading.Condition()
+        # スレッドID -> 接続
+        self.connections = {}
+
+    def acquire(self, timeout=30):
+        """
+        現在のスレッドの接続を取得する（未作成の場合は作成する）
+
+        @param timeout 接続数が上限の場合に待つ秒数
+        @return 接続。接続できない場合はNone
+        """
+        ident = threading.get_ident()
+        with self.condition:
+            connection = self.connections.get(ident)
+            if connection is None:
+                if not self.condition.wait_for(lambda: len(self.connections) < self.max_size, timeout):
+                    QgsMessageLog.logMessage(f"住宅地図検索:DB接続数が上限({self.max_size})のため接続できません")
+                    return None
+                connection = PooledConnection(f"search_zmap_pool_{next(CONNECTION_SEQUENCE)}")
+                self.connections[ident] = connection
+
+        if connection.isOpen() and time.time() - connection.last_used >= self.check_interval:
+            # しばらく使用していない接続は切断されていないか確認する
+            if not self.check(connection):
+                QgsMessageLog.logMessage(f"住宅地図検索:DB接続を再接続します {connection.connection_name}")
+                self.close(connection)
+
+        if not connection.isOpen() and not self.open(connection):
+            self.release()
+            return None
+
+        connection.last_used = time.time()
+        return connection
+
+    def release(self):
+        """
+        現在のスレッドの接続を閉じて返却する
+        """
+        ident = threading.get_ident()
+        with self.condition:
+            connection = self.connections.get(ident)
+        if connection is None:
+            return
+
+        self.close(connection)
+        QSqlDatabase.removeDatabase(connection.connection_name)
+        with self.condition:
+            self.connections.pop(ident, None)
+            self.condition.notify_all()
+
+    def evictIdle(self):
+        """
+        現在のスレッドの接続がidle_timeout秒以上使用されていなければ返却する
+
+        @return 返却した場合はTrue
+        """
+        with self.condition:
+            connection = self.connections.get(threading.get_ident())
+        if connection is None or time.time() - connection.last_used < self.idle_timeout:
+            return False
+        self.release()
+        return True
+
+    def setParameters(self, parameters: dict):
+        """
+        接続情報を設定する
+        既定の接続がなくても接続できるようにする（起動時の事前接続用）
+
+        @param parameters host_name, database_name, user_name, passwordの辞書
+        """
+        self.parameters = dict(parameters)
+
+    def open(self, connection: PooledConnection):
+        """
+        接続情報（未設定の場合は既定の接続と同じ接続先）に接続する
+        失敗した場合は間隔を空けて再試行する
+
+        @param connection 接続
+        @return 接続に成功すればTrue
+        """
+        if QSqlDatabase.contains(connection.connection_name):
+            db = QSqlDatabase.database(connection.connection_name, False)
+        elif self.parameters is not None:
+            db = QSqlDatabase.addDatabase("QPSQL", connection.connection_name)
+            db.setHostName(self.parameters["host_name"])
+            db.setDatabaseName(self.parameters["database_name"])
+            db.setUserName(self.parameters["user_name"])
+            db.setPassword(self.parameters["password"])
+        else:
+            default_db = QSqlDatabase.database(QSqlDatabase.defaultConnection, False)
+            if not default_db.isValid():
+                return False
+            db = QSqlDatabase.addDatabase(default_db.driverName(), connection.connection_name)
+            db.setHostName(default_db.hostName())
+            db.setPort(default_db.port())
+            db.setDatabaseName(default_db.databaseName())
+            db.setUserName(default_db.userName())
+            db.setPassword(default_db.password())
+            db.setConnectOptions(default_db.connectOptions())
+
+        delay = 1
+        for attempt in range(self.retry_count + 1):
+            if db.open():
+                break
+            QgsMessageLog.logMessage(f"住宅地図検索:DB接続に失敗しました {db.lastError().text()}")
+            if attempt == self.retry_count:
+                return False
+            time.sleep(delay)
+            delay *= 2
+
+        query = QSqlQuery(db)
+        if query.exec("SELECT pg_backend_pid()") and query.next():
+            connection.backend_pid = query.value(0)
+        connection.last_checked = time.time()
+        return True
+
+    def check(self, connection: PooledConnection):
+        """
+        接続が使用できるか確認する
+
+        @param connection 接続
+        @return 使用できればTrue
+        """
+        query = QSqlQuery(connection.database())
+        success = query.exec("SELECT 1") and query.next()
+        query.finish()
+        connection.last_checked = time.time()
+        return success
+
+    def close(self, connection: PooledConnection):
+        """
+        接続を閉じる
+
+        @param connection 接続
+        """
+        if self.on_close is not None:
+            self.on_close(connection.connection_name)
+        connection.backend_pid = None
+        db = connection.database()
+        if db.isValid() and db.isOpen():
+            db.close()
+
+    def size(self):
+        """
+        現在の接続数
+        """
+        with self.condition:
+            return len(self.connections)
@@ -8,21 +8,945 @@
  ***************************************************************************/
 
 """
-from qgis.PyQt.QtSql import QSqlQuery, QSqlQueryModel
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from qgis.PyQt.QtCore import QSettings, QVariant
+from qgis.PyQt.QtSql import QSqlDatabase, QSqlQuery
 
-from qgis.core import QgsMessageLog
+from qgis.core import QgsApplication, QgsMessageLog
+
+from .address_parser import AddressSearch, kanjiNumerals
+from .address_tree import AddressTree
+from .batch_geocoder import BatchGeocoder, CHIBAN_BATCH_SIZES
+from .db_backend import AreaExporter, EXPORT_FIELDS
+from .db_pool import ConnectionPool
+from .fuzzy_matcher import FuzzyNameIndex
+from .hierarchy_snapshot import HierarchySnapshot, HIERARCHY_CONDITION, CHIBAN_GAIKU_CONDITION
+from .kana_index import kanaInitial
+from .name_cache import NameCache
+from .query_stats import QueryStats
+from .result_model import ResultTableModel
 
 
-REPLACE_INITIAL_WORDS = ", REPLACE(LEFT(kana,1), 'がぎぐげござじずぜぞだぢっづでどばぱびぴぶぷべぺぼぽ', 'かきくけこさしすせそたちつつてとははひひふふへへほほ') AS initial"
+# 地番検索キーで「‐」に統一するハイフン類（sql/prepare_chiban_search.sqlのTRANSLATEと同じ）
+CHIBAN_HYPHENS = "－−ー―‑"
+# 全角変換でハイフンマイナスとみなす文字
+NARROW_HYPHENS = "‒–—﹣ｰ"
+
+# ランドマーク検索でひらがなに揃えるカタカナ（sql/prepare_landmark_search.sqlのTRANSLATEと同じ）
+KATAKANA = "".join(chr(code) for code in range(0x30A1, 0x30F7))
+HIRAGANA = "".join(chr(code - 0x60) for code in range(0x30A1, 0x30F7))
+# ふりがなとして検索する入力（ひらがな・カタカナ・長音記号のみ）
+KANA_INPUT_PATTERN = re.compile(r"[\u3041-\u3096\u30A1-\u30F6ー]+")
+
+# ランドマーク検索結果の列（地番検索の結果と同じく2・3列目に座標）
+LANDMARK_FIELDS = ["name", "category", "x", "y", "kana", "address", "city_code"]
+
+# 地番検索結果の並び順の列（ページ取得のキーを兼ねるため住所を加える。同じ値の行は件数で読み飛ばす）
+CHIBAN_ORDER_FIELDS = ["honban", "edaban", "magoban", "himagoban", "yasyagoban", "kigo", "address"]
+# 並び順の列の式（NULLの枝番などは行値の比較がNULLになり行が抜けるため、先頭に並ぶ値に置き換える。
+# sql/prepare_chiban_search.sqlのchiban_search_order_idxと同じ式）
+CHIBAN_ORDER_KEYS = ["COALESCE(honban, -1)", "COALESCE(edaban, -1)", "COALESCE(magoban, -1)", "COALESCE(himagoban, -1)",
+                     "COALESCE(yasyagoban, -1)", "COALESCE(kigo, '')", "COALESCE(address, '')"]
+# 地番検索結果のページ取得のキーの列名（元の列と区別するため別名とする）
+CHIBAN_KEY_COLUMNS = [f"order_{field}" for field in CHIBAN_ORDER_FIELDS]
+
+# ローカルファイルの出力時に一度に書き込む行数
+EXPORT_BATCH_SIZE = 10000
+
+# 検索の記録でメソッド名の取得時に読み飛ばすSQL実行用のメソッド
+QUERY_HELPERS = {"execQuery", "recordQuery", "selectModel", "selectValue"}
+
+# スレッドごとのDB接続名・スキーマ名
+_thread_local = threading.local()
+
+
+def setThreadConnectionName(connection_name):
+    """
+    現在のスレッドでDbUtilが使用するDB接続名を設定する
+
+    @param connection_name 接続名。Noneの場合はデフォルト接続を使用する
+    """
+    _thread_local.connection_name = connection_name
+
+
+def threadConnectionName():
+    """
+    現在のスレッドでDbUtilが使用するDB接続名を取得する
+
+    @return 接続名。デフォルト接続の場合はQSqlDatabase.defaultConnection
+    """
+    name = getattr(_thread_local, "connection_name", None)
+    if name is None:
+        return QSqlDatabase.defaultConnection
+    return name
+
+
+def setThreadSchemaName(schema_name):
+    """
+    現在のスレッドでDbUtilが使用するスキーマ名を設定する
+    ワーカーは要求時のスキーマ名を設定し、検索中にエリアが変更されても要求時のスキーマを検索する
+
+    @param schema_name スキーマ名。Noneの場合はDbUtil.setSchemaで設定したスキーマを使用する
+    """
+    _thread_local.schema_name = schema_name
+
+
+def confSettings():
+    """
+    プラグインの設定ファイル(conf.ini)を取得する
+
+    @return 設定
+    """
+    return QSettings(os.path.join(os.path.dirname(__file__), "conf.ini"), QSettings.IniFormat)
+
+
+def plainValue(value):
+    """
+    DBから取得した値をPythonの値に変換する
+
+    @param value 値
+    @return NULLの場合はNone、それ以外はPythonの値
+    """
+    if isinstance(value, QVariant):
+        return None if value.isNull() else value.value()
+    return value
+
+
+def valueSize(rows):
+    """
+    検索結果の転送量を概算する
+
+    @param rows 行のリスト
+    @return 値をUTF-8の文字列としたときのバイト数の合計
+    """
+    size = 0
+    for row in rows:
+        for value in row:
+            if value is not None:
+                size += len(value) if isinstance(value, (bytes, bytearray)) else len(str(value).encode("utf-8"))
+    return size
+
 
 class DbUtil:
+    @property
+    def schema_name(self):
+        """
+        検索するスキーマ名（setThreadSchemaNameで設定したスレッドではそのスキーマ名）
+        """
+        schema_name = getattr(_thread_local, "schema_name", None)
+        return self.current_schema_name if schema_name is None else schema_name
+
+    @schema_name.setter
+    def schema_name(self, schema_name):
+        self.current_schema_name = schema_name
+
     def __init__(self):
         self.schema_name = "public"
 
-        # 半角->全角変換
-        narrows = "".join(chr(0x21 + i) for i in range(94))
-        wides = "".join(chr(0xff01 + i) for i in range(94))
+        # 階層スナップショットの設定
+        settings = confSettings()
+        settings.beginGroup("CACHE")
+        self.use_snapshot = settings.value("snapshot", True, type=bool)
+        self.snapshot_interval = settings.value("snapshot_revalidate_interval", 600, type=int)
+        self.prefetch_city = settings.value("prefetch_city", True, type=bool)
+        self.city_tree_count = settings.value("city_tree_count", 8, type=int)
+        # 階層データ・スナップショットの作成を別のスレッド（先読み用のワーカー）で行う場合はTrue。
+        # Trueの場合、字リストの検索は作成済みのもののみ使用し、なければDBを直接検索する
+        self.background_prefetch = False
+        name_cache_size = settings.value("name_cache_size", 4096, type=int)
+        settings.endGroup()
+        settings.beginGroup("POOL")
+        pool_size = settings.value("size", 5, type=int)
+        pool_idle_timeout = settings.value("idle_timeout", 300, type=int)
+        pool_check_interval = settings.value("check_interval", 60, type=int)
+        settings.endGroup()
+        settings.beginGroup("STATS")
+        self.query_stats = QueryStats(settings.value("enabled", True, type=bool),
+                                      settings.value("slow_query_ms", 500, type=int),
+                                      settings.value("window", 500, type=int),
+                                      settings.value("trace_file", "", type=str))
+        settings.endGroup()
+        # スキーマ名 -> 階層スナップショット
+        self.snapshots = {}
+        self.snapshot_lock = threading.Lock()
+        # (スキーマ名, 市町村コード) -> 市町村配下の階層データ（古いものから破棄する）
+        self.city_trees = OrderedDict()
+        self.city_tree_lock = threading.Lock()
+        # 市町村・大字・小字名（階層データの検索結果からも登録する）
+        self.name_cache = NameCache(name_cache_size)
+
+        # (接続名, SQL) -> 準備済みクエリ
+        # SQLにスキーマ名を含むため、スキーマごと・クエリ形状ごとに1つ準備する
+        self.prepared_queries = {}
+
+        # 取得済みのスキーマ名（起動時の事前接続で取得した場合はエリア一覧の作成に使用する）
+        self.schema_names = None
+
+        # 既定の接続が切断された場合の再接続の時刻と間隔（秒）
+        self.reconnect_at = 0
+        self.reconnect_delay = 1
+
+        # バックグラウンドスレッド用のDB接続プール（GUIスレッドは既定の接続を使用する）
+        self.pool = ConnectionPool(pool_size, pool_idle_timeout, pool_check_interval, self.clearPreparedQueries)
+
+        # (スキーマ名, テーブル名) -> 存在有無
+        self.relation_cache = {}
+        # スキーマ名 -> v_address_listのジオメトリの空間参照系ID
+        self.srid_cache = {}
+
+        # ローカルファイルの検索（SqliteBackendなど）。Noneの場合はDBサーバーを検索する
+        self.backend = None
+
+        # スキーマ名 -> 住所の自由入力検索（照合した階層の名称を保持する）
+        self.address_searches = {}
+        # スキーマ名 -> 名称のあいまい検索の索引
+        self.fuzzy_indexes = {}
+
+        # 半角->全角変換（ハイフン類は全角のハイフンマイナスに揃える）
+        narrows = "".join(chr(0x21 + i) for i in range(94)) + NARROW_HYPHENS
+        wides = "".join(chr(0xff01 + i) for i in range(94)) + "－" * len(NARROW_HYPHENS)
         self.narrow_to_wide = str.maketrans(narrows, wides)
+        # 地番検索キーの正規化
+        self.chiban_key_table = str.maketrans(CHIBAN_HYPHENS, "‐" * len(CHIBAN_HYPHENS))
+
+    def database(self):
+        """
+        現在のスレッドで使用するDB接続を取得する
+
+        既定の接続が切断されていれば再接続する
+
+        @return DB接続
+        """
+        connection_name = threadConnectionName()
+        db = QSqlDatabase.database(connection_name, False)
+        if connection_name == QSqlDatabase.defaultConnection and db.isValid() and not db.isOpen():
+            self.reconnect(db)
+        return db
+
+    def setBackend(self, backend):
+        """
+        検索先をローカルファイルまたはDBサーバーに切り替える
+        切り替え前の検索先のデータを使用しないよう、保持しているデータを破棄する
+
+        @param backend ローカルファイルの検索（SqliteBackendなど）。Noneの場合はDBサーバー
+        """
+        if self.backend is not None:
+            self.backend.close()
+        self.backend = backend
+        self.schema_names = None if backend is None else backend.schemaNames()
+        self.clearRelationCache()
+        with self.city_tree_lock:
+            self.city_trees.clear()
+        with self.snapshot_lock:
+            for snapshot in self.snapshots.values():
+                snapshot.close()
+            self.snapshots.clear()
+        self.name_cache.clear()
+        self.address_searches.clear()
+        self.fuzzy_indexes.clear()
+
+    def reconnect(self, db):
+        """
+        切断された既定の接続に再接続する
+        失敗した場合は間隔を倍にしながら（最大60秒）、次の検索時に再試行する
+
+        @param db 既定の接続
+        @return 接続に成功すればTrue
+        """
+        now = time.time()
+        if now < self.reconnect_at:
+            return False
+        if db.open():
+            QgsMessageLog.logMessage("住宅地図検索:DBに再接続しました")
+            self.reconnect_at = 0
+            self.reconnect_delay = 1
+            return True
+        QgsMessageLog.logMessage(f"住宅地図検索:DBへの再接続に失敗しました {db.lastError().text()}")
+        self.reconnect_at = now + self.reconnect_delay
+        self.reconnect_delay = min(self.reconnect_delay * 2, 60)
+        return False
+
+    def checkConnection(self):
+        """
+        検索エラー時に接続を確認し、切断されていれば接続を閉じる
+        閉じた接続は次の検索時に再接続する（既定の接続はdatabase、プールの接続はConnectionPool.acquire）
+        """
+        db = QSqlDatabase.database(threadConnectionName(), False)
+        if not db.isValid() or not db.isOpen():
+            return
+        query = QSqlQuery(db)
+        if query.exec("SELECT 1") and query.next():
+            return
+        query = None
+        QgsMessageLog.logMessage("住宅地図検索:DB接続が切断されました")
+        self.clearPreparedQueries()
+        db.close()
+
+    def preparedQuery(self, sql):
+        """
+        現在のスレッドの接続で準備済みのクエリを取得する
+        未準備の場合は準備して保持する
+
+        @param sql プレースホルダ(:name)を含むSQL
+        @return 準備済みクエリ。エラー時はNone
+        """
+        key = (threadConnectionName(), sql)
+        query = self.prepared_queries.get(key)
+        if query is None:
+            query = QSqlQuery(self.database())
+            query.setForwardOnly(True)
+            if not query.prepare(sql):
+                QgsMessageLog.logMessage(f"地番検索エラー：{query.lastError().text()}")
+                return None
+            self.prepared_queries[key] = query
+        return query
+
+    def clearPreparedQueries(self, connection_name=None):
+        """
+        準備済みクエリを破棄する
+        接続を閉じる前に呼び出す
+
+        @param connection_name 接続名。省略時は現在のスレッドの接続
+        """
+        if connection_name is None:
+            connection_name = threadConnectionName()
+        for key in list(self.prepared_queries):
+            if key[0] == connection_name:
+                self.prepared_queries.pop(key, None)
+
+    def execQuery(self, sql, params=None):
+        """
+        SQLを実行する
+        パラメータを指定した場合は準備済みクエリに値をバインドして実行する
+        SELECT以外の実行は処理時間と更新件数を記録する（SELECTはselectModel、selectValueで記録する）
+
+        @param sql SQL
+        @param params プレースホルダ名と値の辞書
+        @return 実行済みのクエリ（ローカルファイルの場合は更新件数）。エラー時はNone
+        """
+        started = time.perf_counter()
+        # 前の検索の実行時間を使用しないよう破棄する（ローカルファイルの検索は全体の時間を記録する）
+        _thread_local.exec_ms = None
+        if self.backend is not None:
+            rows = self.backend.execute(sql, params)
+            if rows is not None:
+                self.recordQuery(sql, params, started, rows, 0)
+            return rows
+
+        if params is None:
+            query = QSqlQuery(self.database())
+            query.setForwardOnly(True)
+            if not query.exec(sql):
+                QgsMessageLog.logMessage(f"地番検索エラー：{query.lastError().text()}")
+                self.checkConnection()
+                return None
+        else:
+            query = self.preparedQuery(sql)
+            if query is None:
+                return None
+            for name, value in params.items():
+                query.bindValue(f":{name}", value)
+            if not query.exec():
+                QgsMessageLog.logMessage(f"地番検索エラー：{query.lastError().text()}")
+                query.finish()
+                self.checkConnection()
+                return None
+
+        # QtSqlではサーバーでの処理時間を取得できないため、exec（実行と結果の受信）の時間で代用する
+        _thread_local.exec_ms = (time.perf_counter() - started) * 1000
+        if not query.isSelect():
+            self.recordQuery(sql, params, started, max(query.numRowsAffected(), 0), 0)
+        return query
+
+    def recordQuery(self, sql, params, started, rows, size):
+        """
+        検索の処理時間、件数、転送量を記録する
+        メソッド名は呼び出し履歴のうちSQL実行用のメソッドを除いた直近のメソッドとする
+
+        @param sql SQL
+        @param params プレースホルダ名と値の辞書
+        @param started 開始時刻（time.perf_counter）
+        @param rows 件数
+        @param size 転送量の概算（バイト）
+        """
+        if not self.query_stats.enabled:
+            return
+        wall_ms = (time.perf_counter() - started) * 1000
+        frame = sys._getframe(1)
+        while frame is not None and frame.f_code.co_name in QUERY_HELPERS:
+            frame = frame.f_back
+        method = frame.f_code.co_name if frame is not None else ""
+        exec_ms = getattr(_thread_local, "exec_ms", None)
+        self.query_stats.record(method, self.schema_name, sql, params, wall_ms,
+                                wall_ms if exec_ms is None else exec_ms, rows, size)
+
+    def queryStats(self):
+        """
+        検索の記録を取得する
+
+        @return QueryStats
+        """
+        return self.query_stats
+
+    def selectModel(self, sql, params=None):
+        """
+        SQLを実行し、結果をデータモデルとして取得する
+        全行を読み込むため、返却したモデルは別スレッドでも使用できる
+
+        @param sql SQL
+        @param params プレースホルダ名と値の辞書
+        @return データモデル。エラー時はNone
+        """
+        started = time.perf_counter()
+        # 前の検索の実行時間を使用しないよう破棄する（ローカルファイルの検索は全体の時間を記録する）
+        _thread_local.exec_ms = None
+        if self.backend is not None:
+            result = self.backend.select(sql, params)
+            if result is None:
+                return None
+            fields, rows = result
+        else:
+            query = self.execQuery(sql, params)
+            if query is None:
+                return None
+
+            record = query.record()
+            fields = [record.fieldName(i) for i in range(record.count())]
+            rows = []
+            while query.next():
+                rows.append(tuple(plainValue(query.value(i)) for i in range(len(fields))))
+            query.finish()
+        if self.query_stats.enabled:
+            self.recordQuery(sql, params, started, len(rows), valueSize(rows))
+        return ResultTableModel(fields, rows)
+
+    def selectValue(self, sql, params=None):
+        """
+        SQLを実行し、先頭行の先頭列の値を取得する
+
+        @param sql SQL
+        @param params プレースホルダ名と値の辞書
+        @return 値。該当なしの場合はNone
+        """
+        started = time.perf_counter()
+        # 前の検索の実行時間を使用しないよう破棄する（ローカルファイルの検索は全体の時間を記録する）
+        _thread_local.exec_ms = None
+        value = None
+        rows = 0
+        if self.backend is not None:
+            result = self.backend.select(sql, params)
+            if result is None:
+                return None
+            if len(result[1]) > 0:
+                value = result[1][0][0]
+                rows = 1
+        else:
+            query = self.execQuery(sql, params)
+            if query is None:
+                return None
+            if query.next():
+                value = plainValue(query.value(0))
+                rows = 1
+            query.finish()
+        if self.query_stats.enabled:
+            self.recordQuery(sql, params, started, rows, valueSize([(value,)] if rows else []))
+        return value
+
+    def databaseKey(self):
+        """
+        接続先DBを識別する文字列を取得する
+
+        @return ホスト名、ポート、DB名を連結した文字列
+        """
+        if self.backend is not None:
+            return self.backend.databaseKey()
+        db = self.database()
+        return f"{db.hostName()}_{db.port()}_{db.databaseName()}"
+
+    def snapshotDir(self):
+        """
+        階層スナップショットの保存先ディレクトリを取得する
+        """
+        return os.path.join(QgsApplication.qgisSettingsDirPath(), "search_zmap", "snapshot")
+
+    def prepareSnapshot(self, schema_name=None):
+        """
+        現在のスキーマの階層スナップショットを準備する
+
+        未作成の場合や、サーバーの署名と一致しない場合はサーバーから作成する
+        サーバーとの整合確認はsnapshot_revalidate_intervalの間隔で行う
+
+        @param schema_name スキーマ名。省略時は現在のスキーマ
+        @return 使用できるスナップショット。使用しない場合はNone
+        """
+        if not self.use_snapshot:
+            return None
+
+        if schema_name is None:
+            schema_name = self.schema_name
+        with self.snapshot_lock:
+            snapshot = self.snapshots.get(schema_name)
+            if snapshot is None:
+                path = HierarchySnapshot.snapshotPath(self.snapshotDir(), self.databaseKey(), schema_name)
+                snapshot = HierarchySnapshot(path)
+                self.snapshots[schema_name] = snapshot
+
+            if snapshot.open() and not snapshot.needsValidation(self.snapshot_interval):
+                return snapshot
+
+            signature = self.getHierarchySignature(schema_name)
+            if signature is None:
+                # サーバーで確認できない場合は作成済みのものを使用する
+                return snapshot if snapshot.isOpen() else None
+
+            if snapshot.isOpen() and snapshot.signature() == signature:
+                snapshot.setValidated()
+                return snapshot
+
+            # 更新の署名が変わっても（階層以外の行の更新、統計のリセットなど）、階層データが同じであれば作成し直さない
+            content_hash = signature if self.backend is not None else self.getHierarchyHash(schema_name)
+            if snapshot.isOpen() and content_hash is not None and snapshot.contentHash() == content_hash:
+                snapshot.setSignature(signature)
+                return snapshot
+
+            rows = self.getHierarchyRows(schema_name)
+            if rows is None:
+                return snapshot if snapshot.isOpen() else None
+            snapshot.build(rows, signature, content_hash)
+            self.clearCityTrees(schema_name)
+            self.name_cache.clear()
+            self.address_searches.pop(schema_name, None)
+            self.fuzzy_indexes.pop(schema_name, None)
+            QgsMessageLog.logMessage(f"住宅地図検索:{schema_name}の階層スナップショットを作成しました（{len(rows)}件）")
+            return snapshot
+
+    def readySnapshot(self):
+        """
+        作成済みの階層スナップショットを取得する
+        サーバーへの問い合わせは行わない
+
+        @return 使用できるスナップショット。未作成の場合はNone
+        """
+        if not self.use_snapshot:
+            return None
+        snapshot = self.snapshots.get(self.schema_name)
+        if snapshot is None or not snapshot.isOpen():
+            return None
+        return snapshot
+
+    def lookupSnapshot(self):
+        """
+        字リストの検索に使用する階層スナップショットを取得する
+        作成を別のスレッドで行う場合は作成済みのもののみ使用する
+
+        @return 使用できるスナップショット。使用しない場合や未作成の場合はNone
+        """
+        if self.background_prefetch:
+            return self.readySnapshot()
+        return self.prepareSnapshot()
+
+    def getHierarchySignature(self, schema_name):
+        """
+        階層データの更新の署名を取得する（スナップショットの整合確認用）
+        住所データの検索元とその元のテーブルの、ファイル番号と追加・更新・削除の累計行数(pg_stat_user_tables)から作成する。
+        住所データを読まないため、データ量によらず短時間で確認できる。
+        ローカルファイルは統計がないため、階層データのハッシュを署名とする
+
+        @param schema_name スキーマ名
+        @return 署名。エラー時はNone
+        """
+        if self.backend is not None:
+            return self.getHierarchyHash(schema_name)
+
+        sql = []
+        sql.append("WITH RECURSIVE sources(oid) AS (")
+        sql.append("SELECT CAST(to_regclass(:name) AS oid)")
+        # ビュー・マテリアライズドビューは定義（pg_rewrite）が参照するテーブルをたどる
+        sql.append("UNION SELECT d.refobjid FROM sources")
+        sql.append("JOIN pg_rewrite r ON r.ev_class = sources.oid")
+        sql.append("JOIN pg_depend d ON d.objid = r.oid AND d.classid = CAST('pg_rewrite' AS regclass)")
+        sql.append("AND d.refclassid = CAST('pg_class' AS regclass) AND d.refobjid <> sources.oid)")
+        sql.append("SELECT string_agg(c.oid || '.' || c.relfilenode || '.'")
+        sql.append("|| COALESCE(s.n_tup_ins + s.n_tup_upd + s.n_tup_del, 0), ',' ORDER BY c.oid)")
+        sql.append("FROM sources JOIN pg_class c ON c.oid = sources.oid")
+        sql.append("LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid")
+        sql.append("WHERE c.relkind IN ('r', 'm', 'p')")
+        value = self.selectValue(" ".join(sql), {"name": self.addressSource(schema_name)[0]})
+        if value is None:
+            return None
+        return str(value)
+
+    def getHierarchyHash(self, schema_name):
+        """
+        階層データのハッシュを取得する
+        階層データの行をすべて読むため、更新の署名が変わった場合（スナップショットの作成前）のみ使用する
+
+        @param schema_name スキーマ名
+        @return ハッシュ。エラー時はNone
+        """
+        table = self.addressSource(schema_name)[0]
+        sql = []
+        sql.append("SELECT COUNT(*) || ':' || COALESCE(SUM(hashtext(CONCAT_WS('|', city_code, ooaza_code, koaza_code, gaiku_code, name, kana, header))), 0)")
+        # 地番の行のみにある街区も階層データに含めるため、地番の行の街区コードも加える
+        sql.append("|| ':' || (SELECT COALESCE(SUM(hashtext(CONCAT_WS('|', city_code, ooaza_code, koaza_code, gaiku_code))), 0)")
+        sql.append(f"FROM (SELECT DISTINCT city_code, ooaza_code, koaza_code, gaiku_code FROM {table} WHERE {CHIBAN_GAIKU_CONDITION}) g)")
+        sql.append(f"FROM {table}")
+        sql.append(f"WHERE {HIERARCHY_CONDITION}")
+        value = self.selectValue(" ".join(sql))
+        if value is None:
+            return None
+        return str(value)
+
+    def getHierarchyRows(self, schema_name, city_code=None):
+        """
+        スナップショット・市町村配下の階層データ作成用の階層データを取得する
+
+        街区の行がなく地番の行のみにある街区は、名称を街区コード、座標を地番の重心の平均として加える
+
+        @param schema_name スキーマ名
+        @param city_code 市町村コード。省略時はスキーマ全体
+        @return HIERARCHY_FIELDSの順の行データ。エラー時はNone
+        """
+        params = {}
+        city_condition = ""
+        if city_code is not None:
+            city_condition = " AND city_code = :city_code"
+            params["city_code"] = city_code
+
+        sql = []
+        sql.append("SELECT DISTINCT city_code, ooaza_code, koaza_code, gaiku_code, name, kana, header, '' AS initial")
+        table, x, y = self.addressSource(schema_name)
+        sql.append(f", {x} AS x, {y} AS y")
+        sql.append(f"FROM {table}")
+        sql.append(f"WHERE {HIERARCHY_CONDITION}{city_condition}")
+        sql.append("UNION ALL")
+        sql.append("SELECT city_code, ooaza_code, koaza_code, gaiku_code, gaiku_code, '', '', '', x, y FROM (")
+        sql.append(f"SELECT city_code, ooaza_code, koaza_code, gaiku_code, AVG({x}) AS x, AVG({y}) AS y FROM {table}")
+        sql.append(f"WHERE {CHIBAN_GAIKU_CONDITION}{city_condition}")
+        sql.append("GROUP BY city_code, ooaza_code, koaza_code, gaiku_code) g")
+        sql.append(f"WHERE NOT EXISTS (SELECT 1 FROM {table} h WHERE h.city_code = g.city_code AND h.ooaza_code = g.ooaza_code")
+        sql.append("AND h.koaza_code = g.koaza_code AND h.gaiku_code = g.gaiku_code AND h.chiban = '' AND h.setai_name = '')")
+        model = self.selectModel(" ".join(sql), params or None)
+        if model is None:
+            return None
+        return self.fillInitials(model).rows
+
+    def fillInitials(self, model):
+        """
+        データモデルのinitial列にkana列の頭文字を設定する
+
+        @param model kana列、initial列を持つデータモデル
+        @return データモデル
+        """
+        if model is None:
+            return None
+        kana_column = model.fieldIndex("kana")
+        initial_column = model.fieldIndex("initial")
+        if kana_column < 0 or initial_column < 0:
+            return model
+        model.rows = [row[:initial_column] + (kanaInitial(row[kana_column]),) + row[initial_column + 1:] for row in model.rows]
+        return model
+
+    def getCityTree(self, city_code, schema_name=None):
+        """
+        市町村配下の大字、小字、街区を1回の検索で取得する
+        取得した階層データはスキーマ・市町村ごとにcity_tree_count件まで保持する
+
+        @param city_code 市町村コード
+        @param schema_name スキーマ名。省略時は現在のスキーマ（取得中にエリアが変更されても、このスキーマで取得する）
+        @return 階層データ。エラー時はNone
+        """
+        if not city_code:
+            return None
+
+        if schema_name is None:
+            schema_name = self.schema_name
+        tree = self.readyTree(city_code, schema_name)
+        if tree is not None:
+            return tree
+
+        snapshot = self.prepareSnapshot(schema_name)
+        if snapshot is not None:
+            rows = snapshot.getCityRows(city_code)
+        else:
+            rows = self.getHierarchyRows(schema_name, city_code)
+        if rows is None:
+            return None
+
+        tree = AddressTree(city_code, rows)
+        with self.city_tree_lock:
+            self.city_trees[(schema_name, city_code)] = tree
+            while len(self.city_trees) > self.city_tree_count:
+                self.city_trees.popitem(last=False)
+        return tree
+
+    def prefetchTree(self, city_code):
+        """
+        市町村配下の階層データを取得する（未取得の場合は検索する）
+        作成を別のスレッドで行う場合は取得済みのもののみ使用する
+
+        @param city_code 市町村コード
+        @return 階層データ。使用しない場合や未取得、エラー時はNone
+        """
+        if not self.prefetch_city:
+            return None
+        if self.background_prefetch:
+            return self.readyTree(city_code)
+        return self.getCityTree(city_code)
+
+    def readyTree(self, city_code, schema_name=None):
+        """
+        取得済みの市町村配下の階層データを取得する
+        DBへの問い合わせは行わない
+
+        @param city_code 市町村コード
+        @param schema_name スキーマ名。省略時は現在のスキーマ
+        @return 階層データ。未取得の場合はNone
+        """
+        if schema_name is None:
+            schema_name = self.schema_name
+        key = (schema_name, city_code)
+        with self.city_tree_lock:
+            tree = self.city_trees.get(key)
+            if tree is not None:
+                self.city_trees.move_to_end(key)
+        return tree
+
+    def clearCityTrees(self, schema_name):
+        """
+        スキーマの市町村配下の階層データを破棄する
+
+        @param schema_name スキーマ名
+        """
+        with self.city_tree_lock:
+            for key in [key for key in self.city_trees if key[0] == schema_name]:
+                del self.city_trees[key]
+
+    def hasRelation(self, relation_name, schema_name=None):
+        """
+        スキーマに指定のテーブル・ビューがあるか判定する
+        判定結果はスキーマごとに保持する
+
+        @param relation_name テーブル・ビュー名
+        @param schema_name スキーマ名。省略時は現在のスキーマ
+        @return 存在すればTrue
+        """
+        if schema_name is None:
+            schema_name = self.schema_name
+        key = (schema_name, relation_name)
+        if key not in self.relation_cache and self.backend is not None:
+            self.relation_cache[key] = self.backend.hasRelation(relation_name, schema_name)
+        if key not in self.relation_cache:
+            value = self.selectValue("SELECT to_regclass(:name) IS NOT NULL", {"name": f"{schema_name}.{relation_name}"})
+            self.relation_cache[key] = bool(value)
+        return self.relation_cache[key]
+
+    def hasColumn(self, relation_name, column_name, schema_name=None):
+        """
+        テーブル・ビューに指定の列があるか判定する（以前の形式のビューの判定用）
+        判定結果はスキーマごとに保持する
+
+        @param relation_name テーブル・ビュー名
+        @param column_name 列名
+        @param schema_name スキーマ名。省略時は現在のスキーマ
+        @return 存在すればTrue
+        """
+        if schema_name is None:
+            schema_name = self.schema_name
+        key = (schema_name, relation_name, column_name)
+        if key not in self.relation_cache and self.backend is not None:
+            self.relation_cache[key] = self.backend.hasColumn(relation_name, column_name, schema_name)
+        if key not in self.relation_cache:
+            # マテリアライズドビューはinformation_schema.columnsに含まれないためpg_attributeで判定する
+            value = self.selectValue(
+                "SELECT EXISTS (SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(:name)"
+                " AND attname = :column AND attnum > 0 AND NOT attisdropped)",
+                {"name": f"{schema_name}.{relation_name}", "column": column_name})
+            self.relation_cache[key] = bool(value)
+        return self.relation_cache[key]
+
+    def addressSource(self, schema_name=None):
+        """
+        住所データの検索元と重心座標の式を取得する
+        重心座標を保持するaddress_centroidがあれば、v_address_listより優先する
+
+        @param schema_name スキーマ名。省略時は現在のスキーマ
+        @return (テーブル名, X座標の式, Y座標の式)
+        """
+        if schema_name is None:
+            schema_name = self.schema_name
+        if self.hasRelation("address_centroid", schema_name):
+            return (f"{schema_name}.address_centroid", "x", "y")
+        return (f"{schema_name}.v_address_list", "ST_X(ST_Centroid(the_geom))", "ST_Y(ST_Centroid(the_geom))")
+
+    def runSqlScript(self, file_name, schema_name):
+        """
+        sqlフォルダのスクリプトをスキーマに対して実行する
+        psqlのメタコマンド行は無視し、変数:"schema"はスキーマ名に置き換える
+
+        @param file_name スクリプトのファイル名
+        @param schema_name スキーマ名
+        @return 成功すればTrue
+        """
+        path = os.path.join(os.path.dirname(__file__), "sql", file_name)
+        with open(path, encoding="utf-8") as f:
+            lines = [line for line in f if not line.lstrip().startswith("\\")]
+        script = "".join(lines).replace(':"schema"', f'"{schema_name}"')
+
+        for statement in re.split(r";[ \t]*$", script, flags=re.M):
+            body = "\n".join(line for line in statement.splitlines() if not line.strip().startswith("--"))
+            if len(body.strip()) == 0:
+                continue
+            if self.execQuery(statement) is None:
+                self.execQuery("ROLLBACK")
+                return False
+        return True
+
+    def prepareArea(self, schema_name):
+        """
+        エリアの検索用データを作成する
+        重心座標のマテリアライズドビュー(address_centroid)と地番検索ビュー(chiban_search)を作成する
+
+        @param schema_name スキーマ名
+        @return 成功すればTrue
+        """
+        if self.backend is not None:
+            QgsMessageLog.logMessage("住宅地図検索:ローカルファイルには検索用データを作成できません")
+            return False
+        success = self.runSqlScript("prepare_area.sql", schema_name)
+        if success:
+            success = self.runSqlScript("prepare_chiban_search.sql", schema_name)
+        if success and self.hasRelation("v_landmark_list", schema_name):
+            success = self.runSqlScript("prepare_landmark_search.sql", schema_name)
+        self.invalidateArea(schema_name)
+        return success
+
+    def refreshArea(self, schema_name):
+        """
+        エリアの検索用データをv_address_listの内容で更新する
+
+        @param schema_name スキーマ名
+        @return 成功すればTrue
+        """
+        if self.backend is not None:
+            QgsMessageLog.logMessage("住宅地図検索:ローカルファイルの検索用データは更新できません")
+            return False
+        success = True
+        for relation_name in ("address_centroid", "chiban_search", "landmark_search"):
+            if not self.hasRelation(relation_name, schema_name):
+                continue
+            if self.execQuery(f"REFRESH MATERIALIZED VIEW {schema_name}.{relation_name}") is None:
+                success = False
+                continue
+            self.execQuery(f"ANALYZE {schema_name}.{relation_name}")
+        self.invalidateArea(schema_name)
+        return success
+
+    def getGeometrySrid(self, schema_name=None):
+        """
+        住所データのジオメトリの空間参照系IDを取得する
+        取得結果はスキーマごとに保持する
+
+        @param schema_name スキーマ名。省略時は現在のスキーマ
+        @return 空間参照系ID。取得できない場合は-1
+        """
+        if schema_name is None:
+            schema_name = self.schema_name
+        if schema_name not in self.srid_cache:
+            srid = self.selectValue(f"SELECT ST_SRID(the_geom) FROM {schema_name}.v_address_list WHERE the_geom IS NOT NULL LIMIT 1")
+            self.srid_cache[schema_name] = -1 if srid is None else int(srid)
+        return self.srid_cache[schema_name]
+
+    def exportArea(self, schema_name, path):
+        """
+        エリアの住所データをローカルファイル（GeoPackage）に出力する
+        重心座標・外接矩形と地番検索キーを計算済みの状態で出力し、検索用の索引を作成する
+
+        @param schema_name スキーマ名
+        @param path 出力先のファイルパス
+        @return 成功すればTrue
+        """
+        if self.backend is not None:
+            QgsMessageLog.logMessage("住宅地図検索:ローカルファイルは出力できません")
+            return False
+
+        started = time.perf_counter()
+        source = f"{schema_name}.v_address_list"
+        srid = self.getGeometrySrid(schema_name)
+        srs_definition = self.selectValue("SELECT srtext FROM spatial_ref_sys WHERE srid = :srid", {"srid": srid})
+
+        if self.hasRelation("address_centroid", schema_name):
+            # 作成済みの重心座標を使用する
+            sql = f"SELECT {', '.join(EXPORT_FIELDS)}, x, y, xmin, ymin, xmax, ymax FROM {schema_name}.address_centroid"
+        else:
+            sql = f"SELECT {', '.join(EXPORT_FIELDS)}"
+            sql += ", ST_X(ST_Centroid(the_geom)), ST_Y(ST_Centroid(the_geom))"
+            sql += ", ST_XMin(the_geom), ST_YMin(the_geom), ST_XMax(the_geom), ST_YMax(the_geom)"
+            sql += f" FROM {source}"
+        query = self.execQuery(sql)
+        if query is None:
+            return False
+
+        column_count = query.record().count()
+        exporter = AreaExporter(path, schema_name, srid, srs_definition, self.chiban_key_table)
+        try:
+            rows = []
+            while query.next():
+                rows.append(tuple(plainValue(query.value(i)) for i in range(column_count)))
+                if len(rows) >= EXPORT_BATCH_SIZE:
+                    exporter.addRows(rows)
+                    rows = []
+            query.finish()
+            exporter.addRows(rows)
+            exporter.finish(self.databaseKey())
+        except Exception as e:
+            QgsMessageLog.logMessage(f"住宅地図検索:{schema_name}の出力に失敗しました {e}")
+            exporter.abort()
+            return False
+
+        QgsMessageLog.logMessage(
+            f"住宅地図検索:{schema_name}を出力しました（{exporter.count}件、{time.perf_counter() - started:.1f}秒） {path}")
+        return True
+
+    def invalidateArea(self, schema_name):
+        """
+        エリアのデータ更新後に、保持している判定結果やスナップショットの確認を無効にする
+
+        @param schema_name スキーマ名
+        """
+        self.clearRelationCache()
+        self.clearCityTrees(schema_name)
+        self.name_cache.clear()
+        self.address_searches.pop(schema_name, None)
+        self.fuzzy_indexes.pop(schema_name, None)
+        snapshot = self.snapshots.get(schema_name)
+        if snapshot is not None:
+            # 次回使用時にサーバーと整合を確認する
+            snapshot.validated_at = None
+
+    def clearRelationCache(self):
+        """
+        テーブル・ビューの存在判定結果を破棄する
+        """
+        self.relation_cache.clear()
+        self.srid_cache.clear()
+
+    def normalizeChiban(self, chiban):
+        """
+        地番の入力を検索キーに正規化する
+        漢数字を算用数字に変換してから全角に変換し、ハイフン類を「‐」に統一する
+
+        @param chiban 地番
+        @return 検索キー
+        """
+        return kanjiNumerals(chiban).translate(self.narrow_to_wide).translate(self.chiban_key_table)
 
     def getSchemaNames(self):
         """
@@ -30,36 +954,80 @@ class DbUtil:
 
         @return スキーマ名リスト
         """
-        query = QSqlQuery("SELECT nspname FROM pg_namespace where nspname LIKE 'ja_%' ORDER BY nspname")
-        list = []
-        while query.next():
-            list.append(str(query.value(0)))
+        if self.backend is not None:
+            self.schema_names = self.backend.schemaNames()
+            return self.schema_names
+        model = self.selectModel("SELECT nspname FROM pg_namespace where nspname LIKE 'ja_%' ORDER BY nspname")
+        list = [] if model is None else [str(row[0]) for row in model.rows]
+        self.schema_names = list
         return list
 
+    def warmUp(self):
+        """
+        起動時の事前接続処理（ワーカースレッドで実行する）
+        スキーマ名を取得し、先頭のスキーマ（エリアの初期選択）の階層スナップショットを準備する
+
+        @return スキーマ名リスト。接続できない場合はNone
+        """
+        if self.backend is None and not self.database().isOpen():
+            return None
+        schema_names = self.getSchemaNames()
+        if len(schema_names) > 0:
+            self.prepareSnapshot(schema_names[0])
+        return schema_names
+
     def setSchema(self, schema_name):
         """
         スキーマ名を変数に設定する
+        準備済みクエリはスキーマごとに保持し、新しいスキーマでは最初の検索時に準備する
+        スキーマが変わった場合は名称キャッシュを破棄する
 
         @param スキーマ名
         """
+        if schema_name != self.current_schema_name:
+            stats = self.nameCacheStats()
+            if stats["hits"] + stats["misses"] > 0:
+                QgsMessageLog.logMessage(
+                    f"住宅地図検索:名称キャッシュ({self.current_schema_name}) ヒット {stats['hits']} ミス {stats['misses']} 件数 {stats['size']}")
+            self.name_cache.clear()
         self.schema_name = schema_name
 
+    def nameCacheStats(self):
+        """
+        名称キャッシュの統計を取得する
+
+        @return ヒット数(hits)、ミス数(misses)、保持件数(size)の辞書
+        """
+        return self.name_cache.stats()
+
+    def rememberNames(self, model, *parent_codes):
+        """
+        検索結果のデータモデルの名称を名称キャッシュに登録する
+
+        @param model name、code列を持つデータモデル
+        @param parent_codes 上位のコード
+        @return データモデル
+        """
+        self.name_cache.putModel(model, self.schema_name, *parent_codes)
+        return model
+
     def getCityModel(self):
         """
         市町村情報を取得する
 
         @return 市町村情報
         """
-        sql = "SELECT name, city_code AS code, ST_X(ST_Centroid(the_geom)) AS x, ST_Y(ST_Centroid(the_geom)) AS y"
-        sql += f" FROM {self.schema_name}.v_address_list"
+        snapshot = self.lookupSnapshot()
+        if snapshot is not None:
+            return self.rememberNames(snapshot.getCityModel())
+
+        table, x, y = self.addressSource()
+        sql = f"SELECT name, city_code AS code, {x} AS x, {y} AS y"
+        sql += f" FROM {table}"
         sql += f" WHERE ooaza_code=''"
         sql += " ORDER BY code"
         # sql += " ORDER BY TO_NUMBER(SUBSTRING (ooaza_code FROM '[0-9].*$') ,'99999')"
-        model = QSqlQueryModel()
-        model.setQuery(sql)
-        if model.lastError().isValid():
-            return None
-        return model
+        return self.rememberNames(self.selectModel(sql, {}))
 
     def getOoazaModel(self, city_code):
         """
@@ -71,16 +1039,20 @@ class DbUtil:
         if city_code is None:
             return None
 
-        sql = "SELECT name, ooaza_code AS code, ST_X(ST_Centroid(the_geom)) AS x, ST_Y(ST_Centroid(the_geom)) AS y"
-        sql += f" FROM {self.schema_name}.v_address_list"
-        sql += f" WHERE city_code = '{city_code}' AND ooaza_code != '' AND koaza_code = ''"
+        tree = self.prefetchTree(city_code)
+        if tree is not None:
+            return self.rememberNames(tree.getOoazaModel(city_code), city_code)
+        snapshot = self.lookupSnapshot()
+        if snapshot is not None:
+            return self.rememberNames(snapshot.getOoazaModel(city_code), city_code)
+
+        table, x, y = self.addressSource()
+        sql = f"SELECT name, ooaza_code AS code, {x} AS x, {y} AS y"
+        sql += f" FROM {table}"
+        sql += " WHERE city_code = :city_code AND ooaza_code != '' AND koaza_code = ''"
         sql += " ORDER BY code"
 
-        model = QSqlQueryModel()
-        model.setQuery(sql)
-        if model.lastError().isValid():
-            return None
-        return model
+        return self.rememberNames(self.selectModel(sql, {"city_code": city_code}), city_code)
 
     def getKoazaModel(self, city_code, ooaza_code):
         """
@@ -93,17 +1065,20 @@ class DbUtil:
         if city_code is None or ooaza_code is None:
             return None
 
-        sql = "SELECT distinct name, koaza_code AS code, ST_X(ST_Centroid(the_geom)) AS x, ST_Y(ST_Centroid(the_geom)) AS y"
-        sql += f" FROM {self.schema_name}.v_address_list"
-        sql += f" WHERE city_code = '{city_code}' AND ooaza_code = '{ooaza_code}' AND koaza_code != '' AND gaiku_code = ''"
+        tree = self.prefetchTree(city_code)
+        if tree is not None:
+            return self.rememberNames(tree.getKoazaModel(city_code, ooaza_code), city_code, ooaza_code)
+        snapshot = self.lookupSnapshot()
+        if snapshot is not None:
+            return self.rememberNames(snapshot.getKoazaModel(city_code, ooaza_code), city_code, ooaza_code)
+
+        table, x, y = self.addressSource()
+        sql = f"SELECT distinct name, koaza_code AS code, {x} AS x, {y} AS y"
+        sql += f" FROM {table}"
+        sql += " WHERE city_code = :city_code AND ooaza_code = :ooaza_code AND koaza_code != '' AND gaiku_code = ''"
         sql += " ORDER BY code"
 
-        model = QSqlQueryModel()
-        model.setQuery(sql)
-        if model.lastError().isValid():
-            QgsMessageLog.logMessage(f"地番検索エラー：{model.lastError().text()}")
-            return None
-        return model
+        return self.rememberNames(self.selectModel(sql, {"city_code": city_code, "ooaza_code": ooaza_code}), city_code, ooaza_code)
 
     def getGaikuModel(self, city_code, ooaza_code, koaza_code):
         """
@@ -117,18 +1092,57 @@ class DbUtil:
         if city_code is None or ooaza_code is None or koaza_code is None:
             return None
 
-        sql = "SELECT distinct name, gaiku_code AS code, ST_X(ST_Centroid(the_geom)) AS x, ST_Y(ST_Centroid(the_geom)) AS y"
-        sql += f" FROM {self.schema_name}.v_address_list"
-        sql += f" WHERE city_code = '{city_code}' AND ooaza_code = '{ooaza_code}' AND koaza_code ='{koaza_code}' AND gaiku_code != '' AND chiban = ''"
+        tree = self.prefetchTree(city_code)
+        if tree is not None:
+            return tree.getGaikuModel(city_code, ooaza_code, koaza_code)
+        snapshot = self.lookupSnapshot()
+        if snapshot is not None:
+            return snapshot.getGaikuModel(city_code, ooaza_code, koaza_code)
+
+        table, x, y = self.addressSource()
+        sql = f"SELECT distinct name, gaiku_code AS code, {x} AS x, {y} AS y"
+        sql += f" FROM {table}"
+        sql += " WHERE city_code = :city_code AND ooaza_code = :ooaza_code AND koaza_code = :koaza_code AND gaiku_code != '' AND chiban = ''"
         sql += " AND setai_name = ''"
         sql += " ORDER BY code"
 
-        model = QSqlQueryModel()
-        model.setQuery(sql)
-        if model.lastError().isValid():
-            QgsMessageLog.logMessage(f"地番検索エラー：{model.lastError().text()}")
-            return None
-        return model
+        return self.selectModel(sql, {"city_code": city_code, "ooaza_code": ooaza_code, "koaza_code": koaza_code})
+
+    def chibanCondition(self, city_code, ooaza_code, koaza_code, gaiku_code, chiban, use_search_view=True):
+        """
+        地番検索のFROM句・WHERE句を作成する
+        正規化キーと索引を持つ地番検索ビュー(chiban_search)があれば使用する
+
+        @param city_code  市町村コード
+        @param ooaza_code 大字コード
+        @param koaza_code 小字コード
+        @param gaiku_code 街区コード
+        @param chiban     地番コード
+        @param use_search_view Falseの場合は地番検索ビューを使用しない
+
+        @return (FROM句・WHERE句, バインドする値, X座標の列, Y座標の列)
+        """
+        params = {"city_code": city_code, "ooaza_code": ooaza_code}
+        if use_search_view and self.hasRelation("chiban_search"):
+            table, x, y = f"{self.schema_name}.chiban_search", "x", "y"
+            params["pattern"] = f"%{self.normalizeChiban(chiban)}%"
+            chiban_condition = " AND chiban_key LIKE :pattern"
+        else:
+            table, x, y = self.addressSource()
+            # chibanを検索キーと同じく漢数字を算用数字にしてから全角変換
+            params["chiban"] = kanjiNumerals(chiban).translate(self.narrow_to_wide)
+            chiban_condition = " AND chiban LIKE '%' || REPLACE(:chiban, '－', '‐') || '%'"
+
+        sql = f" FROM {table}"
+        sql += " WHERE city_code = :city_code AND ooaza_code = :ooaza_code"
+        if koaza_code is not None and koaza_code != '':
+            sql += " AND koaza_code = :koaza_code"
+            params["koaza_code"] = koaza_code
+        if gaiku_code is not None and gaiku_code != '':
+            sql += " AND gaiku_code = :gaiku_code"
+            params["gaiku_code"] = gaiku_code
+        sql += chiban_condition
+        return sql, params, x, y
 
     def getChibanModel(self, city_code, ooaza_code, koaza_code, gaiku_code, chiban):
         """
@@ -145,26 +1159,406 @@ class DbUtil:
         if city_code is None or ooaza_code is None or chiban is None:
             return None
 
-        # chibanを全角変換
-        chiban_w = chiban.translate(self.narrow_to_wide)
+        condition, params, x, y = self.chibanCondition(city_code, ooaza_code, koaza_code, gaiku_code, chiban)
+        sql = f"SELECT address, chiban, {x} AS x, {y} AS y"
+        sql += condition
+        sql += f" ORDER BY {', '.join(CHIBAN_ORDER_KEYS)}"
 
-        sql = f"SELECT address, chiban, ST_X(ST_Centroid(the_geom)) AS x, ST_Y(ST_Centroid(the_geom)) AS y"
-        sql += f" FROM {self.schema_name}.v_address_list"
-        sql += f" WHERE city_code = '{city_code}' AND ooaza_code = '{ooaza_code}'"
-        if koaza_code is not None and koaza_code != '':
-            sql += f" AND koaza_code = '{koaza_code}'"
-        if gaiku_code is not None and gaiku_code != '':
-            sql += f" AND gaiku_code = '{gaiku_code}'"
-        sql += f" AND chiban LIKE '%' || REPLACE('{chiban_w}', '－', '‐') || '%'"
-        sql += " ORDER BY honban, edaban, magoban, himagoban, yasyagoban, kigo"
+        return self.selectModel(sql, params)
 
+    def getChibanPage(self, city_code, ooaza_code, koaza_code, gaiku_code, chiban, after_key=None, skip=0, limit=200):
+        """
+        地番情報を1ページ分取得する
+        並び順の列(CHIBAN_ORDER_FIELDS)の値によるキーセット方式で、前ページの続きから取得する
 
-        model = QSqlQueryModel()
-        model.setQuery(sql)
-        if model.lastError().isValid():
-            QgsMessageLog.logMessage(f"地番検索エラー：{model.lastError().text()}")
+        @param city_code  市町村コード
+        @param ooaza_code 大字コード
+        @param koaza_code 小字コード
+        @param gaiku_code 街区コード
+        @param chiban     地番コード
+        @param after_key  前ページ最終行のキーの列(CHIBAN_KEY_COLUMNS)の値。先頭ページはNone
+        @param skip       前ページまでに取得済みの、after_keyと同じ値の行数
+        @param limit      1ページの行数
+
+        @return address, chiban, x, y, キーの列(CHIBAN_KEY_COLUMNS)の地番情報
+        """
+        if city_code is None or ooaza_code is None or chiban is None:
             return None
-        return model
+
+        condition, params, x, y = self.chibanCondition(city_code, ooaza_code, koaza_code, gaiku_code, chiban)
+        order = ", ".join(CHIBAN_ORDER_KEYS)
+        keys = ", ".join(f"{key} AS {column}" for column, key in zip(CHIBAN_KEY_COLUMNS, CHIBAN_ORDER_KEYS))
+        sql = f"SELECT address, chiban, {x} AS x, {y} AS y, {keys}"
+        sql += condition
+        if after_key is not None:
+            binds = []
+            for field, value in zip(CHIBAN_ORDER_FIELDS, after_key):
+                params[f"after_{field}"] = value
+                binds.append(f":after_{field}")
+            sql += f" AND ({order}) >= ({', '.join(binds)})"
+        sql += f" ORDER BY {order}"
+        sql += " LIMIT :limit OFFSET :skip"
+        params["limit"] = limit
+        params["skip"] = skip if after_key is not None else 0
+
+        return self.selectModel(sql, params)
+
+    def getChibanCount(self, city_code, ooaza_code, koaza_code, gaiku_code, chiban):
+        """
+        地番検索の該当件数を取得する
+
+        @param city_code  市町村コード
+        @param ooaza_code 大字コード
+        @param koaza_code 小字コード
+        @param gaiku_code 街区コード
+        @param chiban     地番コード
+
+        @return 件数。エラー時はNone
+        """
+        if city_code is None or ooaza_code is None or chiban is None:
+            return None
+
+        condition, params, x, y = self.chibanCondition(city_code, ooaza_code, koaza_code, gaiku_code, chiban)
+        value = self.selectValue("SELECT COUNT(*)" + condition, params)
+        if value is None:
+            return None
+        return int(value)
+
+    def getChibanExtent(self, city_code, ooaza_code, koaza_code, gaiku_code, chiban):
+        """
+        地番検索の該当範囲を集計で取得する（全件表示用）
+        地番検索ビュー(chiban_search)とaddress_centroidは外接矩形、v_address_listはジオメトリ(ST_Extent)の範囲
+        （外接矩形の列がない以前の地番検索ビューは使用しない）
+
+        @param city_code  市町村コード
+        @param ooaza_code 大字コード
+        @param koaza_code 小字コード
+        @param gaiku_code 街区コード
+        @param chiban     地番コード
+
+        @return (最小X座標, 最小Y座標, 最大X座標, 最大Y座標)。該当なし、エラー時はNone
+        """
+        if city_code is None or ooaza_code is None or chiban is None:
+            return None
+
+        use_search_view = self.hasColumn("chiban_search", "xmin")
+        condition, params, _, _ = self.chibanCondition(city_code, ooaza_code, koaza_code, gaiku_code, chiban, use_search_view)
+        if use_search_view or self.hasRelation("address_centroid"):
+            sql = "SELECT MIN(xmin), MIN(ymin), MAX(xmax), MAX(ymax)" + condition
+        else:
+            sql = "SELECT ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent)"
+            sql += f" FROM (SELECT ST_Extent(the_geom) AS extent{condition}) AS result"
+        model = self.selectModel(sql, params)
+        if model is None or model.rowCount() == 0 or None in model.rows[0]:
+            return None
+        return tuple(float(value) for value in model.rows[0])
+
+    def getChibanBatch(self, city_code, ooaza_code, chiban_keys):
+        """
+        大字内の複数の地番の位置を1回の検索で取得する（一括検索用）
+        地番の数はCHIBAN_BATCH_SIZESのいずれかに揃えてバインドし、準備済みクエリの種類を抑える
+
+        @param city_code  市町村コード
+        @param ooaza_code 大字コード
+        @param chiban_keys 地番の検索キー（normalizeChibanで正規化したもの）のリスト。CHIBAN_BATCH_SIZESの最大数まで
+
+        @return フィールドchiban_key, koaza_code, gaiku_code, address, x, yの地番情報
+        """
+        if city_code is None or ooaza_code is None or len(chiban_keys) == 0:
+            return None
+
+        if self.hasRelation("chiban_search"):
+            table, x, y = f"{self.schema_name}.chiban_search", "x", "y"
+            key_column = "chiban_key"
+        else:
+            table, x, y = self.addressSource()
+            key_column = "chiban"
+
+        size = next(size for size in CHIBAN_BATCH_SIZES if size >= len(chiban_keys))
+        keys = list(chiban_keys) + [chiban_keys[-1]] * (size - len(chiban_keys))
+        params = {"city_code": city_code, "ooaza_code": ooaza_code}
+        for i, key in enumerate(keys):
+            params[f"key{i}"] = key
+        sql = f"SELECT {key_column} AS chiban_key, koaza_code, gaiku_code, address, {x} AS x, {y} AS y"
+        sql += f" FROM {table}"
+        sql += " WHERE city_code = :city_code AND ooaza_code = :ooaza_code"
+        sql += f" AND {key_column} IN ({', '.join(f':key{i}' for i in range(size))})"
+        sql += f" ORDER BY {', '.join(CHIBAN_ORDER_KEYS)}"
+
+        return self.selectModel(sql, params)
+
+    def searchAddress(self, text, city_code=None, limit=20):
+        """
+        住所の自由入力（「津市丸の内1-2」など）に該当する候補を取得する
+        階層の名称は取得済みのデータと照合し、地番は1回の検索で取得する
+
+        @param text 入力
+        @param city_code 入力に市町村名がない場合の市町村コード
+        @param limit 取得する最大件数
+        @return フィールドaddress, level, x, y, score, city_code, ooaza_code, koaza_code, gaiku_codeの候補（順位の高い順）
+        """
+        search = self.address_searches.get(self.schema_name)
+        if search is None:
+            search = AddressSearch(self)
+            self.address_searches[self.schema_name] = search
+        return search.search(text, city_code, limit)
+
+    def prepareFuzzyIndex(self):
+        """
+        現在のスキーマの名称のあいまい検索の索引を作成する（作成済みであればそのまま）
+        市町村・大字・小字の名称とふりがなは階層スナップショットがあればそこから、なければDBから取得する
+
+        @return 索引。取得できない場合はNone
+        """
+        schema_name = self.schema_name
+        index = self.fuzzy_indexes.get(schema_name)
+        if index is not None:
+            return index
+
+        started = time.perf_counter()
+        snapshot = self.readySnapshot()
+        if snapshot is not None:
+            rows = snapshot.select(
+                "SELECT city_code, ooaza_code, koaza_code, name, kana, x, y FROM hierarchy WHERE gaiku_code = ''").rows
+        else:
+            rows = self.getHierarchyRows(schema_name)
+            if rows is None:
+                return None
+            # HIERARCHY_FIELDSの順の行から街区を除く
+            rows = [row[:3] + row[4:6] + row[8:10] for row in rows if not row[3]]
+        index = FuzzyNameIndex(rows)
+        self.fuzzy_indexes[schema_name] = index
+        QgsMessageLog.logMessage(
+            f"住宅地図検索:{schema_name}の名称索引を作成しました（{len(index)}件 {(time.perf_counter() - started) * 1000:.0f}ms）")
+        return index
+
+    def readyFuzzyIndex(self):
+        """
+        作成済みの名称のあいまい検索の索引を取得する
+
+        @return 索引。未作成の場合はNone
+        """
+        return self.fuzzy_indexes.get(self.schema_name)
+
+    def searchNames(self, text, parent_codes=None, limit=20):
+        """
+        名称・ふりがなが入力に近い市町村・大字・小字を取得する
+        異体字・カタカナ・長音の違いを揃え、編集距離の小さい順に並べる
+
+        @param text 入力
+        @param parent_codes 親の階層のコード（市町村は()、大字は(市町村コード,)、小字は(市町村コード, 大字コード)）。
+                            Noneの場合はすべての階層
+        @param limit 取得する最大件数
+        @return フィールドname, code, x, y, kana, distance, city_code, ooaza_code, koaza_codeの候補
+        """
+        index = self.prepareFuzzyIndex()
+        if index is None:
+            return None
+        rows = []
+        for (city_code, ooaza_code, koaza_code, name, kana, x, y), distance in index.search(text, parent_codes, limit):
+            code = koaza_code or ooaza_code or city_code
+            rows.append((name, code, x, y, kana, distance, city_code, ooaza_code, koaza_code))
+        return ResultTableModel(["name", "code", "x", "y", "kana", "distance", "city_code", "ooaza_code", "koaza_code"], rows)
+
+    def getChibanInExtent(self, xmin, ymin, xmax, ymax):
+        """
+        範囲内に重心がある地番を取得する（逆検索用）
+
+        @param xmin 範囲の最小X座標
+        @param ymin 範囲の最小Y座標
+        @param xmax 範囲の最大X座標
+        @param ymax 範囲の最大Y座標
+
+        @return フィールドaddress, chiban, city_code, ooaza_code, koaza_code, gaiku_code, x, yの地番情報
+        """
+        params = {"xmin": xmin, "ymin": ymin, "xmax": xmax, "ymax": ymax}
+        sql = "SELECT address, chiban, city_code, ooaza_code, koaza_code, gaiku_code"
+        if self.hasRelation("address_centroid"):
+            sql += f", x, y FROM {self.schema_name}.address_centroid"
+            sql += " WHERE x BETWEEN :xmin AND :xmax AND y BETWEEN :ymin AND :ymax"
+        else:
+            # ジオメトリの空間索引で絞り込む
+            sql += ", ST_X(ST_Centroid(the_geom)) AS x, ST_Y(ST_Centroid(the_geom)) AS y"
+            sql += f" FROM {self.schema_name}.v_address_list"
+            sql += f" WHERE the_geom && ST_MakeEnvelope(:xmin, :ymin, :xmax, :ymax, {self.getGeometrySrid()})"
+        sql += " AND chiban != '' AND setai_name = ''"
+
+        return self.selectModel(sql, params)
+
+    def getChibanParcels(self, groups):
+        """
+        地番の筆のジオメトリをWKTで取得する（検索結果レイヤー用）
+        住所の数はCHIBAN_BATCH_SIZESのいずれかに揃えてバインドし、大字ごとに検索する
+        ローカルファイルはジオメトリを持たないため取得しない
+
+        @param groups (市町村コード, 大字コード, 住所のリスト)のリスト
+        @return フィールドaddress, wktの地番情報。エラー時、ローカルファイルの場合はNone
+        """
+        if self.backend is not None:
+            return None
+
+        rows = []
+        max_size = CHIBAN_BATCH_SIZES[-1]
+        for city_code, ooaza_code, addresses in groups:
+            addresses = list(dict.fromkeys(addresses))
+            for start in range(0, len(addresses), max_size):
+                chunk = addresses[start:start + max_size]
+                size = next(size for size in CHIBAN_BATCH_SIZES if size >= len(chunk))
+                chunk += [chunk[-1]] * (size - len(chunk))
+                params = {"city_code": city_code, "ooaza_code": ooaza_code}
+                for i, address in enumerate(chunk):
+                    params[f"address{i}"] = address
+                sql = "SELECT address, ST_AsText(the_geom) AS wkt"
+                sql += f" FROM {self.schema_name}.v_address_list"
+                sql += " WHERE city_code = :city_code AND ooaza_code = :ooaza_code"
+                sql += f" AND address IN ({', '.join(f':address{i}' for i in range(size))})"
+                sql += " AND chiban != '' AND setai_name = '' AND the_geom IS NOT NULL"
+                model = self.selectModel(sql, params)
+                if model is None:
+                    return None
+                rows.extend(model.rows)
+
+        return ResultTableModel(["address", "wkt"], rows)
+
+    def landmarkSource(self):
+        """
+        ランドマークの検索元と式を取得する
+        正規化キーと索引を持つランドマーク検索ビュー(landmark_search)があれば、v_landmark_listより優先する
+
+        @return (テーブル名, ふりがなのキーの式, X座標の式, Y座標の式)。ランドマークのデータがない場合はNone
+        """
+        if self.hasRelation("landmark_search"):
+            return (f"{self.schema_name}.landmark_search", "kana_key", "x", "y")
+        if self.hasRelation("v_landmark_list"):
+            return (f"{self.schema_name}.v_landmark_list", f"TRANSLATE(kana, '{KATAKANA}', '{HIRAGANA}')",
+                    "ST_X(ST_Centroid(the_geom))", "ST_Y(ST_Centroid(the_geom))")
+        return None
+
+    def landmarkCondition(self, category, text, city_code):
+        """
+        ランドマーク検索のFROM句・WHERE句と順位の式を作成する
+        名称は入力（NFKC変換したもの、全角に変換したもの）の部分一致、
+        ひらがな・カタカナのみの入力はふりがなの部分一致でも検索する
+
+        @param category カテゴリ。Noneまたは空文字の場合はすべて
+        @param text 名称またはふりがな。空文字の場合はカテゴリのすべて
+        @param city_code 市町村コード。Noneの場合はエリアのすべて
+
+        @return (FROM句・WHERE句, バインドする値, X座標の式, Y座標の式, 順位の式（名称の入力がない場合はNone）)。
+                ランドマークのデータがない場合はNone
+        """
+        source = self.landmarkSource()
+        if source is None:
+            return None
+        table, kana_key, x, y = source
+
+        params = {}
+        sql = f" FROM {table} WHERE name IS NOT NULL"
+        if city_code:
+            sql += " AND city_code = :city_code"
+            params["city_code"] = city_code
+        if category:
+            sql += " AND category = :category"
+            params["category"] = category
+
+        text = unicodedata.normalize("NFKC", text or "").strip()
+        if len(text) == 0:
+            return sql, params, x, y, None
+
+        # LIKEの特殊文字をエスケープする（全角に変換した入力は特殊文字を含まない）
+        escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        wide = text.translate(self.narrow_to_wide)
+        params.update({"text": text, "wide_text": wide,
+                       "pattern": f"%{escaped}%", "wide_pattern": f"%{wide}%",
+                       "prefix": f"{escaped}%", "wide_prefix": f"{wide}%"})
+        conditions = ["name LIKE :pattern", "name LIKE :wide_pattern"]
+        # 完全一致、前方一致、部分一致の順
+        rank = "CASE WHEN name = :text OR name = :wide_text THEN 0"
+        rank += " WHEN name LIKE :prefix OR name LIKE :wide_prefix THEN 1"
+        if KANA_INPUT_PATTERN.fullmatch(text):
+            kana = text.translate(str.maketrans(KATAKANA, HIRAGANA))
+            params.update({"kana_pattern": f"%{kana}%", "kana_prefix": f"{kana}%"})
+            conditions.append(f"{kana_key} LIKE :kana_pattern")
+            rank += f" WHEN {kana_key} LIKE :kana_prefix THEN 2"
+        rank += " ELSE 3 END"
+        sql += f" AND ({' OR '.join(conditions)})"
+        return sql, params, x, y, rank
+
+    def getLandmarkCategories(self, city_code=None):
+        """
+        ランドマークのカテゴリ一覧を取得する
+
+        @param city_code 市町村コード。Noneの場合はエリアのすべて
+        @return フィールドcategoryのカテゴリ。ランドマークのデータがない場合、エラー時はNone
+        """
+        source = self.landmarkSource()
+        if source is None:
+            return None
+        sql = f"SELECT DISTINCT category FROM {source[0]} WHERE category IS NOT NULL"
+        params = {}
+        if city_code:
+            sql += " AND city_code = :city_code"
+            params["city_code"] = city_code
+        sql += " ORDER BY category"
+        return self.selectModel(sql, params)
+
+    def getLandmarkPage(self, category, text, city_code, offset=0, limit=100):
+        """
+        ランドマークを1ページ分、順位の高い順に取得する
+        完全一致、名称の前方一致、ふりがなの前方一致、部分一致の順に、同じ順位は名称の短い順に並べる
+
+        @param category カテゴリ。Noneまたは空文字の場合はすべて
+        @param text 名称またはふりがな
+        @param city_code 市町村コード。Noneの場合はエリアのすべて
+        @param offset 前ページまでに取得済みの行数
+        @param limit 1ページの行数
+
+        @return LANDMARK_FIELDSのランドマーク情報。ランドマークのデータがない場合、エラー時はNone
+        """
+        condition = self.landmarkCondition(category, text, city_code)
+        if condition is None:
+            return None
+        condition, params, x, y, rank = condition
+        sql = f"SELECT name, category, {x} AS x, {y} AS y, kana, address, city_code"
+        sql += condition
+        order = ["LENGTH(name)", "name", "address"]
+        if rank is not None:
+            order.insert(0, rank)
+        sql += f" ORDER BY {', '.join(order)}"
+        sql += " LIMIT :limit OFFSET :offset"
+        params["limit"] = limit
+        params["offset"] = offset
+
+        return self.selectModel(sql, params)
+
+    def getLandmarkCount(self, category, text, city_code):
+        """
+        ランドマーク検索の該当件数を取得する
+
+        @param category カテゴリ。Noneまたは空文字の場合はすべて
+        @param text 名称またはふりがな
+        @param city_code 市町村コード。Noneの場合はエリアのすべて
+
+        @return 件数。ランドマークのデータがない場合、エラー時はNone
+        """
+        condition = self.landmarkCondition(category, text, city_code)
+        if condition is None:
+            return None
+        value = self.selectValue("SELECT COUNT(*)" + condition[0], condition[1])
+        if value is None:
+            return None
+        return int(value)
+
+    def geocodeCsv(self, input_path, output_path):
+        """
+        CSVファイルの住所を一括で検索し、座標を付けてCSVファイルに出力する（ワーカースレッドで実行する）
+
+        @param input_path 入力のCSVファイル
+        @param output_path 出力先のCSVファイル
+        @return 件数、一致件数、処理時間などの辞書。
+                ファイルの読み書きなどのエラーは例外とする（ワーカーはqueryFailedで通知する）
+        """
+        return BatchGeocoder(self).run(input_path, output_path)
 
     def getCityName(self, city_code):
         """
@@ -174,10 +1568,23 @@ class DbUtil:
 
         @return 市町村名
         """
-        sql = f"SELECT name FROM {self.schema_name}.v_address_list WHERE city_code = '{city_code}' AND ooaza_code  =''"
-        query = QSqlQuery(sql)
-        if query.first():
-            return str(query.value(0))
+        key = NameCache.makeKey(self.schema_name, city_code)
+        name = self.name_cache.get(key)
+        if name is not None:
+            return name
+
+        tree = self.readyTree(city_code)
+        snapshot = self.readySnapshot() if tree is None else None
+        if tree is not None:
+            name = tree.getCityName(city_code)
+        elif snapshot is not None:
+            name = snapshot.getCityName(city_code)
+        else:
+            sql = f"SELECT name FROM {self.addressSource()[0]} WHERE city_code = :city_code AND ooaza_code  =''"
+            name = self.selectValue(sql, {"city_code": city_code})
+        if name is not None:
+            self.name_cache.put(key, name)
+            return str(name)
 
         return ""
 
@@ -190,10 +1597,23 @@ class DbUtil:
         @return 大字名
         """
         if city_code and ooaza_code:
-            sql = f"SELECT name FROM {self.schema_name}.v_address_list WHERE city_code='{city_code}' AND ooaza_code = '{ooaza_code}' AND koaza_code = ''"
-            query = QSqlQuery(sql)
-            if query.first():
-                return str(query.value(0))
+            key = NameCache.makeKey(self.schema_name, city_code, ooaza_code)
+            name = self.name_cache.get(key)
+            if name is not None:
+                return name
+
+            tree = self.readyTree(city_code)
+            snapshot = self.readySnapshot() if tree is None else None
+            if tree is not None:
+                name = tree.getOoazaName(city_code, ooaza_code)
+            elif snapshot is not None:
+                name = snapshot.getOoazaName(city_code, ooaza_code)
+            else:
+                sql = f"SELECT name FROM {self.addressSource()[0]} WHERE city_code = :city_code AND ooaza_code = :ooaza_code AND koaza_code = ''"
+                name = self.selectValue(sql, {"city_code": city_code, "ooaza_code": ooaza_code})
+            if name is not None:
+                self.name_cache.put(key, name)
+                return str(name)
 
         return ""
 
@@ -207,14 +1627,26 @@ class DbUtil:
         @return 小字名
         """
         if city_code and ooaza_code and koaza_code:
-            sql = []
-            sql.append(f"SELECT name FROM {self.schema_name}.v_address_list ")
-            sql.append(f"WHERE city_code='{city_code}' AND ooaza_code = '{ooaza_code}' AND koaza_code = '{koaza_code}'")
-            sql.append("AND  gaiku_code=''")
-
-            query = QSqlQuery(" ".join(sql))
-            if query.first():
-                return str(query.value(0))
+            key = NameCache.makeKey(self.schema_name, city_code, ooaza_code, koaza_code)
+            name = self.name_cache.get(key)
+            if name is not None:
+                return name
+
+            tree = self.readyTree(city_code)
+            snapshot = self.readySnapshot() if tree is None else None
+            if tree is not None:
+                name = tree.getKoazaName(city_code, ooaza_code, koaza_code)
+            elif snapshot is not None:
+                name = snapshot.getKoazaName(city_code, ooaza_code, koaza_code)
+            else:
+                sql = []
+                sql.append(f"SELECT name FROM {self.addressSource()[0]} ")
+                sql.append("WHERE city_code = :city_code AND ooaza_code = :ooaza_code AND koaza_code = :koaza_code")
+                sql.append("AND  gaiku_code=''")
+                name = self.selectValue(" ".join(sql), {"city_code": city_code, "ooaza_code": ooaza_code, "koaza_code": koaza_code})
+            if name is not None:
+                self.name_cache.put(key, name)
+                return str(name)
 
         return ""
 
@@ -224,23 +1656,19 @@ class DbUtil:
 
         @return フィールドinitial_group, name, kana, initial, city_codeの市町村データ
         """
+        snapshot = self.lookupSnapshot()
+        if snapshot is not None:
+            return self.rememberNames(snapshot.getCityDataJSyllabary())
+
         sql = []
         sql.append("SELECT distinct header AS initial_group, name, kana")
-        sql.append(REPLACE_INITIAL_WORDS)
+        sql.append(", '' AS initial")
         sql.append(", city_code AS code")
-        sql.append(f"FROM {self.schema_name}.v_address_list")
+        sql.append(f"FROM {self.addressSource()[0]}")
         sql.append("WHERE city_code NOT IN ('', '0') AND ooaza_code  = ''")
         sql.append("ORDER BY kana")
 
-        model = QSqlQueryModel()
-        model.setQuery(" ".join(sql))
-
-
-        if model.lastError().isValid():
-            QgsMessageLog.logMessage(f"地番検索エラー：{model.lastError().text()}")
-            return None
-
-        return model
+        return self.rememberNames(self.fillInitials(self.selectModel(" ".join(sql), {})))
 
     def getOoazaDataJSyllabary(self, city_code):
         """
@@ -250,23 +1678,22 @@ class DbUtil:
 
         @return フィールドinitial_group, name, kana, initial, ooaza_codeの大字データ
         """
+        tree = self.prefetchTree(city_code)
+        if tree is not None:
+            return self.rememberNames(tree.getOoazaDataJSyllabary(city_code), city_code)
+        snapshot = self.lookupSnapshot()
+        if snapshot is not None:
+            return self.rememberNames(snapshot.getOoazaDataJSyllabary(city_code), city_code)
+
         sql = []
         sql.append("SELECT distinct header AS initial_group, name, kana")
-        sql.append(REPLACE_INITIAL_WORDS)
+        sql.append(", '' AS initial")
         sql.append(", ooaza_code AS code")
-        sql.append(f"FROM {self.schema_name}.v_address_list")
-        sql.append(f"WHERE city_code = '{city_code}' AND ooaza_code != '' AND koaza_code = ''")
+        sql.append(f"FROM {self.addressSource()[0]}")
+        sql.append("WHERE city_code = :city_code AND ooaza_code != '' AND koaza_code = ''")
         sql.append("ORDER BY kana")
 
-        model = QSqlQueryModel()
-        model.setQuery(" ".join(sql))
-
-
-        if model.lastError().isValid():
-            QgsMessageLog.logMessage(f"地番検索エラー：{model.lastError().text()}")
-            return None
-
-        return model
+        return self.rememberNames(self.fillInitials(self.selectModel(" ".join(sql), {"city_code": city_code})), city_code)
 
     def getKoazaDataJSyllabary(self, city_code, ooaza_code):
         """
@@ -276,22 +1703,22 @@ class DbUtil:
 
         @return フィールドinitial_group, name, kana, initial, koaza_codeの小字データ
         """
+        tree = self.prefetchTree(city_code)
+        if tree is not None:
+            return self.rememberNames(tree.getKoazaDataJSyllabary(city_code, ooaza_code), city_code, ooaza_code)
+        snapshot = self.lookupSnapshot()
+        if snapshot is not None:
+            return self.rememberNames(snapshot.getKoazaDataJSyllabary(city_code, ooaza_code), city_code, ooaza_code)
+
         sql = []
         sql.append("SELECT distinct header AS initial_group, name, kana")
-        sql.append(REPLACE_INITIAL_WORDS)
+        sql.append(", '' AS initial")
         sql.append(", koaza_code AS code")
-        sql.append(f"FROM {self.schema_name}.v_address_list")
-        sql.append(f"WHERE city_code = '{city_code}' AND ooaza_code ='{ooaza_code}' AND koaza_code != '' AND gaiku_code = ''")
+        sql.append(f"FROM {self.addressSource()[0]}")
+        sql.append("WHERE city_code = :city_code AND ooaza_code = :ooaza_code AND koaza_code != '' AND gaiku_code = ''")
         sql.append("ORDER BY kana")
 
-        model = QSqlQueryModel()
-        model.setQuery(" ".join(sql))
-
-        if model.lastError().isValid():
-            QgsMessageLog.logMessage(f"地番検索エラー：{model.lastError().text()}")
-            return None
-
-        return model
+        return self.rememberNames(self.fillInitials(self.selectModel(" ".join(sql), {"city_code": city_code, "ooaza_code": ooaza_code})), city_code, ooaza_code)
 
     def getGaikuData(self, city_code, ooaza_code, koaza_code):
         """
@@ -302,19 +1729,18 @@ class DbUtil:
 
         @return フィールドheader, name, kana, initial, gaiku_codeの街区データ
         """
+        tree = self.prefetchTree(city_code)
+        if tree is not None:
+            return tree.getGaikuData(city_code, ooaza_code, koaza_code)
+        snapshot = self.lookupSnapshot()
+        if snapshot is not None:
+            return snapshot.getGaikuData(city_code, ooaza_code, koaza_code)
+
         sql = []
         sql.append("SELECT distinct name, gaiku_code AS code")
-        sql.append(f"FROM {self.schema_name}.v_address_list")
-        sql.append(f"WHERE city_code='{city_code}' AND ooaza_code = '{ooaza_code}' AND koaza_code ='{koaza_code}'")
+        sql.append(f"FROM {self.addressSource()[0]}")
+        sql.append("WHERE city_code = :city_code AND ooaza_code = :ooaza_code AND koaza_code = :koaza_code")
         sql.append("AND gaiku_code NOT IN ('', '0') AND setai_name = ''")
         sql.append("ORDER BY gaiku_code")
 
-        model = QSqlQueryModel()
-        model.setQuery(" ".join(sql))
-
-
-        if model.lastError().isValid():
-            QgsMessageLog.logMessage(f"地番検索エラー：{model.lastError().text()}")
-            return None
-
-        return model
+        return self.selectModel(" ".join(sql), {"city_code": city_code, "ooaza_code": ooaza_code, "koaza_code": koaza_code})
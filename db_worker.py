@@ -0,0 +1,265 @@
+"""
+/***************************************************************************
+ db_worker
+                                 A QGIS plugin
+ データベース検索ワーカー
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import threading
+
+from qgis.PyQt.QtCore import pyqtSignal, QThread, QObject, QCoreApplication
+from qgis.PyQt.QtSql import QSqlDatabase, QSqlQuery
+
+from qgis.core import QgsMessageLog
+
+from .db_util import DbUtil, setThreadConnectionName, setThreadSchemaName
+
+
+# サーバー側のキャンセルのSQLの制限時間（ミリ秒）
+CANCEL_TIMEOUT_MS = 1000
+
+
+class DbQueryWorker(QThread):
+    """
+    DbUtilの検索をバックグラウンドスレッドで実行するワーカークラス
+
+    DbUtilの接続プールからスレッド専用のDB接続を取得し、検索結果はシグナルで返却する。
+    接続は一定時間検索がなければ（keep_connectionがFalseの場合は要求がなくなれば）プールに返却し、次の検索時に再接続する。
+    検索要求はチャネル（"city"、"ooaza"など）ごとに管理し、
+    同じチャネルに新しい要求があった場合は古い要求を破棄（実行中ならキャンセル）する
+    """
+    # 検索完了シグナル(チャネル, 結果)
+    resultReady = pyqtSignal(str, object)
+    # 検索失敗シグナル(チャネル, エラーメッセージ)
+    queryFailed = pyqtSignal(str, str)
+
+    # ワーカースレッドからGUIスレッドへの受け渡し用(チャネル, チケット, 結果, エラーメッセージ)
+    _finished = pyqtSignal(str, int, object, str)
+
+    def __init__(self, db_util: DbUtil, parent=None, keep_connection=True):
+        """
+        @param db_util 検索に使用するDbUtil
+        @param parent 親オブジェクト
+        @param keep_connection 要求がなくなっても接続を保持する場合はTrue（画面の検索用）。
+                               Falseの場合は要求がなくなれば接続を返却する（データ準備などの単発の処理用）
+        """
+        super().__init__(parent)
+        self.db_util = db_util
+        self.keep_connection = keep_connection
+
+        self.condition = threading.Condition()
+        # 未実行の要求 チャネル -> (チケット, メソッド名, 引数, 要求時のスキーマ名)
+        self.pending = {}
+        # チャネルごとの最新チケット
+        self.tickets = {}
+        self.next_ticket = 0
+        # 実行中の要求(チャネル, チケット)
+        self.running = None
+        self.stopping = False
+        # ワーカー接続のサーバープロセスID（キャンセル用）
+        self.backend_pid = None
+        # サーバー側でキャンセルしたチケット（キャンセルによるエラーは通知しない）
+        self.cancelled = set()
+        # サーバー側のキャンセルの実行中はTrue（ワーカーは終わるまで次の要求を開始しない）
+        self.cancelling = False
+
+        self._finished.connect(self._deliver)
+
+    def request(self, channel: str, method: str, *args):
+        """
+        検索を要求する
+
+        同じチャネルの未実行の要求は破棄し、実行中の要求はキャンセルする
+        検索は要求時のスキーマで行う（実行までにエリアが変更されても変わらない）
+
+        @param channel チャネル名
+        @param method DbUtilのメソッド名
+        @param args メソッドの引数
+        @return チケット番号
+        """
+        with self.condition:
+            self.next_ticket += 1
+            ticket = self.next_ticket
+            self.tickets[channel] = ticket
+            self.pending.pop(channel, None)
+            self.pending[channel] = (ticket, method, args, self.db_util.schema_name)
+            superseded = self.running if self.running is not None and self.running[0] == channel else None
+            self.condition.notify()
+
+        if superseded is not None:
+            self.cancelBackend(superseded)
+        if not self.isRunning():
+            self.stopping = False
+            self.start()
+        return ticket
+
+    def cancel(self, *channels):
+        """
+        指定チャネルの要求をキャンセルする
+
+        @param channels チャネル名。省略時はすべてのチャネル
+        """
+        with self.condition:
+            if len(channels) == 0:
+                channels = list(self.tickets.keys())
+            for channel in channels:
+                self.pending.pop(channel, None)
+                if channel in self.tickets:
+                    # チケットを進めて実行中の結果を破棄させる
+                    self.next_ticket += 1
+                    self.tickets[channel] = self.next_ticket
+            superseded = self.running if self.running is not None and self.running[0] in channels else None
+
+        if superseded is not None:
+            self.cancelBackend(superseded)
+
+    def forget(self, *channels):
+        """
+        使用しなくなったチャネルの要求をキャンセルし、チャネルのチケットを破棄する
+        （結果表示のモデルなど、インスタンスごとのチャネルの解放時に使用する）
+
+        @param channels チャネル名
+        """
+        self.cancel(*channels)
+        with self.condition:
+            for channel in channels:
+                self.tickets.pop(channel, None)
+
+    def isPending(self, channel: str):
+        """
+        指定チャネルの要求が未完了か判定する
+
+        @param channel チャネル名
+        @return 未完了ならTrue
+        """
+        with self.condition:
+            if channel in self.pending:
+                return True
+            return self.running is not None and self.running == (channel, self.tickets.get(channel))
+
+    def cancelBackend(self, running):
+        """
+        実行中のSQLをサーバー側でキャンセルする
+        ワーカーが既に次の要求を実行している場合はキャンセルしない
+
+        @param running キャンセルする要求(チャネル, チケット)
+        """
+        # 接続を待たないよう、既定の接続が開いていなければキャンセルしない（結果はチケットで破棄する）
+        db = QSqlDatabase.database(QSqlDatabase.defaultConnection, False)
+        if not db.isValid() or not db.isOpen():
+            return
+        with self.condition:
+            if self.running != running or self.backend_pid is None or self.cancelling:
+                return
+            # キャンセルが終わるまでワーカーは次の要求を開始しない（別の要求をキャンセルしないため）
+            self.cancelling = True
+            self.cancelled.add(running[1])
+            backend_pid = int(self.backend_pid)
+
+        # ワーカーを止めないようロックの外で実行し、サーバーの応答が遅い場合も制限時間で打ち切る
+        try:
+            # 制限時間はトランザクション内のみ有効とし、既定の接続の設定を変えない
+            local_timeout = db.transaction()
+            query = QSqlQuery(db)
+            if local_timeout:
+                query.exec(f"SET LOCAL statement_timeout = {CANCEL_TIMEOUT_MS}")
+            query.exec(f"SELECT pg_cancel_backend({backend_pid})")
+            query.finish()
+            if local_timeout:
+                db.commit()
+        finally:
+            with self.condition:
+                self.cancelling = False
+                self.condition.notify_all()
+
+    def stop(self, wait=True):
+        """
+        スレッドを停止する
+
+        @param wait スレッドの終了を待つ場合はTrue。Falseの場合は実行中の要求が終わり次第終了する
+        """
+        self.cancel()
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        if wait:
+            self.wait()
+
+    def run(self):
+        """
+        ワーカースレッド本体
+        """
+        pool = self.db_util.pool
+        try:
+            while True:
+                with self.condition:
+                    while len(self.pending) == 0 and not self.stopping:
+                        if not self.condition.wait(pool.idle_timeout) and len(self.pending) == 0:
+                            # 検索がなければ接続をプールに返却する
+                            self.backend_pid = None
+                            setThreadConnectionName(None)
+                            pool.evictIdle()
+                    if self.stopping:
+                        break
+                    channel = next(iter(self.pending))
+                    ticket, method, args, schema_name = self.pending.pop(channel)
+                    self.running = (channel, ticket)
+                    self.backend_pid = None
+
+                result = None
+                error = ""
+                connection = None
+                if self.db_util.backend is None:
+                    connection = pool.acquire()
+                    if connection is None:
+                        error = "DB接続に失敗しました"
+                if not error:
+                    # ローカルファイルを検索する場合はDB接続を使用しない
+                    if connection is not None:
+                        self.backend_pid = connection.backend_pid
+                        setThreadConnectionName(connection.connection_name)
+                    setThreadSchemaName(schema_name)
+                    try:
+                        result = getattr(self.db_util, method)(*args)
+                    except Exception as e:
+                        error = str(e)
+                    finally:
+                        setThreadSchemaName(None)
+
+                # 結果のモデルはGUIスレッドで使用する
+                if isinstance(result, QObject):
+                    result.moveToThread(QCoreApplication.instance().thread())
+
+                with self.condition:
+                    self.condition.wait_for(lambda: not self.cancelling)
+                    self.running = None
+                    drained = len(self.pending) == 0
+                self._finished.emit(channel, ticket, result, error)
+
+                if drained and not self.keep_connection:
+                    # 次の要求まで接続を他のワーカーが使用できるよう返却する
+                    self.backend_pid = None
+                    setThreadConnectionName(None)
+                    pool.release()
+        finally:
+            self.backend_pid = None
+            setThreadConnectionName(None)
+            pool.release()
+
+    def _deliver(self, channel, ticket, result, error):
+        """
+        検索結果をGUIスレッドで受け取り、最新の要求の結果のみ通知する
+        """
+        cancelled = ticket in self.cancelled
+        self.cancelled.discard(ticket)
+        if self.tickets.get(channel) != ticket or (cancelled and error):
+            # 新しい要求があった（サーバー側でキャンセルした）ため破棄
+            return
+        if error:
+            QgsMessageLog.logMessage(f"地番検索エラー：{error}")
+            self.queryFailed.emit(channel, error)
+            return
+        self.resultReady.emit(channel, result)
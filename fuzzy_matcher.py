@@ -0,0 +1,205 @@
+"""
+/***************************************************************************
+ fuzzy_matcher
+                                 A QGIS plugin
+ 名称のあいまい検索
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+ 市町村・大字・小字の名称とふりがなを、異体字・カタカナ・長音・小書きのかなの違いを
+ 揃えたキーにし、文字の2-gramの索引をスキーマごとにメモリに作成する。
+ 入力と2-gramが共通する名称を索引から集め、編集距離の小さい順に順位付けする
+"""
+import re
+import unicodedata
+from collections import Counter
+
+from .kana_index import KANA_DISC, SMALL_KANA
+
+
+# 異体字・旧字 -> 常用の字体
+ITAIJI = str.maketrans({
+    "髙": "高", "﨑": "崎", "嵜": "崎", "碕": "崎", "嶋": "島", "嶌": "島", "邊": "辺", "邉": "辺",
+    "澤": "沢", "濱": "浜", "濵": "浜", "齋": "斉", "齊": "斉", "斎": "斉", "廣": "広", "國": "国",
+    "圀": "国", "藏": "蔵", "龍": "竜", "櫻": "桜", "瀧": "滝", "榮": "栄", "萬": "万", "會": "会",
+    "德": "徳", "惠": "恵", "條": "条", "來": "来", "當": "当", "壽": "寿", "眞": "真", "豐": "豊",
+    "與": "与", "縣": "県", "關": "関", "鐵": "鉄", "實": "実", "舘": "館", "冨": "富", "埜": "野",
+    "峯": "峰", "嶽": "岳", "莊": "荘", "澁": "渋", "穗": "穂", "靜": "静", "靑": "青", "黑": "黒",
+    "槇": "槙", "檜": "桧", "淵": "渕", "渊": "渕", "鹽": "塩", "驛": "駅", "學": "学", "寳": "宝",
+    "寶": "宝", "戶": "戸", "兒": "児", "杤": "栃", "曾": "曽", "增": "増", "藪": "薮",
+    "籔": "薮", "舩": "船", "乘": "乗", "淺": "浅", "佛": "仏", "拜": "拝",
+    "之": "の", "乃": "の", "ヶ": "ケ", "ヵ": "カ",
+})
+
+# ひらがな -> 母音（長音記号を前のかなの母音に置き換える。「ん」は母音なし）
+KANA_VOWEL = {kana: vowel for kanas in KANA_DISC.values() if len(kanas) == 5 for kana, vowel in zip(kanas, "あいうえお")}
+KANA_VOWEL.update({"や": "あ", "ゆ": "う", "よ": "お", "わ": "あ", "を": "お"})
+
+# 長音記号（NFKC変換後）
+LONG_VOWEL_PATTERN = re.compile(r"[ーｰ―‐-]")
+
+# n-gramの長さ
+NGRAM_SIZE = 2
+
+# この件数以下に絞り込めた場合は索引を使わずにすべて比較する
+SCAN_LIMIT = 2000
+
+# 編集距離を求める候補の数（2-gramの共通数の多い順）
+CANDIDATE_LIMIT = 300
+
+
+def foldName(text):
+    """
+    名称・ふりがなの比較用のキーを作成する
+    NFKCで全角・半角を揃え、異体字を常用の字体に、カタカナをひらがなに、
+    小書きのかなを通常のかなに、長音記号を前のかなの母音に置き換え、空白を除く
+
+    @param text 名称またはふりがな
+    @return キー
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", str(text)).translate(ITAIJI)
+    chars = []
+    for char in text:
+        if char.isspace():
+            continue
+        if "ァ" <= char <= "ヶ":
+            char = chr(ord(char) - 0x60)
+        char = char.translate(SMALL_KANA)
+        if LONG_VOWEL_PATTERN.match(char) and len(chars) > 0:
+            # 濁音・半濁音は清音の母音
+            base = unicodedata.normalize("NFD", chars[-1])[0]
+            char = KANA_VOWEL.get(base, char)
+        chars.append(char)
+    return "".join(chars)
+
+
+def nGrams(key):
+    """
+    キーの文字のn-gramを求める（先頭と末尾に区切りを加える）
+
+    @param key foldNameで作成したキー
+    @return n-gramの集合
+    """
+    padded = f"\x02{key}\x03"
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+def editDistance(a, b, limit):
+    """
+    2つの文字列の編集距離（挿入・削除・置換の回数）を求める
+
+    @param a 文字列
+    @param b 文字列
+    @param limit この値を超える場合は計算を打ち切る
+    @return 編集距離。limitを超える場合はlimit + 1
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class FuzzyNameIndex:
+    """
+    市町村・大字・小字の名称とふりがなのあいまい検索用の索引
+
+    名称・ふりがなのキーの2-gramごとに項目番号のリストを保持する。
+    親の階層で絞り込む場合、配下の項目がSCAN_LIMIT件以下であれば索引を使わずにすべて比較する
+    """
+    def __init__(self, rows):
+        """
+        @param rows (市町村コード, 大字コード, 小字コード, 名称, ふりがな, X座標, Y座標)のリスト
+        """
+        # 項目 -> (市町村コード, 大字コード, 小字コード, 名称, ふりがな, X座標, Y座標)
+        self.entries = []
+        # 項目 -> (名称のキー, ふりがなのキー)
+        self.keys = []
+        # 2-gram -> 項目番号のリスト
+        self.postings = {}
+        # 項目 -> 階層（市町村は1、大字は2、小字は3）
+        self.depths = []
+        # (親の階層のコード) -> 項目番号のリスト
+        self.children = {}
+
+        for row in rows:
+            city_code, ooaza_code, koaza_code = (value or "" for value in row[:3])
+            number = len(self.entries)
+            self.entries.append((city_code, ooaza_code, koaza_code) + tuple(row[3:7]))
+            name_key, kana_key = foldName(row[3]), foldName(row[4])
+            self.keys.append((name_key, kana_key))
+            for gram in nGrams(name_key) | (nGrams(kana_key) if kana_key else set()):
+                self.postings.setdefault(gram, []).append(number)
+            codes = (city_code, ooaza_code, koaza_code)
+            depth = codes.index("") if "" in codes else 3
+            self.depths.append(depth)
+            self.children.setdefault(codes[:depth - 1], []).append(number)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def candidates(self, grams, parent_codes):
+        """
+        入力と2-gramが共通する項目を共通数の多い順に取得する
+
+        @param grams 入力の2-gram
+        @param parent_codes 親の階層のコード（Noneの場合はすべての階層）
+        @return 項目番号のリスト
+        """
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.postings.get(gram, ()))
+        if parent_codes is None:
+            return [number for number, _ in counts.most_common(CANDIDATE_LIMIT)]
+        depth = len(parent_codes)
+        numbers = [number for number, _ in counts.most_common()
+                   if self.depths[number] == depth + 1 and self.entries[number][:depth] == parent_codes]
+        return numbers[:CANDIDATE_LIMIT]
+
+    def search(self, text, parent_codes=None, limit=20, max_distance=None):
+        """
+        名称・ふりがなが入力に近い項目を編集距離の小さい順に取得する
+        入力が名称・ふりがなの先頭と一致する場合も候補とする
+
+        @param text 入力
+        @param parent_codes 親の階層のコードのタプル（市町村の場合は()、大字の場合は(市町村コード,)）。
+                            Noneの場合はすべての階層
+        @param limit 取得する最大件数
+        @param max_distance 許容する編集距離。省略時は入力の長さの1/3（最低1）
+        @return (項目, 編集距離)のリスト。項目は(市町村コード, 大字コード, 小字コード, 名称, ふりがな, X座標, Y座標)
+        """
+        key = foldName(text)
+        if not key:
+            return []
+        if max_distance is None:
+            max_distance = max(1, len(key) // 3)
+        if parent_codes is not None:
+            parent_codes = tuple(parent_codes)
+
+        numbers = self.children.get(parent_codes) if parent_codes is not None else None
+        if numbers is None or len(numbers) > SCAN_LIMIT:
+            numbers = self.candidates(nGrams(key), parent_codes)
+
+        results = []
+        for number in numbers:
+            distance = max_distance + 1
+            for entry_key in self.keys[number]:
+                if not entry_key:
+                    continue
+                distance = min(distance,
+                               editDistance(key, entry_key, max_distance),
+                               # 先頭の一致（入力途中）は完全一致より少し下げる
+                               editDistance(key, entry_key[:len(key)], max_distance) + 0.5)
+            if distance <= max_distance:
+                results.append((distance, number))
+        results.sort(key=lambda result: (result[0], self.keys[result[1]][0]))
+        return [(self.entries[number], distance) for distance, number in results[:limit]]
@@ -0,0 +1,296 @@
+"""
+/***************************************************************************
+ hierarchy_snapshot
+                                 A QGIS plugin
+ 行政区画階層のローカルスナップショット
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .result_model import ResultTableModel
+
+
+# スナップショットの形式。変更した場合は既存のスナップショットを再作成する
+SNAPSHOT_VERSION = "3"
+
+# スナップショット対象の行（市町村、大字、小字、街区）を抽出する条件
+HIERARCHY_CONDITION = "(ooaza_code = '' OR koaza_code = '' OR gaiku_code = '' OR (chiban = '' AND setai_name = ''))"
+
+# 地番の行の街区を抽出する条件（街区の行がない街区もスナップショットに加える）
+CHIBAN_GAIKU_CONDITION = "chiban != '' AND setai_name = '' AND gaiku_code NOT IN ('', '0')"
+
+# スナップショットの列
+HIERARCHY_FIELDS = ["city_code", "ooaza_code", "koaza_code", "gaiku_code", "name", "kana", "header", "initial", "x", "y"]
+
+
+class HierarchySnapshot:
+    """
+    スキーマごとの市町村、大字、小字、街区の階層データをSQLiteファイルに保持するクラス
+
+    一度サーバーから作成すれば、以降のコンボボックスや字選択ダイアログのリストは
+    ローカルのファイルから作成する。サーバーとの整合は更新の統計による署名で確認し、
+    署名が変わった場合は階層データのハッシュが変わっていれば作成し直す
+    """
+    def __init__(self, path: str):
+        """
+        @param path スナップショットファイルのパス
+        """
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = None
+        # サーバーとの整合を確認した時刻
+        self.validated_at = None
+
+    @staticmethod
+    def snapshotPath(cache_dir: str, database_key: str, schema_name: str):
+        """
+        スナップショットファイルのパスを作成する
+
+        @param cache_dir 保存先ディレクトリ
+        @param database_key 接続先DBを識別する文字列
+        @param schema_name スキーマ名
+        @return ファイルパス
+        """
+        file_name = re.sub(r"[^0-9A-Za-z_.-]", "_", f"{database_key}_{schema_name}") + ".sqlite"
+        return os.path.join(cache_dir, file_name)
+
+    def open(self):
+        """
+        スナップショットファイルを開く
+
+        @return 作成済みのスナップショットがあればTrue
+        """
+        with self.lock:
+            if self.conn is None:
+                if not os.path.exists(self.path):
+                    return False
+                try:
+                    self.conn = sqlite3.connect(self.path, check_same_thread=False)
+                    if self.meta("version") != SNAPSHOT_VERSION:
+                        self.close()
+                        return False
+                except sqlite3.Error:
+                    self.close()
+                    return False
+            return True
+
+    def close(self):
+        """
+        スナップショットファイルを閉じる
+        """
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def isOpen(self):
+        """
+        スナップショットを使用できるか判定する
+        """
+        return self.conn is not None
+
+    def needsValidation(self, interval: int):
+        """
+        サーバーとの整合確認が必要か判定する
+
+        @param interval 確認間隔（秒）
+        @return 確認が必要な場合はTrue
+        """
+        return self.validated_at is None or time.time() - self.validated_at >= interval
+
+    def setValidated(self):
+        """
+        サーバーとの整合を確認済みとする
+        """
+        self.validated_at = time.time()
+
+    def meta(self, key: str):
+        """
+        管理情報を取得する
+
+        @param key キー
+        @return 値。未設定の場合はNone
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def signature(self):
+        """
+        作成時のサーバーの署名を取得する
+        """
+        if not self.open():
+            return None
+        return self.meta("signature")
+
+    def contentHash(self):
+        """
+        作成時の階層データのハッシュを取得する
+        """
+        if not self.open():
+            return None
+        return self.meta("content_hash")
+
+    def setSignature(self, signature: str):
+        """
+        サーバーの署名を更新し、整合を確認済みとする（階層データが変わっていない場合）
+
+        @param signature サーバーの署名
+        """
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (signature,))
+            self.conn.commit()
+        self.setValidated()
+
+    def build(self, rows, signature: str, content_hash=None):
+        """
+        階層データからスナップショットを作成する
+        一時ファイルに作成してから置き換えるため、作成中も以前のスナップショットは使用できる
+
+        @param rows HIERARCHY_FIELDSの順の行データ
+        @param signature サーバーの署名
+        @param content_hash 階層データのハッシュ
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE hierarchy (city_code TEXT, ooaza_code TEXT, koaza_code TEXT, gaiku_code TEXT,"
+                " name TEXT, kana TEXT, header TEXT, initial TEXT, x REAL, y REAL)")
+            conn.executemany(f"INSERT INTO hierarchy VALUES ({', '.join('?' * len(HIERARCHY_FIELDS))})", rows)
+            conn.execute("CREATE INDEX hierarchy_code_idx ON hierarchy (city_code, ooaza_code, koaza_code, gaiku_code)")
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("version", SNAPSHOT_VERSION),
+                ("signature", signature),
+                ("content_hash", content_hash),
+                ("created_at", str(int(time.time()))),
+            ])
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self.lock:
+            self.close()
+            os.replace(tmp_path, self.path)
+            self.open()
+            self.setValidated()
+
+    def select(self, sql: str, params=()):
+        """
+        スナップショットを検索し、結果をデータモデルとして取得する
+
+        @param sql SQL
+        @param params バインドする値
+        @return データモデル
+        """
+        with self.lock:
+            cursor = self.conn.execute(sql, params)
+            fields = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+        return ResultTableModel(fields, rows)
+
+    def selectValue(self, sql: str, params=()):
+        """
+        スナップショットを検索し、先頭行の先頭列の値を取得する
+
+        @param sql SQL
+        @param params バインドする値
+        @return 値。該当なしの場合はNone
+        """
+        with self.lock:
+            row = self.conn.execute(sql, params).fetchone()
+        return row[0] if row else None
+
+    def getCityRows(self, city_code):
+        """
+        市町村配下の階層データ(HIERARCHY_FIELDSの順の行データ)
+        """
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT {', '.join(HIERARCHY_FIELDS)} FROM hierarchy WHERE city_code = ?",
+                (city_code,)).fetchall()
+
+    def getCityModel(self):
+        """市町村情報"""
+        return self.select(
+            "SELECT name, city_code AS code, x, y FROM hierarchy"
+            " WHERE ooaza_code = '' ORDER BY code")
+
+    def getOoazaModel(self, city_code):
+        """大字情報"""
+        return self.select(
+            "SELECT name, ooaza_code AS code, x, y FROM hierarchy"
+            " WHERE city_code = ? AND ooaza_code != '' AND koaza_code = '' ORDER BY code",
+            (city_code,))
+
+    def getKoazaModel(self, city_code, ooaza_code):
+        """小字情報"""
+        return self.select(
+            "SELECT DISTINCT name, koaza_code AS code, x, y FROM hierarchy"
+            " WHERE city_code = ? AND ooaza_code = ? AND koaza_code != '' AND gaiku_code = '' ORDER BY code",
+            (city_code, ooaza_code))
+
+    def getGaikuModel(self, city_code, ooaza_code, koaza_code):
+        """街区情報"""
+        return self.select(
+            "SELECT DISTINCT name, gaiku_code AS code, x, y FROM hierarchy"
+            " WHERE city_code = ? AND ooaza_code = ? AND koaza_code = ? AND gaiku_code != '' ORDER BY code",
+            (city_code, ooaza_code, koaza_code))
+
+    def getCityName(self, city_code):
+        """市町村名"""
+        return self.selectValue(
+            "SELECT name FROM hierarchy WHERE city_code = ? AND ooaza_code = ''",
+            (city_code,))
+
+    def getOoazaName(self, city_code, ooaza_code):
+        """大字名"""
+        return self.selectValue(
+            "SELECT name FROM hierarchy WHERE city_code = ? AND ooaza_code = ? AND koaza_code = ''",
+            (city_code, ooaza_code))
+
+    def getKoazaName(self, city_code, ooaza_code, koaza_code):
+        """小字名"""
+        return self.selectValue(
+            "SELECT name FROM hierarchy WHERE city_code = ? AND ooaza_code = ? AND koaza_code = ? AND gaiku_code = ''",
+            (city_code, ooaza_code, koaza_code))
+
+    def getCityDataJSyllabary(self):
+        """50音順の市町村データ"""
+        return self.select(
+            "SELECT DISTINCT header AS initial_group, name, kana, initial, city_code AS code FROM hierarchy"
+            " WHERE city_code NOT IN ('', '0') AND ooaza_code = '' ORDER BY kana")
+
+    def getOoazaDataJSyllabary(self, city_code):
+        """50音順の大字データ"""
+        return self.select(
+            "SELECT DISTINCT header AS initial_group, name, kana, initial, ooaza_code AS code FROM hierarchy"
+            " WHERE city_code = ? AND ooaza_code != '' AND koaza_code = '' ORDER BY kana",
+            (city_code,))
+
+    def getKoazaDataJSyllabary(self, city_code, ooaza_code):
+        """50音順の小字データ"""
+        return self.select(
+            "SELECT DISTINCT header AS initial_group, name, kana, initial, koaza_code AS code FROM hierarchy"
+            " WHERE city_code = ? AND ooaza_code = ? AND koaza_code != '' AND gaiku_code = '' ORDER BY kana",
+            (city_code, ooaza_code))
+
+    def getGaikuData(self, city_code, ooaza_code, koaza_code):
+        """街区データ"""
+        return self.select(
+            "SELECT DISTINCT name, gaiku_code AS code FROM hierarchy"
+            " WHERE city_code = ? AND ooaza_code = ? AND koaza_code = ? AND gaiku_code NOT IN ('', '0')"
+            " ORDER BY gaiku_code",
+            (city_code, ooaza_code, koaza_code))
@@ -0,0 +1,99 @@
+"""
+/***************************************************************************
+ kana_index
+                                 A QGIS plugin
+ 50音索引
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import unicodedata
+
+
+# 行とかなの辞書
+KANA_DISC = {"あ":"あいうえお", "か":"かきくけこ", "さ":"さしすせそ", "た":"たちつてと", "な":"なにぬねの", "は":"はひふへほ", "ま":"まみむめも", "や":"やゆよ", "ら":"らりるれろ", "わ":"わをん"}
+
+# かな -> 行
+KANA_GYO = {kana: gyo for gyo, kanas in KANA_DISC.items() for kana in kanas}
+
+# 小書きのかな、旧かなを50音のかなに置き換える
+SMALL_KANA = str.maketrans("ぁぃぅぇぉっゃゅょゎゕゖゐゑ", "あいうえおつやゆよわかけいえ")
+
+
+def kanaInitial(kana):
+    """
+    ふりがなの頭文字を50音のかなで取得する
+    カタカナ・半角カナはひらがなに、濁音・半濁音・小書きのかなは清音に置き換える
+
+    @param kana ふりがな
+    @return 頭文字。50音のかなでない場合は空文字
+    """
+    if not kana:
+        return ""
+    # NFKCで半角カナを全角に、NFDで濁点・半濁点を分解する
+    char = unicodedata.normalize("NFD", unicodedata.normalize("NFKC", str(kana)[0]))[0]
+    if "ァ" <= char <= "ヶ":
+        char = chr(ord(char) - 0x60)
+    char = char.translate(SMALL_KANA)
+    return char if char in KANA_GYO else ""
+
+
+class KanaIndex:
+    """
+    50音順データモデルの行を、行（あ、か、さ…）と頭文字ごとにまとめた索引
+
+    データモデルの読み込み時に一度だけ作成し、
+    かな行段ボタンの使用可否とフィルターの対象行を索引から求める
+    """
+    def __init__(self, model=None):
+        """
+        @param model kana列を持つデータモデル。省略時は空の索引
+        """
+        # 行 -> 行番号の集合
+        self.gyo_rows = {}
+        # 頭文字 -> 行番号の集合
+        self.initial_rows = {}
+        self.row_count = 0
+
+        if model is None:
+            return
+        kana_column = model.fieldIndex("kana")
+        if kana_column < 0:
+            return
+
+        gyo_rows = {}
+        initial_rows = {}
+        for row, values in enumerate(model.rows):
+            initial = kanaInitial(values[kana_column])
+            if initial == "":
+                continue
+            initial_rows.setdefault(initial, []).append(row)
+            gyo_rows.setdefault(KANA_GYO[initial], []).append(row)
+        self.gyo_rows = {gyo: frozenset(rows) for gyo, rows in gyo_rows.items()}
+        self.initial_rows = {initial: frozenset(rows) for initial, rows in initial_rows.items()}
+        self.row_count = len(model.rows)
+
+    def hasGyo(self, gyo):
+        """
+        指定の行に該当する行があるか判定する
+        """
+        return gyo in self.gyo_rows
+
+    def hasInitial(self, kana):
+        """
+        指定の頭文字に該当する行があるか判定する
+        """
+        return kana in self.initial_rows
+
+    def rowsOfGyo(self, gyo):
+        """
+        指定の行に該当する行番号の集合
+        """
+        return self.gyo_rows.get(gyo, frozenset())
+
+    def rowsOfInitial(self, kana):
+        """
+        指定の頭文字に該当する行番号の集合
+        """
+        return self.initial_rows.get(kana, frozenset())
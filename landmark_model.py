@@ -0,0 +1,25 @@
+"""
+/***************************************************************************
+ landmark_model
+                                 A QGIS plugin
+ ランドマーク検索結果データモデル
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+from .result_model import PagedResultModel
+
+
+class LandmarkResultModel(PagedResultModel):
+    """
+    ランドマーク検索結果をページ単位で取得するテーブルモデル
+
+    検索条件はDbUtil.getLandmarkPageの(カテゴリ, 名称またはふりがな, 市町村コード)。
+    順位の式で並べ替えるため、続きは取得済みの行数から取得する（OFFSET方式）
+    """
+    channel_prefix = "landmark"
+    page_method = "getLandmarkPage"
+
+    def pageArgs(self):
+        return (len(self.rows),)
@@ -0,0 +1,110 @@
+"""
+/***************************************************************************
+ name_cache
+                                 A QGIS plugin
+ 市町村・大字・小字名のキャッシュ
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import threading
+from collections import OrderedDict
+
+
+class NameCache:
+    """
+    (スキーマ名, 市町村コード, 大字コード, 小字コード)をキーに名称を保持するLRUキャッシュ
+
+    上限件数を超えた場合は最も古く参照されたものから破棄する。
+    ワーカースレッドとGUIスレッドの双方から使用するため排他制御を行う
+    """
+    def __init__(self, max_size=4096):
+        """
+        @param max_size 保持する最大件数
+        """
+        self.max_size = max_size
+        self.names = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def makeKey(schema_name, city_code, ooaza_code="", koaza_code=""):
+        """
+        キャッシュのキーを作成する
+
+        @param schema_name スキーマ名
+        @param city_code 市町村コード
+        @param ooaza_code 大字コード（市町村名の場合は空文字）
+        @param koaza_code 小字コード（市町村名・大字名の場合は空文字）
+        @return キー
+        """
+        return (schema_name, city_code, ooaza_code or "", koaza_code or "")
+
+    def get(self, key):
+        """
+        名称を取得する
+
+        @param key キー
+        @return 名称。未保持の場合はNone
+        """
+        with self.lock:
+            name = self.names.get(key)
+            if name is None:
+                self.misses += 1
+                return None
+            self.names.move_to_end(key)
+            self.hits += 1
+            return name
+
+    def put(self, key, name):
+        """
+        名称を保持する
+
+        @param key キー
+        @param name 名称
+        """
+        if name is None or self.max_size <= 0:
+            return
+        with self.lock:
+            self.names[key] = str(name)
+            self.names.move_to_end(key)
+            while len(self.names) > self.max_size:
+                self.names.popitem(last=False)
+
+    def putModel(self, model, schema_name, *parent_codes):
+        """
+        name、code列を持つデータモデルの名称をまとめて保持する
+
+        @param model データモデル
+        @param schema_name スキーマ名
+        @param parent_codes 上位のコード（市町村の場合はなし、大字の場合は市町村コード、小字の場合は市町村・大字コード）
+        """
+        if model is None:
+            return
+        name_column = model.fieldIndex("name")
+        code_column = model.fieldIndex("code")
+        if name_column < 0 or code_column < 0:
+            return
+        for row in model.rows:
+            if row[code_column]:
+                self.put(self.makeKey(schema_name, *parent_codes, row[code_column]), row[name_column])
+
+    def clear(self):
+        """
+        保持している名称と統計を破棄する
+        """
+        with self.lock:
+            self.names.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        キャッシュの統計を取得する
+
+        @return ヒット数、ミス数、保持件数の辞書
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.names)}
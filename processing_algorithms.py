@@ -0,0 +1,451 @@
+"""
+/***************************************************************************
+ processing_algorithms
+                                 A QGIS plugin
+ プロセッシングのアルゴリズム
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+ 住宅地図検索の検索（階層の一覧、地番の一括検索、座標からの逆検索）を
+ プロセッシングツールボックス・モデラー・qgis_processから実行できるようにする。
+ 検索はDbUtilの検索をそのまま使用し、地物はchunk_size件ずつ検索して出力先に書き込む
+"""
+import sqlite3
+
+from qgis.PyQt.QtCore import QVariant
+
+from qgis.core import (
+    QgsCoordinateTransform,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsPointXY,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterCrs,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterField,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
+    QgsWkbTypes,
+)
+
+from .batch_geocoder import BatchGeocoder, ReverseGeocoder
+from .db_backend import SqliteBackend
+from .db_conf_dialog import DbConfDialog
+from .db_util import DbUtil, confSettings, plainValue, setThreadConnectionName
+
+
+# 地物をまとめて検索する件数の既定値
+DEFAULT_CHUNK_SIZE = 5000
+
+# 階層の一覧で選択できる階層（名称、指定が必要な親のコードのパラメータ）
+HIERARCHY_LEVELS = [
+    ("市町村", []),
+    ("大字", ["CITY_CODE"]),
+    ("小字", ["CITY_CODE", "OOAZA_CODE"]),
+    ("街区", ["CITY_CODE", "OOAZA_CODE", "KOAZA_CODE"]),
+]
+
+
+class AlgorithmDatabase:
+    """
+    アルゴリズムの実行中に使用するDbUtil
+
+    アルゴリズムはプロセッシングのスレッドで実行されるため、設定ファイルの[DB] local_fileが
+    指定されていればローカルファイルを、そうでなければ接続プールからこのスレッド用の接続を取得して検索する。
+    with文で使用し、終了時に接続を返却する
+    """
+    def __init__(self, schema_name, feedback):
+        """
+        @param schema_name 検索するエリアのスキーマ名（空の場合、エリアが1つだけならそのエリア）
+        @param feedback プロセッシングのフィードバック
+        """
+        self.schema_name = schema_name
+        self.feedback = feedback
+        self.db_util = None
+
+    def __enter__(self):
+        db_util = DbUtil()
+        self.db_util = db_util
+        path = confSettings().value("DB/local_file", "", type=str)
+        if path:
+            try:
+                db_util.setBackend(SqliteBackend(path))
+            except (OSError, sqlite3.Error) as e:
+                raise QgsProcessingException(f"ローカルファイルを開けません {path} {e}")
+            db_util.use_snapshot = False
+            self.feedback.pushInfo(f"ローカルファイルを検索します {path}")
+        else:
+            params = DbConfDialog.connectionSettings()
+            if DbConfDialog.hasConnectionSettings(params):
+                db_util.pool.setParameters(params)
+            connection = db_util.pool.acquire()
+            if connection is None:
+                raise QgsProcessingException("DBに接続できません。設定ファイルのDB接続情報を確認してください")
+            setThreadConnectionName(connection.connection_name)
+
+        try:
+            schema_names = db_util.getSchemaNames() or []
+            schema_name = self.schema_name
+            if not schema_name and len(schema_names) == 1:
+                schema_name = schema_names[0]
+            if schema_name not in schema_names:
+                raise QgsProcessingException(f"エリア({schema_name})がありません。エリア: {', '.join(schema_names)}")
+            db_util.setSchema(schema_name)
+        except Exception:
+            # 例外時は__exit__が呼ばれないため、ここで接続を返却する
+            self.close()
+            raise
+        return db_util
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        ローカルファイルを閉じる、または接続を返却する
+        """
+        if self.db_util.backend is not None:
+            self.db_util.setBackend(None)
+        else:
+            setThreadConnectionName(None)
+            self.db_util.pool.release()
+
+
+def pointFeature(fields, attributes, x, y):
+    """
+    点の地物を作成する
+
+    @param fields 属性の定義
+    @param attributes 属性値のリスト
+    @param x X座標（Noneの場合はジオメトリなし）
+    @param y Y座標
+    @return 地物
+    """
+    feature = QgsFeature(fields)
+    feature.setAttributes(attributes)
+    if x is not None and y is not None:
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(float(x), float(y))))
+    return feature
+
+
+def fieldText(feature, field_name):
+    """
+    地物の属性値を文字列で取得する
+
+    @param feature 地物
+    @param field_name 属性名（空の場合は空文字）
+    @return 属性値。NULLの場合は空文字
+    """
+    if not field_name:
+        return ""
+    value = plainValue(feature[field_name])
+    return "" if value is None else str(value)
+
+
+class SearchZmapAlgorithm(QgsProcessingAlgorithm):
+    """
+    住宅地図検索のアルゴリズムの共通部分
+    """
+    AREA = "AREA"
+    CRS = "CRS"
+    CHUNK_SIZE = "CHUNK_SIZE"
+    OUTPUT = "OUTPUT"
+
+    def group(self):
+        return "住宅地図検索"
+
+    def groupId(self):
+        return "search_zmap"
+
+    def createInstance(self):
+        return type(self)()
+
+    def addAreaParameter(self):
+        """
+        エリア（スキーマ名）のパラメータを追加する
+        """
+        self.addParameter(QgsProcessingParameterString(
+            self.AREA, "エリア（スキーマ名。エリアが1つの場合は省略可）", optional=True))
+
+    def addChunkSizeParameter(self):
+        """
+        まとめて検索する件数のパラメータを追加する
+        """
+        self.addParameter(QgsProcessingParameterNumber(
+            self.CHUNK_SIZE, "まとめて検索する件数", QgsProcessingParameterNumber.Integer,
+            defaultValue=DEFAULT_CHUNK_SIZE, minValue=1))
+
+    def addCrsParameter(self):
+        """
+        住所データの座標系のパラメータを追加する
+        """
+        self.addParameter(QgsProcessingParameterCrs(self.CRS, "住所データの座標系", defaultValue="ProjectCrs"))
+
+    def processChunks(self, source, chunk_size, feedback, flush):
+        """
+        入力の地物をchunk_size件ずつ処理する
+        キャンセルされた場合は処理中のまとまりまでで終了する
+
+        @param source 入力
+        @param chunk_size まとめて処理する件数
+        @param feedback プロセッシングのフィードバック
+        @param flush 地物のリストを引数に呼び出す関数
+        @return 処理した件数
+        """
+        total = source.featureCount()
+        count = 0
+        chunk = []
+        for feature in source.getFeatures():
+            if feedback.isCanceled():
+                break
+            chunk.append(feature)
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                count += len(chunk)
+                chunk = []
+                if total > 0:
+                    feedback.setProgress(count * 100 / total)
+        if len(chunk) > 0 and not feedback.isCanceled():
+            flush(chunk)
+            count += len(chunk)
+        return count
+
+    def database(self, parameters, context, feedback):
+        """
+        アルゴリズムの実行中に使用するDbUtilを作成する
+
+        @return AlgorithmDatabase
+        """
+        return AlgorithmDatabase(self.parameterAsString(parameters, self.AREA, context).strip(), feedback)
+
+
+class HierarchyLookupAlgorithm(SearchZmapAlgorithm):
+    """
+    市町村・大字・小字・街区の一覧を代表点の地物として出力する
+    """
+    LEVEL = "LEVEL"
+    CITY_CODE = "CITY_CODE"
+    OOAZA_CODE = "OOAZA_CODE"
+    KOAZA_CODE = "KOAZA_CODE"
+
+    def name(self):
+        return "hierarchylookup"
+
+    def displayName(self):
+        return "階層の一覧"
+
+    def shortHelpString(self):
+        return ("指定した階層（市町村、大字、小字、街区）の一覧を代表点の地物として出力します。\n"
+                "大字以下は親の階層のコードを指定してください。")
+
+    def initAlgorithm(self, config=None):
+        self.addAreaParameter()
+        self.addParameter(QgsProcessingParameterEnum(
+            self.LEVEL, "階層", options=[level[0] for level in HIERARCHY_LEVELS], defaultValue=0))
+        self.addParameter(QgsProcessingParameterString(self.CITY_CODE, "市町村コード", optional=True))
+        self.addParameter(QgsProcessingParameterString(self.OOAZA_CODE, "大字コード", optional=True))
+        self.addParameter(QgsProcessingParameterString(self.KOAZA_CODE, "小字コード", optional=True))
+        self.addCrsParameter()
+        self.addChunkSizeParameter()
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, "階層", QgsProcessing.TypeVectorPoint))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        level_name, code_parameters = HIERARCHY_LEVELS[self.parameterAsEnum(parameters, self.LEVEL, context)]
+        parent_codes = [self.parameterAsString(parameters, name, context).strip() for name in code_parameters]
+        if not all(parent_codes):
+            raise QgsProcessingException(f"{level_name}の一覧には親の階層のコードが必要です")
+
+        fields = QgsFields()
+        for name in ("city_code", "ooaza_code", "koaza_code", "gaiku_code", "name"):
+            fields.append(QgsField(name, QVariant.String))
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, fields, QgsWkbTypes.Point,
+                                             self.parameterAsCrs(parameters, self.CRS, context))
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        with self.database(parameters, context, feedback) as db_util:
+            methods = [db_util.getCityModel, db_util.getOoazaModel, db_util.getKoazaModel, db_util.getGaikuModel]
+            model = methods[len(parent_codes)](*parent_codes)
+        if model is None:
+            raise QgsProcessingException(f"{level_name}の一覧を取得できません")
+
+        # 取得した一覧をchunk_size件ずつ出力する（キャンセルされた場合は出力済みまでで終了する）
+        chunk_size = self.parameterAsInt(parameters, self.CHUNK_SIZE, context)
+        padding = [""] * (3 - len(parent_codes))
+        total = model.rowCount()
+        count = 0
+        features = []
+        for row in range(total):
+            if feedback.isCanceled():
+                break
+            codes = parent_codes + [model.value(row, "code")] + padding
+            features.append(pointFeature(fields, codes + [model.value(row, "name")],
+                                         model.value(row, "x"), model.value(row, "y")))
+            if len(features) >= chunk_size or row == total - 1:
+                sink.addFeatures(features, QgsFeatureSink.FastInsert)
+                count += len(features)
+                features = []
+                feedback.setProgress(count * 100 / total)
+        feedback.pushInfo(f"{level_name} {count}件")
+        return {self.OUTPUT: dest_id}
+
+
+class ChibanGeocodeAlgorithm(SearchZmapAlgorithm):
+    """
+    属性テーブルの住所（市町村～地番の列、または住所の列）を検索して点の地物を出力する
+    """
+    INPUT = "INPUT"
+    COLUMNS = ["city", "ooaza", "koaza", "gaiku", "chiban", "address"]
+    COLUMN_NAMES = {
+        "city": "市町村の列",
+        "ooaza": "大字の列",
+        "koaza": "小字の列",
+        "gaiku": "街区の列",
+        "chiban": "地番の列",
+        "address": "住所の列（市町村の列がない場合）",
+    }
+
+    def name(self):
+        return "geocodechiban"
+
+    def displayName(self):
+        return "住所の一括検索"
+
+    def shortHelpString(self):
+        return ("入力の属性の住所を検索し、座標（x, y）、一致レベル（match_level）、一致した住所（matched_address）を加えた"
+                "点の地物を出力します。\n市町村～地番を別々の列で指定するか、住所を1つの列で指定してください。"
+                "地番が見つからない場合は一致した最も下の階層の代表点を出力します。")
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.INPUT, "入力", [QgsProcessing.TypeVector]))
+        for column in self.COLUMNS:
+            self.addParameter(QgsProcessingParameterField(
+                column.upper(), self.COLUMN_NAMES[column], parentLayerParameterName=self.INPUT, optional=True))
+        self.addAreaParameter()
+        self.addCrsParameter()
+        self.addChunkSizeParameter()
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, "検索結果", QgsProcessing.TypeVectorPoint))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        columns = {column: self.parameterAsString(parameters, column.upper(), context) for column in self.COLUMNS}
+        if not columns["city"] and not columns["address"]:
+            raise QgsProcessingException("市町村の列または住所の列を指定してください")
+        chunk_size = self.parameterAsInt(parameters, self.CHUNK_SIZE, context)
+
+        fields = QgsFields(source.fields())
+        fields.append(QgsField("x", QVariant.Double))
+        fields.append(QgsField("y", QVariant.Double))
+        fields.append(QgsField("match_level", QVariant.String))
+        fields.append(QgsField("matched_address", QVariant.String))
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, fields, QgsWkbTypes.Point,
+                                             self.parameterAsCrs(parameters, self.CRS, context))
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        levels = {}
+        with self.database(parameters, context, feedback) as db_util:
+            geocoder = BatchGeocoder(db_util, chunk_size)
+
+            def flush(chunk):
+                rows = [{column: fieldText(feature, name) for column, name in columns.items()} for feature in chunk]
+                features = []
+                for feature, (x, y, level, address) in zip(chunk, geocoder.geocode(rows)):
+                    levels[level] = levels.get(level, 0) + 1
+                    features.append(pointFeature(fields, feature.attributes() + [x, y, level, address], x, y))
+                sink.addFeatures(features, QgsFeatureSink.FastInsert)
+
+            self.processChunks(source, chunk_size, feedback, flush)
+
+        feedback.pushInfo(" ".join(f"{level} {levels[level]}件" for level in sorted(levels)))
+        return {self.OUTPUT: dest_id}
+
+
+class ReverseLookupAlgorithm(SearchZmapAlgorithm):
+    """
+    点の地物に最も近い地番の住所を属性に加えて出力する
+    """
+    INPUT = "INPUT"
+    MAX_DISTANCE = "MAX_DISTANCE"
+
+    def name(self):
+        return "reverselookup"
+
+    def displayName(self):
+        return "座標から地番の逆検索"
+
+    def shortHelpString(self):
+        return ("入力の点から最大距離以内で最も近い地番（地番の図形の重心）を探し、住所（address）、地番（chiban）、"
+                "各階層のコードと距離（distance）を属性に加えて出力します。\n"
+                "最大距離は住所データの座標系の単位で指定してください。")
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.INPUT, "入力", [QgsProcessing.TypeVectorPoint]))
+        self.addAreaParameter()
+        self.addCrsParameter()
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MAX_DISTANCE, "最大距離", QgsProcessingParameterNumber.Double, defaultValue=50.0, minValue=0.0))
+        self.addChunkSizeParameter()
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, "逆検索結果", QgsProcessing.TypeVectorPoint))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        max_distance = self.parameterAsDouble(parameters, self.MAX_DISTANCE, context)
+        if max_distance <= 0:
+            raise QgsProcessingException("最大距離を指定してください")
+        chunk_size = self.parameterAsInt(parameters, self.CHUNK_SIZE, context)
+        # 入力の座標を住所データの座標系に変換して検索する
+        transform = QgsCoordinateTransform(source.sourceCrs(), self.parameterAsCrs(parameters, self.CRS, context),
+                                           context.transformContext())
+
+        fields = QgsFields(source.fields())
+        for name in ("address", "chiban", "city_code", "ooaza_code", "koaza_code", "gaiku_code"):
+            fields.append(QgsField(name, QVariant.String))
+        fields.append(QgsField("distance", QVariant.Double))
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, fields,
+                                             source.wkbType(), source.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        found = 0
+        with self.database(parameters, context, feedback) as db_util:
+            geocoder = ReverseGeocoder(db_util, max_distance)
+
+            def flush(chunk):
+                nonlocal found
+                points = []
+                for feature in chunk:
+                    geometry = feature.geometry()
+                    if geometry.isEmpty():
+                        points.append(None)
+                        continue
+                    point = transform.transform(geometry.centroid().asPoint())
+                    points.append((point.x(), point.y()))
+                features = []
+                for feature, (row, distance) in zip(chunk, geocoder.lookup(points)):
+                    if row is not None:
+                        found += 1
+                    values = list(row[:6]) if row is not None else [None] * 6
+                    output = QgsFeature(fields)
+                    output.setGeometry(feature.geometry())
+                    output.setAttributes(feature.attributes() + values + [distance])
+                    features.append(output)
+                sink.addFeatures(features, QgsFeatureSink.FastInsert)
+
+            count = self.processChunks(source, chunk_size, feedback, flush)
+
+        feedback.pushInfo(f"{count}件中 {found}件の地番が見つかりました")
+        return {self.OUTPUT: dest_id}
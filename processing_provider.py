@@ -0,0 +1,34 @@
+"""
+/***************************************************************************
+ processing_provider
+                                 A QGIS plugin
+ プロセッシングのプロバイダー
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+from qgis.PyQt.QtGui import QIcon
+
+from qgis.core import QgsProcessingProvider
+
+from .processing_algorithms import ChibanGeocodeAlgorithm, HierarchyLookupAlgorithm, ReverseLookupAlgorithm
+
+
+class SearchZmapProvider(QgsProcessingProvider):
+    """
+    住宅地図検索のアルゴリズムをプロセッシングツールボックスに登録するプロバイダー
+    """
+    def loadAlgorithms(self):
+        self.addAlgorithm(HierarchyLookupAlgorithm())
+        self.addAlgorithm(ChibanGeocodeAlgorithm())
+        self.addAlgorithm(ReverseLookupAlgorithm())
+
+    def id(self):
+        return "search_zmap"
+
+    def name(self):
+        return "住宅地図検索"
+
+    def icon(self):
+        return QIcon(":/plugins/search_zmap/icons/icon.png")
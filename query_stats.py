@@ -0,0 +1,145 @@
+"""
+/***************************************************************************
+ query_stats
+                                 A QGIS plugin
+ 検索の計測
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from qgis.core import QgsMessageLog, Qgis
+
+
+# 処理時間の度数分布の区切り（ミリ秒）
+HISTOGRAM_BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class QueryStats:
+    """
+    DbUtilの検索ごとの処理時間、件数、転送量を記録するクラス
+
+    (メソッド名, スキーマ名)ごとに直近window件の記録を保持し、度数分布と統計を求める。
+    slow_query_msを超えた検索はSQLとともにQgsMessageLogに出力し、
+    trace_fileを指定した場合はすべての記録をJSON Lines形式で追記する
+    """
+    def __init__(self, enabled=True, slow_query_ms=500, window=500, trace_file=""):
+        """
+        @param enabled 記録する場合はTrue
+        @param slow_query_ms この時間（ミリ秒）を超えた検索をログに出力する。0以下の場合は出力しない
+        @param window (メソッド名, スキーマ名)ごとに保持する記録の件数
+        @param trace_file 記録を追記するファイルのパス。空文字の場合は出力しない
+        """
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.window = window
+        self.trace_file = trace_file
+        self.lock = threading.Lock()
+        # (メソッド名, スキーマ名) -> 直近の記録
+        self.samples = {}
+
+    def record(self, method, schema_name, sql, params, wall_ms, exec_ms, rows, size):
+        """
+        検索を記録する
+
+        @param method DbUtilのメソッド名
+        @param schema_name スキーマ名
+        @param sql SQL
+        @param params バインドした値
+        @param wall_ms 実行から結果の読み込みまでの時間（ミリ秒）
+        @param exec_ms 実行の時間（サーバーでの実行と結果の受信、ミリ秒）
+        @param rows 件数（更新系は更新件数）
+        @param size 結果の転送量の概算（バイト）
+        """
+        if not self.enabled:
+            return
+
+        entry = {
+            "time": time.time(),
+            "method": method,
+            "schema": schema_name,
+            "params": {key: str(value) for key, value in (params or {}).items()},
+            "wall_ms": round(wall_ms, 3),
+            "exec_ms": round(exec_ms, 3),
+            "rows": rows,
+            "bytes": size,
+        }
+        with self.lock:
+            samples = self.samples.get((method, schema_name))
+            if samples is None:
+                samples = deque(maxlen=self.window)
+                self.samples[(method, schema_name)] = samples
+            samples.append(entry)
+
+        if 0 < self.slow_query_ms <= wall_ms:
+            QgsMessageLog.logMessage(
+                f"住宅地図検索:低速な検索 {method}({schema_name}) {wall_ms:.1f}ms {rows}件 {size}bytes"
+                f" params={entry['params']} SQL={sql}", "住宅地図検索", Qgis.Warning)
+
+        if self.trace_file:
+            entry["sql"] = sql
+            try:
+                with self.lock:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.trace_file)), exist_ok=True)
+                    with open(self.trace_file, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            except OSError as e:
+                QgsMessageLog.logMessage(f"住宅地図検索:検索記録の出力に失敗しました {e}")
+                self.trace_file = ""
+
+    def histogram(self, method, schema_name):
+        """
+        直近の記録の処理時間の度数分布を取得する
+
+        @param method DbUtilのメソッド名
+        @param schema_name スキーマ名
+        @return HISTOGRAM_BOUNDSの区切りごと（最後は上限超過）の件数のリスト
+        """
+        counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        with self.lock:
+            samples = list(self.samples.get((method, schema_name), []))
+        for entry in samples:
+            index = len(HISTOGRAM_BOUNDS)
+            for i, bound in enumerate(HISTOGRAM_BOUNDS):
+                if entry["wall_ms"] <= bound:
+                    index = i
+                    break
+            counts[index] += 1
+        return counts
+
+    def summary(self):
+        """
+        (メソッド名, スキーマ名)ごとの直近の記録の統計を取得する
+
+        @return method, schema, count, p50_ms, p95_ms, max_ms, rows, bytesの辞書のリスト
+        """
+        with self.lock:
+            items = [(key, list(samples)) for key, samples in self.samples.items()]
+
+        result = []
+        for (method, schema_name), samples in sorted(items, key=lambda item: (str(item[0][0]), str(item[0][1]))):
+            times = sorted(entry["wall_ms"] for entry in samples)
+            result.append({
+                "method": method,
+                "schema": schema_name,
+                "count": len(times),
+                "p50_ms": times[len(times) // 2],
+                "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))],
+                "max_ms": times[-1],
+                "rows": sum(entry["rows"] for entry in samples),
+                "bytes": sum(entry["bytes"] for entry in samples),
+            })
+        return result
+
+    def clear(self):
+        """
+        記録を破棄する
+        """
+        with self.lock:
+            self.samples.clear()
@@ -0,0 +1,203 @@
+"""
+/***************************************************************************
+ result_layer
+                                 A QGIS plugin
+ 地番検索結果レイヤー
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+ 地番検索・住所の自由入力検索の結果を、地番の位置（点）と筆（面）のメモリレイヤーに表示する。
+ レイヤーは空間索引付きで作成し、検索結果のページ・筆の取得ごとにまとめて追加して1回だけ再描画する。
+ 属性に住所を持つため、マップチップ・地物情報の表示でDBに問い合わせない
+"""
+from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtGui import QColor
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsProject, QgsVectorLayer
+
+
+# レイヤー名
+POINT_LAYER_NAME = "地番検索結果"
+PARCEL_LAYER_NAME = "地番検索結果（筆）"
+
+# レイヤーの属性
+RESULT_FIELDS = "&".join(["field=address:string(255)", "field=chiban:string(64)", "field=x:double", "field=y:double"])
+
+# 表示色
+RESULT_COLOR = QColor(230, 30, 30)
+
+
+class ChibanResultLayer:
+    """
+    地番検索結果のメモリレイヤークラス
+
+    検索のたびにclearで地物を削除し、結果の行をaddResultsで追加する（同じ住所は追加しない）。
+    筆のジオメトリは別に取得するため、未取得の住所を大字ごとにparcelGroupsで返す。
+    レイヤーはプロジェクトから削除された場合、次の追加時に作成し直す
+    """
+    def __init__(self, canvas):
+        """
+        @param canvas 表示先の地図キャンバス（レイヤーの座標系に使用する）
+        """
+        self.canvas = canvas
+        self.point_layer_id = None
+        self.parcel_layer_id = None
+        # 追加済みの住所 -> 地番
+        self.addresses = {}
+        # 筆が未取得の住所 -> (市町村コード, 大字コード)
+        self.pending_parcels = {}
+
+    def projectLayer(self, layer_id):
+        """
+        プロジェクトにあるレイヤーを取得する
+
+        @param layer_id レイヤーID
+        @return レイヤー。削除されていればNone
+        """
+        if layer_id is None:
+            return None
+        return QgsProject.instance().mapLayer(layer_id)
+
+    def createLayer(self, geometry_type, name):
+        """
+        空間索引付きのメモリレイヤーを作成し、プロジェクトに追加する
+
+        @param geometry_type ジオメトリの種類（Point、MultiPolygonなど）
+        @param name レイヤー名
+        @return レイヤー
+        """
+        crs = self.canvas.mapSettings().destinationCrs().authid()
+        layer = QgsVectorLayer(f"{geometry_type}?crs={crs}&{RESULT_FIELDS}&index=yes", name, "memory")
+        layer.setDisplayExpression('"address"')
+        layer.setMapTipTemplate('[% "address" %]')
+        symbol = layer.renderer().symbol()
+        symbol.setColor(RESULT_COLOR)
+        if geometry_type != "Point":
+            # 筆は枠線のみ
+            symbol.symbolLayer(0).setBrushStyle(Qt.NoBrush)
+            symbol.symbolLayer(0).setStrokeColor(RESULT_COLOR)
+            symbol.symbolLayer(0).setStrokeWidth(0.6)
+        QgsProject.instance().addMapLayer(layer)
+        return layer
+
+    def pointLayer(self):
+        """
+        地番の位置のレイヤーを取得する（なければ作成する）
+        """
+        layer = self.projectLayer(self.point_layer_id)
+        if layer is None:
+            layer = self.createLayer("Point", POINT_LAYER_NAME)
+            self.point_layer_id = layer.id()
+        return layer
+
+    def parcelLayer(self):
+        """
+        筆のレイヤーを取得する（なければ作成する）
+        """
+        layer = self.projectLayer(self.parcel_layer_id)
+        if layer is None:
+            layer = self.createLayer("MultiPolygon", PARCEL_LAYER_NAME)
+            self.parcel_layer_id = layer.id()
+        return layer
+
+    def addFeatures(self, layer, features):
+        """
+        地物をまとめて追加し、1回だけ再描画する
+
+        @param layer レイヤー
+        @param features 地物のリスト
+        """
+        if len(features) == 0:
+            return
+        layer.dataProvider().addFeatures(features)
+        layer.updateExtents()
+        layer.triggerRepaint()
+
+    def addResults(self, results):
+        """
+        検索結果の地番を追加する
+
+        @param results (住所, 地番, X座標, Y座標, 市町村コード, 大字コード)のリスト。
+                       筆を取得しない行は市町村コード、大字コードをNoneとする
+        """
+        features = []
+        layer = None
+        for address, chiban, x, y, city_code, ooaza_code in results:
+            if address is None or address in self.addresses or x is None or y is None:
+                continue
+            if layer is None:
+                layer = self.pointLayer()
+            self.addresses[address] = chiban
+            feature = QgsFeature(layer.fields())
+            feature.setAttributes([address, chiban, float(x), float(y)])
+            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(float(x), float(y))))
+            features.append(feature)
+            if city_code is not None and ooaza_code is not None:
+                self.pending_parcels[address] = (city_code, ooaza_code)
+        if layer is not None:
+            self.addFeatures(layer, features)
+
+    def parcelGroups(self):
+        """
+        筆が未取得の住所を大字ごとにまとめる
+
+        @return DbUtil.getChibanParcelsの引数の(市町村コード, 大字コード, 住所のリスト)のリスト
+        """
+        groups = {}
+        for address, codes in self.pending_parcels.items():
+            groups.setdefault(codes, []).append(address)
+        return [(city_code, ooaza_code, addresses) for (city_code, ooaza_code), addresses in groups.items()]
+
+    def addParcels(self, rows):
+        """
+        取得した筆を追加する
+
+        @param rows (住所, WKT)のリスト
+        """
+        features = []
+        layer = None
+        for address, wkt in rows:
+            if address not in self.pending_parcels:
+                continue
+            del self.pending_parcels[address]
+            geometry = QgsGeometry.fromWkt(wkt) if wkt else None
+            if geometry is None or geometry.isNull():
+                continue
+            if layer is None:
+                layer = self.parcelLayer()
+            feature = QgsFeature(layer.fields())
+            centroid = geometry.centroid().asPoint()
+            # ポリゴンとマルチポリゴンが混在するため、マルチポリゴンに揃える
+            geometry.convertToMultiType()
+            feature.setAttributes([address, self.addresses.get(address), centroid.x(), centroid.y()])
+            feature.setGeometry(geometry)
+            features.append(feature)
+        if layer is not None:
+            self.addFeatures(layer, features)
+
+    def clear(self):
+        """
+        表示中の地物を削除する（レイヤーは残す）
+        """
+        self.addresses.clear()
+        self.pending_parcels.clear()
+        for layer in (self.projectLayer(self.point_layer_id), self.projectLayer(self.parcel_layer_id)):
+            if layer is None or layer.featureCount() == 0:
+                continue
+            layer.dataProvider().truncate()
+            layer.updateExtents()
+            layer.triggerRepaint()
+
+    def remove(self):
+        """
+        レイヤーをプロジェクトから削除する
+        """
+        layer_ids = [layer_id for layer_id in (self.point_layer_id, self.parcel_layer_id)
+                     if self.projectLayer(layer_id) is not None]
+        if len(layer_ids) > 0:
+            QgsProject.instance().removeMapLayers(layer_ids)
+        self.point_layer_id = None
+        self.parcel_layer_id = None
+        self.addresses.clear()
+        self.pending_parcels.clear()
@@ -0,0 +1,239 @@
+"""
+/***************************************************************************
+ result_model
+                                 A QGIS plugin
+ 検索結果データモデル
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+from qgis.PyQt.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+
+class ResultTableModel(QAbstractTableModel):
+    """
+    検索結果を保持するテーブルモデル
+
+    QSqlQueryModelと異なりDB接続を保持しないため、
+    バックグラウンドスレッドで作成したモデルをGUIスレッドで使用できる
+    """
+    def __init__(self, fields, rows, parent=None):
+        """
+        @param fields 列名リスト
+        @param rows   行データ(タプル)のリスト
+        """
+        super().__init__(parent)
+        self.field_names = list(fields)
+        self.rows = list(rows)
+        self.headers = {}
+        # 列番号 -> {値: 行番号}
+        self.row_indexes = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.field_names)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        return self.rows[index.row()][index.column()]
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            if section in self.headers:
+                return self.headers[section]
+            if 0 <= section < len(self.field_names):
+                return self.field_names[section]
+            return None
+        return section + 1
+
+    def setHeaderData(self, section, orientation, value, role=Qt.EditRole):
+        if orientation != Qt.Horizontal or not 0 <= section < len(self.field_names):
+            return False
+        self.headers[section] = value
+        self.headerDataChanged.emit(orientation, section, section)
+        return True
+
+    def fieldIndex(self, field):
+        """
+        列名から列番号を取得する
+
+        @param field 列名
+        @return 列番号。該当なしの場合は-1
+        """
+        if field in self.field_names:
+            return self.field_names.index(field)
+        return -1
+
+    def value(self, row, field):
+        """
+        行番号と列名を指定して値を取得する
+
+        @param row 行番号
+        @param field 列名
+        @return 値
+        """
+        column = self.fieldIndex(field)
+        if column < 0 or not 0 <= row < len(self.rows):
+            return None
+        return self.rows[row][column]
+
+    def buildRowIndex(self, column):
+        """
+        指定列の値から行番号を引く索引を作成する
+        同じ値が複数行にある場合は先頭の行を対象とする
+
+        @param column 列番号
+        @return 値 -> 行番号の辞書
+        """
+        index = self.row_indexes.get(column)
+        if index is None:
+            index = {}
+            if 0 <= column < len(self.field_names):
+                for row, values in enumerate(self.rows):
+                    index.setdefault(values[column], row)
+            self.row_indexes[column] = index
+        return index
+
+    def findRow(self, column, value):
+        """
+        指定列の値が一致する行番号を取得する
+
+        @param column 列番号
+        @param value 値
+        @return 行番号。該当なしの場合は-1
+        """
+        return self.buildRowIndex(column).get(value, -1)
+
+
+class PagedResultModel(ResultTableModel):
+    """
+    検索結果をページ単位で取得するテーブルモデルの基底クラス
+
+    先頭ページのみで表示を開始し、テーブルビューのスクロールに合わせて
+    canFetchMore/fetchMoreで続きのページをワーカーに要求する。
+    続きのページの位置はサブクラスのpageArgsで決める
+    """
+    # チャネル名の接頭辞
+    channel_prefix = "page"
+    # 続きのページを取得するDbUtilのメソッド名
+    page_method = None
+
+    def __init__(self, db_worker, conditions, page_model: ResultTableModel, page_size: int, parent=None):
+        """
+        @param db_worker 検索に使用するワーカー(DbQueryWorker)
+        @param conditions page_methodの検索条件
+        @param page_model 先頭ページの検索結果
+        @param page_size 1ページの行数
+        """
+        super().__init__(page_model.field_names, [], parent)
+        self.db_worker = db_worker
+        self.conditions = tuple(conditions)
+        self.page_size = page_size
+        self.query_channel = f"{self.channel_prefix}_page_{id(self)}"
+        self.has_more = False
+        self.fetching = False
+        # 該当件数（別途検索するため、取得前はNone）
+        self.total_count = None
+
+        self.db_worker.resultReady.connect(self.handleQueryResult)
+        self.db_worker.queryFailed.connect(self.handleQueryFailed)
+        self.appendPage(page_model.rows)
+
+    def pageArgs(self):
+        """
+        続きのページの位置を指定する引数を取得する（検索条件とページの行数の間に渡す）
+
+        @return 引数のタプル
+        """
+        raise NotImplementedError
+
+    def updatePosition(self, rows):
+        """
+        追加したページの行から続きのページの位置を更新する
+
+        @param rows 追加する行データのリスト
+        """
+        pass
+
+    def appendPage(self, rows):
+        """
+        取得したページの行を追加する
+
+        @param rows 行データのリスト
+        """
+        self.has_more = len(rows) >= self.page_size
+        if self.total_count is not None:
+            self.has_more = self.has_more and len(self.rows) + len(rows) < self.total_count
+        if len(rows) == 0:
+            return
+
+        self.updatePosition(rows)
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.rows.extend(rows)
+        self.row_indexes.clear()
+        self.endInsertRows()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self.has_more and not self.fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self.fetching = True
+        self.db_worker.request(self.query_channel, self.page_method, *self.conditions, *self.pageArgs(), self.page_size)
+
+    def handleQueryResult(self, channel, model):
+        """
+        続きのページの取得完了時処理
+        """
+        if channel != self.query_channel:
+            return
+        self.fetching = False
+        if model is None:
+            self.has_more = False
+            return
+        self.appendPage(model.rows)
+
+    def handleQueryFailed(self, channel, message):
+        """
+        続きのページの取得失敗時処理
+        """
+        if channel != self.query_channel:
+            return
+        self.fetching = False
+        self.has_more = False
+
+    def setTotalCount(self, count):
+        """
+        該当件数を設定する（取得済みの行数が該当件数に達していれば続きを取得しない）
+
+        @param count 件数
+        """
+        self.total_count = count
+        if count is not None and len(self.rows) >= count:
+            self.has_more = False
+
+    def release(self):
+        """
+        ページ取得を停止し、ワーカーとの接続を解除する
+        """
+        self.db_worker.forget(self.query_channel)
+        self.has_more = False
+        try:
+            self.db_worker.resultReady.disconnect(self.handleQueryResult)
+            self.db_worker.queryFailed.disconnect(self.handleQueryFailed)
+        except TypeError:
+            pass
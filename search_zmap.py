@@ -9,7 +9,7 @@
  ***************************************************************************/
 
 """
-from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, Qt
+from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, Qt, QTimer
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction, QDockWidget
 from qgis.PyQt.QtSql import QSqlDatabase
@@ -19,10 +19,15 @@ from .resources import *
 # Import the code for the DockWidget
 from .search_zmap_dockwidget import SearchZmapDockWidget
 from .db_conf_dialog import DbConfDialog
+from .db_backend import SqliteBackend
+from .db_util import DbUtil, confSettings
+from .db_worker import DbQueryWorker
+from .processing_provider import SearchZmapProvider
 
 import os.path
+import sqlite3
 
-from qgis.core import QgsMessageLog
+from qgis.core import Qgis, QgsApplication, QgsMessageLog
 
 
 class SearchZmap:
@@ -56,6 +61,15 @@ class SearchZmap:
         self.dockwidget = None
         self.dbConnected = False
 
+        # 起動時の事前接続（conf.iniの[DB] warm_connect=trueの場合）
+        self.db_util = None
+        self.warm_worker = None
+        self.warm_parameters = None
+        # 事前接続に失敗した場合の再試行間隔（秒）
+        self.warm_retry_delay = 1
+        # プロセッシングのプロバイダー
+        self.provider = None
+
 
     # noinspection PyMethodMayBeStatic
     def tr(self, message):
@@ -147,9 +161,18 @@ class SearchZmap:
         return action
 
 
+    def initProcessing(self):
+        """
+        プロセッシングのプロバイダーを登録する（qgis_processからも呼び出される）
+        """
+        self.provider = SearchZmapProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
+
     def initGui(self):
         """Create the menu entries and toolbar icons inside the QGIS GUI."""
 
+        self.initProcessing()
+
         icon_path = ':/plugins/search_zmap/icons/icon.png'
         self.add_action(
             icon_path,
@@ -157,6 +180,94 @@ class SearchZmap:
             callback=self.run,
             parent=self.iface.mainWindow())
 
+        # 選択エリアの検索用データ作成・更新（メニューのみ）
+        self.add_action(
+            icon_path,
+            text=self.tr(u'エリアの検索用データ作成'),
+            callback=lambda: self.prepareArea(False),
+            add_to_toolbar=False,
+            parent=self.iface.mainWindow())
+        self.add_action(
+            icon_path,
+            text=self.tr(u'エリアの検索用データ更新'),
+            callback=lambda: self.prepareArea(True),
+            add_to_toolbar=False,
+            parent=self.iface.mainWindow())
+        self.add_action(
+            icon_path,
+            text=self.tr(u'エリアのローカルファイル出力'),
+            callback=self.exportArea,
+            add_to_toolbar=False,
+            parent=self.iface.mainWindow())
+        self.add_action(
+            icon_path,
+            text=self.tr(u'住所の一括検索（CSV）'),
+            callback=self.geocodeCsv,
+            add_to_toolbar=False,
+            parent=self.iface.mainWindow())
+
+        # DB接続とエリアの取得をバックグラウンドで開始する
+        if confSettings().value("DB/warm_connect", False, type=bool):
+            self.startWarmConnect()
+
+    def startWarmConnect(self):
+        """
+        起動時の事前接続を開始する
+        設定ファイルに接続情報がすべて設定されている場合のみ行う
+        """
+        if confSettings().value("DB/local_file", "", type=str):
+            # ローカルファイルを検索するため接続しない
+            return
+        params = DbConfDialog.connectionSettings()
+        if not DbConfDialog.hasConnectionSettings(params):
+            # 接続情報の入力が必要なため、起動時に接続する
+            return
+
+        self.warm_parameters = params
+        self.db_util = DbUtil()
+        self.db_util.pool.setParameters(params)
+        self.warm_worker = DbQueryWorker(self.db_util, keep_connection=False)
+        self.warm_worker.resultReady.connect(self.handleWarmResult)
+        self.warm_worker.queryFailed.connect(self.handleWarmFailed)
+        self.warm_worker.request("warm", "warmUp")
+
+    def handleWarmResult(self, channel, schema_names):
+        """
+        事前接続の完了時処理
+        """
+        if schema_names is None:
+            self.handleWarmFailed(channel, "DB接続に失敗しました")
+            return
+        QgsMessageLog.logMessage(f"住宅地図検索:DBに事前接続しました（エリア {len(schema_names)}件）")
+        self.warm_retry_delay = 1
+
+    def handleWarmFailed(self, channel, message):
+        """
+        事前接続の失敗時処理
+        間隔を倍にしながら（最大60秒）再試行する
+        """
+        if self.warm_worker is None or self.dockwidget is not None:
+            return
+        QgsMessageLog.logMessage(f"住宅地図検索:DBへの事前接続に失敗しました。{self.warm_retry_delay}秒後に再試行します {message}")
+        QTimer.singleShot(self.warm_retry_delay * 1000, self.retryWarmConnect)
+        self.warm_retry_delay = min(self.warm_retry_delay * 2, 60)
+
+    def retryWarmConnect(self):
+        """
+        事前接続を再試行する
+        """
+        if self.warm_worker is None or self.dockwidget is not None:
+            return
+        self.warm_worker.request("warm", "warmUp")
+
+    def stopWarmWorker(self):
+        """
+        事前接続用のワーカーを停止する
+        """
+        if self.warm_worker is not None:
+            self.warm_worker.stop()
+            self.warm_worker = None
+
     #--------------------------------------------------------------------------
 
     def onClosePlugin(self):
@@ -184,6 +295,14 @@ class SearchZmap:
             self.iface.removeDockWidget(self.dockwidget)
             self.pluginIsActive = False
 
+        self.stopWarmWorker()
+        if self.dockwidget is not None:
+            # 検索ワーカーを停止する
+            self.dockwidget.stopWorkers()
+            self.dockwidget.removeResultLayer()
+        if self.db_util is not None and self.db_util.backend is not None:
+            self.db_util.setBackend(None)
+
         if self.dbConnected:
             db = QSqlDatabase().database()
             if db and db.isOpen():
@@ -191,6 +310,10 @@ class SearchZmap:
                 QgsMessageLog.logMessage("住宅地図検索:DB is closed")
             self.dbConnected = False
 
+        if self.provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
+            self.provider = None
+
         for action in self.actions:
             self.iface.removePluginMenu(
                 self.tr(u'&住宅地図検索'),
@@ -210,16 +333,22 @@ class SearchZmap:
             #    first run of plugin
             #    removed on close (see self.onClosePlugin method)
             if self.dockwidget == None:
-                # DB接続
-                db_conf = DbConfDialog(self.iface.mainWindow())
-                if db_conf.connectDB(self.iface) == False:
-                    # DB接続に失敗したらエラーを表示して何も表示しない
-                    return
-
-                self.dbConnected = True
+                if not self.openLocalFile():
+                    # DB接続
+                    if not self.connectWarmDB():
+                        db_conf = DbConfDialog(self.iface.mainWindow())
+                        if db_conf.connectDB(self.iface) == False:
+                            # DB接続に失敗したらエラーを表示して何も表示しない
+                            return
+
+                    self.dbConnected = True
+                # 事前接続は終了し（再試行も行わない）、取得済みのエリアと階層データは画面で使用する
+                # 接続を画面の検索用に空けるため、スレッドは実行中の処理が終わり次第終了する
+                if self.warm_worker is not None:
+                    self.warm_worker.stop(wait=False)
 
                 # Create the dockwidget (after translation) and keep reference
-                self.dockwidget = SearchZmapDockWidget(self.iface)
+                self.dockwidget = SearchZmapDockWidget(self.iface, db_util=self.db_util)
 
             self.pluginIsActive = True
             
@@ -232,6 +361,73 @@ class SearchZmap:
             # self.dockwidget.show()
             self.tabifyMe(Qt.LeftDockWidgetArea, self.dockwidget)
 
+    def connectWarmDB(self):
+        """
+        事前接続に成功していれば、同じ接続情報で既定の接続を開く
+        サーバーの応答を確認済みのため待ち時間なしで接続できる
+
+        @return 接続に成功すればTrue
+        """
+        if self.db_util is None or self.db_util.schema_names is None:
+            return False
+        db = DbConfDialog.addDatabase(self.warm_parameters)
+        if not db.open():
+            QgsMessageLog.logMessage(f"住宅地図検索:DB接続に失敗しました {db.lastError().text()}")
+            return False
+        return True
+
+    def openLocalFile(self):
+        """
+        設定ファイルの[DB] local_fileにローカルファイルが指定されていれば、DBサーバーの代わりに検索する
+
+        @return ローカルファイルを開いた場合はTrue
+        """
+        path = confSettings().value("DB/local_file", "", type=str)
+        if not path:
+            return False
+        try:
+            backend = SqliteBackend(path)
+        except (OSError, sqlite3.Error) as e:
+            QgsMessageLog.logMessage(f"住宅地図検索:ローカルファイルを開けません {path} {e}")
+            self.iface.messageBar().pushMessage("住宅地図検索", f"ローカルファイルを開けないため、DBに接続します {path}", Qgis.Warning)
+            return False
+        if self.db_util is None:
+            self.db_util = DbUtil()
+        self.db_util.setBackend(backend)
+        # ファイル自体がローカルにあるため、階層スナップショットは作成しない
+        self.db_util.use_snapshot = False
+        QgsMessageLog.logMessage(f"住宅地図検索:ローカルファイルを検索します {path}")
+        return True
+
+    def exportArea(self):
+        """
+        住宅地図検索で選択中のエリアをローカルファイルに出力する
+        """
+        if self.dockwidget is None:
+            self.iface.messageBar().pushMessage("住宅地図検索", "住宅地図検索を起動してエリアを選択してください", Qgis.Info)
+            return
+        self.dockwidget.exportArea()
+
+    def geocodeCsv(self):
+        """
+        住宅地図検索で選択中のエリアでCSVファイルの住所を一括検索する
+        """
+        if self.dockwidget is None:
+            self.iface.messageBar().pushMessage("住宅地図検索", "住宅地図検索を起動してエリアを選択してください", Qgis.Info)
+            return
+        self.dockwidget.geocodeCsv()
+
+    def prepareArea(self, refresh):
+        """
+        住宅地図検索で選択中のエリアの検索用データを作成・更新する
+
+        @param refresh Trueの場合は作成済みのデータを更新する
+        """
+        if self.dockwidget is None:
+            self.iface.messageBar().pushMessage("住宅地図検索", "住宅地図検索を起動してエリアを選択してください", Qgis.Info)
+            return
+        self.dockwidget.prepareArea(refresh)
+
     def tabifyMe(self, area, dock):
         # Tabify me and place me on top
         dockwidgets = self.iface.mainWindow().findChildren(QDockWidget)
@@ -13,12 +13,18 @@ import os
 from qgis.PyQt import uic
 from qgis.PyQt.QtCore import pyqtSignal, Qt, QAbstractItemModel
 from qgis.PyQt.QtGui import QIcon
-from qgis.PyQt.QtWidgets import QDockWidget, QTableView, QComboBox, QLineEdit
+from qgis.PyQt.QtWidgets import QDockWidget, QTableView, QComboBox, QLineEdit, QMessageBox, QFileDialog
 
 from qgis.core import Qgis, QgsRectangle, QgsPointXY, QgsApplication
 
-from .db_util import DbUtil
+from .chiban_model import ChibanResultModel
+from .db_util import DbUtil, confSettings
+from .db_worker import DbQueryWorker
+from .landmark_model import LandmarkResultModel
+from .result_layer import ChibanResultLayer
+from .result_model import ResultTableModel
 from .select_aza_dialog import SelectAzaDialog
+from .typeahead import AzaTypeahead
 
 FORM_CLASS, _ = uic.loadUiType(os.path.join(
     os.path.dirname(__file__), 'search_zmap_dockwidget_base.ui'))
@@ -27,7 +33,7 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
 
     closingPlugin = pyqtSignal()
 
-    def __init__(self, iface, parent=None):
+    def __init__(self, iface, parent=None, db_util=None):
         super(SearchZmapDockWidget, self).__init__(parent)
         # Set up the user interface from Designer.
         # After setupUI you can access any designer object by doing
@@ -42,10 +48,46 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         self.column_pos_x = 2
         self.column_pos_y = 3
 
-        self.db_util = DbUtil()
+        # 起動時に事前接続した場合はそのDbUtil（取得済みのエリアと階層データ）を使用する
+        self.db_util = db_util if db_util is not None else DbUtil()
+        # 検索はバックグラウンドで実行する
+        self.db_worker = DbQueryWorker(self.db_util, self)
+        self.db_worker.resultReady.connect(self.handleQueryResult)
+        self.db_worker.queryFailed.connect(self.handleQueryFailed)
+        # 階層データ・スナップショット・名称の索引の作成用（時間がかかるため、検索を待たせないよう別の接続で実行する）
+        self.prefetch_worker = DbQueryWorker(self.db_util, self, keep_connection=False)
+        self.prefetch_worker.resultReady.connect(self.handleQueryResult)
+        self.db_util.background_prefetch = True
+        # エリアのデータ準備用（時間がかかるため検索とは別に実行する）
+        self.area_worker = None
+        # エリアのローカルファイル出力用
+        self.export_worker = None
+        # 住所の一括検索用
+        self.batch_worker = None
 
         self.model_chiban = None
         self.model_landmark = None
+        # ランドマーク検索の条件と該当件数
+        self.landmark_conditions = None
+        self.landmark_count = None
+        # 地番検索の条件と該当件数（件数は結果の表示とは別に検索する）
+        self.chiban_conditions = None
+        self.chiban_count = None
+        settings = confSettings()
+        self.chiban_page_size = settings.value("SEARCH/chiban_page_size", 200, type=int)
+        self.landmark_page_size = settings.value("SEARCH/landmark_page_size", 100, type=int)
+        # 住所の自由入力検索で表示する候補の最大数
+        self.address_candidate_limit = settings.value("SEARCH/address_candidate_limit", 20, type=int)
+        # 字コード入力欄の入力補完（入力が止まってから候補を表示し、選択を確定する）
+        typeahead_delay = settings.value("SEARCH/typeahead_delay", 300, type=int)
+        typeahead_limit = settings.value("SEARCH/typeahead_limit", 10, type=int)
+        self.ooaza_typeahead = AzaTypeahead(self.edit_ooaza, typeahead_delay, typeahead_limit, self)
+        self.koaza_typeahead = AzaTypeahead(self.edit_koaza, typeahead_delay, typeahead_limit, self)
+        self.gaiku_typeahead = AzaTypeahead(self.edit_gaiku, typeahead_delay, typeahead_limit, self)
+        # 地番検索結果のレイヤー表示（無効の場合はNone）
+        self.result_layer = None
+        if settings.value("SEARCH/result_layer", True, type=bool):
+            self.result_layer = ChibanResultLayer(self.iface.mapCanvas())
 
         self.city_code_selected = None
         self.ooaza_code_selected = None
@@ -57,9 +99,17 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         self.koaza_data_model = None
         self.gaiku_data_model = None
 
+        # 字選択ダイアログで選択され、リスト作成後に選択するコード
+        self.pending_codes = {}
+        # 名称のあいまい検索で選択中（入力中の名称をコードで上書きしない）
+        self.fuzzy_syncing = False
+        # 字選択ダイアログ（表示した階層を保持するため、一度作成したら使い回す）
+        self.select_aza_dialog = None
+
         self.ooaza_scale = 2000
         self.koaza_scale = 1000
         self.chiban_scale = 500
+        self.landmark_scale = 1000
 
         # 画面のボタンの処理の指定など
         self.initUI()
@@ -70,10 +120,12 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         """
         エリアコンボボックス初期設定
         """
-        # スキーマ名一覧を取得する
-        QgsApplication.setOverrideCursor(Qt.WaitCursor)
-        schema_names = self.db_util.getSchemaNames()
-        QgsApplication.restoreOverrideCursor()
+        # スキーマ名一覧を取得する（事前接続で取得済みであれば使用する）
+        schema_names = self.db_util.schema_names
+        if schema_names is None:
+            QgsApplication.setOverrideCursor(Qt.WaitCursor)
+            schema_names = self.db_util.getSchemaNames()
+            QgsApplication.restoreOverrideCursor()
 
         if len(schema_names) == 0:
             return
@@ -94,6 +146,7 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         self.button_search_chiban.setIcon(QIcon(os.path.join(os.path.dirname(__file__), 'icons/actionSearch.png')))
         self.button_clear_chiban.setIcon(QIcon(os.path.join(os.path.dirname(__file__), 'icons/back.png')))
         self.button_locate_chiban.setIcon(QIcon(os.path.join(os.path.dirname(__file__), 'icons/actionLocate.png')))
+        self.button_zoom_all_chiban.setIcon(QIcon(os.path.join(os.path.dirname(__file__), 'icons/actionLocate.png')))
         self.button_search_landmark.setIcon(QIcon(os.path.join(os.path.dirname(__file__), 'icons/actionSearch.png')))
         self.button_clear_landmark.setIcon(QIcon(os.path.join(os.path.dirname(__file__), 'icons/back.png')))
         self.button_locate_landmark.setIcon(QIcon(os.path.join(os.path.dirname(__file__), 'icons/actionLocate.png')))
@@ -108,7 +161,11 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         self.combo_koaza.currentIndexChanged.connect(self.handleKoazaCombChanged)
         self.edit_gaiku.textChanged.connect(self.handleGaikuTextChanged)
         self.combo_gaiku.currentIndexChanged.connect(self.handleGaikuCombChanged)
+        self.ooaza_typeahead.settled.connect(lambda text: self.syncAzaComboBox(self.combo_ooaza, text))
+        self.koaza_typeahead.settled.connect(lambda text: self.syncAzaComboBox(self.combo_koaza, text))
+        self.gaiku_typeahead.settled.connect(lambda text: self.syncAzaComboBox(self.combo_gaiku, text))
         self.edit_chiban.textChanged.connect(self.handleChibanChanged)
+        self.edit_address.returnPressed.connect(self.handleSearchAddress)
 
         # ボタンの処理
         self.button_select.clicked.connect(self.showSelectAzaDialog)
@@ -116,6 +173,7 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         self.button_search_chiban.clicked.connect(self.handleSearchChiban)
         self.button_locate_aza.clicked.connect(self.handleLocateAza)
         self.button_locate_chiban.clicked.connect(self.handleLocateChiban)
+        self.button_zoom_all_chiban.clicked.connect(self.handleZoomAllChiban)
 
         # テーブルビュー設定
         self.table_view_chiban.setSelectionBehavior(QTableView.SelectRows)
@@ -126,6 +184,15 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         self.button_search_landmark.clicked.connect(self.handleLandmarkSearch)
         self.button_clear_landmark.clicked.connect(self.handleLandmarkClear)
         self.button_locate_landmark.clicked.connect(self.handleLandmarkLocate)
+        self.edit_landmark.returnPressed.connect(self.handleLandmarkSearch)
+
+        # テーブルビュー設定
+        self.table_view_landmark.setSelectionBehavior(QTableView.SelectRows)
+        self.table_view_landmark.setSelectionMode(QTableView.SingleSelection)
+        self.table_view_landmark.clicked.connect(self.viewClicked)
+        self.table_view_landmark.doubleClicked.connect(lambda index: self.handleLandmarkLocate())
+        # ランドマークのデータの有無はエリアの選択時に確認する
+        self.setLandmarkEnabled(False)
 
     def handleAreaChanged(self, area_name):
         """
@@ -133,14 +200,21 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         各部品をクリアする
         市町村コンボボックスのリスト作成  
         """
+        # 実行中の検索はすべて破棄する
+        self.db_worker.cancel()
+        self.prefetch_worker.cancel()
         # これより使用するスキーマを選択エリアとする
-        QgsApplication.setOverrideCursor(Qt.WaitCursor)
         self.db_util.setSchema(area_name)
-        QgsApplication.restoreOverrideCursor()
+        # 階層スナップショットを準備する
+        self.prefetch_worker.request("snapshot", "prepareSnapshot", area_name)
+        if self.select_aza_dialog is not None:
+            self.select_aza_dialog.clearLevelCache()
         # エリアコンボボックス以外をクリア
         self.clear()
         # 市町村リスト作成
         self.makeCityCombo()
+        # ランドマークのカテゴリリスト作成（データがなければランドマーク検索は使用不可）
+        self.makeLandmarkCategory(None)
 
     def handleCityCombChanged(self, index):
         """
@@ -156,6 +230,9 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         self.clearGaiku()
         # 大字リスト作成
         self.makeOoazaCombo()
+        # ランドマークのカテゴリは選択市町村のものとする
+        if self.page_landmark.isEnabled():
+            self.makeLandmarkCategory(self.city_code_selected)
         # ボタンの状態を変更する
         self.setChibanButtonStatus()
  
@@ -163,10 +240,11 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         """
         大字コード変更時処理
 
-        入力する度に一致する大字を検索し、大字コンボボックスの選択を行う
+        入力が止まってから一致する大字を検索し、大字コンボボックスの選択を行う
+        （入力のたびに下位の階層を作成し直さないようにする）
         """
         if self.sender() == self.edit_ooaza:
-            self.syncAzaComboBox(self.combo_ooaza, text)
+            self.ooaza_typeahead.input(text)
 
     def handleOoazaCombChanged(self, index):
         """
@@ -176,7 +254,7 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         # 選択大字コードを退避
         self.ooaza_code_selected = self.combo_ooaza.itemData(index)
         # 大字コードエディットに反映
-        if self.sender() == self.combo_ooaza:
+        if self.sender() == self.combo_ooaza and not self.fuzzy_syncing:
             self.syncAzaLineEdit(self.edit_ooaza, self.ooaza_code_selected)
         # 小字、街区をクリア
         self.clearKoaza()
@@ -190,10 +268,11 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         """
         小字コード変更時処理
 
-        入力する度に一致する小字を検索し、小字コンボボックスの選択を行う
+        入力が止まってから一致する小字を検索し、小字コンボボックスの選択を行う
+        （入力のたびに下位の階層を作成し直さないようにする）
         """
         if self.sender() == self.edit_koaza:
-            self.syncAzaComboBox(self.combo_koaza, text)
+            self.koaza_typeahead.input(text)
 
     def handleKoazaCombChanged(self, index):
         """
@@ -202,7 +281,7 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         # 選択大字コードを退避
         self.koaza_code_selected = self.combo_koaza.itemData(index)
         # 小字コードエディットに反映
-        if self.sender() == self.combo_koaza:
+        if self.sender() == self.combo_koaza and not self.fuzzy_syncing:
             self.syncAzaLineEdit(self.edit_koaza, self.koaza_code_selected)
         # 街区をクリア
         self.clearGaiku()
@@ -213,10 +292,11 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         """
         街区コード変更時処理
 
-        入力する度に一致する街区を検索し、街区コンボボックスの選択を行う
+        入力が止まってから一致する街区を検索し、街区コンボボックスの選択を行う
+        （入力のたびに下位の階層を作成し直さないようにする）
         """
         if self.sender() == self.edit_gaiku:
-            self.syncAzaComboBox(self.combo_gaiku, text)
+            self.gaiku_typeahead.input(text)
 
     def handleGaikuCombChanged(self, index):
         """
@@ -231,11 +311,10 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
     def makeCityCombo(self):
         """
         市町村リスト作成
+
+        リストは検索完了後にhandleQueryResultで作成する
         """
-        QgsApplication.setOverrideCursor(Qt.WaitCursor)
-        self.city_data_model = self.db_util.getCityModel()
-        QgsApplication.restoreOverrideCursor()
-        self.makeCombobox(self.combo_city, self.city_data_model)
+        self.db_worker.request("city", "getCityModel")
         # ボタン使用可否
         self.setChibanButtonStatus()
 
@@ -244,10 +323,10 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         大字リスト作成
         """
         if self.city_code_selected:
-            QgsApplication.setOverrideCursor(Qt.WaitCursor)
-            self.ooaza_data_model = self.db_util.getOoazaModel(self.city_code_selected)
-            QgsApplication.restoreOverrideCursor()
-            self.makeCombobox(self.combo_ooaza, self.ooaza_data_model)
+            self.requestAzaModel("ooaza", "getOoazaModel", self.city_code_selected)
+            if self.db_util.prefetch_city and self.db_util.readyTree(self.city_code_selected) is None:
+                # 市町村配下の階層データを先読みする（以降の小字・街区リストはDBに問い合わせずに作成する）
+                self.prefetch_worker.request("city_tree", "getCityTree", self.city_code_selected, self.db_util.schema_name)
         # ボタン使用可否
         self.setChibanButtonStatus()
 
@@ -256,10 +335,7 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         小字リスト作成
         """
         if self.ooaza_code_selected:
-            QgsApplication.setOverrideCursor(Qt.WaitCursor)
-            self.koaza_data_model = self.db_util.getKoazaModel(self.city_code_selected, self.ooaza_code_selected)
-            QgsApplication.restoreOverrideCursor()
-            self.makeCombobox(self.combo_koaza, self.koaza_data_model)
+            self.requestAzaModel("koaza", "getKoazaModel", self.city_code_selected, self.ooaza_code_selected)
         # ボタン使用可否
         self.setChibanButtonStatus()
 
@@ -268,14 +344,132 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         街区リスト作成
         """
         if self.koaza_code_selected:
-            QgsApplication.setOverrideCursor(Qt.WaitCursor)
-            self.gaiku_data_model = self.db_util.getGaikuModel(self.city_code_selected, self.ooaza_code_selected, self.koaza_code_selected)
-            QgsApplication.restoreOverrideCursor()
-            self.makeCombobox(self.combo_gaiku, self.gaiku_data_model)
+            self.requestAzaModel("gaiku", "getGaikuModel", self.city_code_selected, self.ooaza_code_selected, self.koaza_code_selected)
+
+        # ボタン使用可否
+        self.setChibanButtonStatus()
+
+    def requestAzaModel(self, channel, method, city_code, *args):
+        """
+        字リストのデータを要求する
+        市町村配下の階層データを取得済みであればDBに問い合わせずにリストを作成する
+
+        @param channel 検索要求のチャネル名
+        @param method DbUtil・AddressTreeのメソッド名
+        @param city_code 市町村コード
+        @param args 市町村コード以降の引数
+        """
+        tree = self.db_util.readyTree(city_code)
+        if tree is None:
+            # 市町村配下の階層データは先読み用のワーカーで取得する
+            self.db_worker.request(channel, method, city_code, *args)
+            return
+        self.db_worker.cancel(channel)
+        self.handleQueryResult(channel, getattr(tree, method)(city_code, *args))
+
+    def handleQueryResult(self, channel, model):
+        """
+        バックグラウンド検索の完了時処理
+
+        @param channel 検索要求のチャネル名
+        @param model 検索結果のデータモデル
+        """
+        if channel == "city":
+            self.city_data_model = model
+            self.makeCombobox(self.combo_city, model)
+        elif channel == "ooaza":
+            self.ooaza_data_model = model
+            self.makeAzaCombobox(self.combo_ooaza, self.edit_ooaza, model)
+            self.applyPendingCode("ooaza")
+        elif channel == "koaza":
+            self.koaza_data_model = model
+            self.makeAzaCombobox(self.combo_koaza, self.edit_koaza, model)
+            self.applyPendingCode("koaza")
+        elif channel == "gaiku":
+            self.gaiku_data_model = model
+            self.makeAzaCombobox(self.combo_gaiku, self.edit_gaiku, model)
+            self.applyPendingCode("gaiku")
+        elif channel == "chiban":
+            if model is not None:
+                model = ChibanResultModel(self.db_worker, self.chiban_conditions, model, self.chiban_page_size)
+            self.showChibanModel(model)
+            return
+        elif channel == "chiban_count":
+            self.chiban_count = model
+            self.showChibanCount()
+            return
+        elif channel == "fuzzy_index":
+            # 索引の作成前に入力された名称を照合する
+            for edit, combobox in ((self.edit_ooaza, self.combo_ooaza), (self.edit_koaza, self.combo_koaza)):
+                if edit.text() and combobox.currentIndex() < 0:
+                    self.syncAzaComboBox(combobox, edit.text())
+            return
+        elif channel == "address":
+            self.chiban_count = model.rowCount() if model is not None else None
+            self.showChibanModel(model)
+            return
+        elif channel == "landmark_category":
+            self.makeCategoryCombobox(model)
+            return
+        elif channel == "landmark":
+            if model is not None:
+                model = LandmarkResultModel(self.db_worker, self.landmark_conditions, model, self.landmark_page_size)
+            self.showLandmarkModel(model)
+            return
+        elif channel == "landmark_count":
+            self.landmark_count = model
+            self.showLandmarkCount()
+            return
+        elif channel == "chiban_extent":
+            if model is None:
+                self.iface.messageBar().pushMessage("該当地点がありません", Qgis.Warning)
+            else:
+                self.zoomToExtent(*model)
+            return
+        elif channel == "chiban_parcels":
+            if model is not None and self.result_layer is not None:
+                self.result_layer.addParcels(model.rows)
+            return
+        else:
+            return
 
         # ボタン使用可否
         self.setChibanButtonStatus()
 
+    def handleQueryFailed(self, channel, message):
+        """
+        バックグラウンド検索の失敗時処理
+
+        @param channel 検索要求のチャネル名
+        @param message エラーメッセージ
+        """
+        if channel in ("city", "ooaza", "koaza", "gaiku", "chiban", "chiban_count", "address", "chiban_extent",
+                       "landmark", "landmark_count"):
+            self.pending_codes.clear()
+            self.iface.messageBar().pushMessage("住宅地図検索", f"検索に失敗しました {message}", Qgis.Warning)
+        elif channel == "landmark_category":
+            self.setLandmarkEnabled(False)
+
+    def makeAzaCombobox(self, combobox: QComboBox, edit: QLineEdit, model: QAbstractItemModel):
+        """
+        字コンボボックスのリストを作成する
+        リスト作成前にコードが入力されていれば、そのコードを選択する
+
+        @param combobox コンボボックス
+        @param edit コード入力用ラインエディット
+        @param model データモデル
+        """
+        text = edit.text()
+        if isinstance(model, ResultTableModel):
+            # コード入力による選択のため、コードから行を引く索引を作成しておく
+            model.buildRowIndex(self.column_code)
+        # 入力補完の候補も同じリストから求める（確定待ちの入力はこの後に選択する）
+        self.typeaheadOf(edit).setModel(model)
+        self.makeCombobox(combobox, model)
+        if len(text) > 0:
+            self.syncAzaLineEdit(edit, text)
+            self.syncAzaComboBox(combobox, text)
+
     def makeCombobox(self, combobox: QComboBox, model: QAbstractItemModel):
         """
         コンボボックスに先頭に空行を設定し、データモデルからデータを設定する
@@ -294,6 +488,7 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         """
         市町村コンボボックス関連情報をクリア
         """
+        self.db_worker.cancel("city")
         self.city_code_selected = None
         self.city_data_model = None
         self.combo_city.clear()
@@ -302,9 +497,11 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         """
         大字コンボボックス関連情報をクリア
         """
+        self.db_worker.cancel("ooaza")
         self.ooaza_data_model = None
         self.combo_ooaza.clear()
         self.ooaza_code_selected = None
+        self.ooaza_typeahead.setModel(None)
         self.edit_ooaza.blockSignals(True)
         self.edit_ooaza.clear()
         self.edit_ooaza.blockSignals(False)
@@ -313,9 +510,11 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         """
         小字コンボボックス関連情報をクリア
         """
+        self.db_worker.cancel("koaza")
         self.koaza_data_model = None
         self.combo_koaza.clear()
         self.koaza_code_selected = None
+        self.koaza_typeahead.setModel(None)
         self.edit_koaza.blockSignals(True)
         self.edit_koaza.clear()
         self.edit_koaza.blockSignals(False)
@@ -324,9 +523,11 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         """
         街区コンボボックス関連情報をクリア
         """
+        self.db_worker.cancel("gaiku")
         self.gaiku_data_model = None
         self.combo_gaiku.clear()
         self.gaiku_code_selected = None
+        self.gaiku_typeahead.setModel(None)
         self.edit_gaiku.blockSignals(True)
         self.edit_gaiku.clear()
         self.edit_gaiku.blockSignals(False)
@@ -335,8 +536,15 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         """
         地番Viewをクリア
         """
+        self.db_worker.cancel("chiban", "chiban_count", "address", "chiban_parcels", "chiban_extent")
         self.table_view_chiban.setModel(None)
+        if self.result_layer is not None:
+            self.result_layer.clear()
+        if isinstance(self.model_chiban, ChibanResultModel):
+            self.model_chiban.release()
         self.model_chiban = None
+        self.chiban_conditions = None
+        self.chiban_count = None
 
     def handleChibanChanged(self, value):
         """
@@ -376,6 +584,26 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
             edit.setText(str(code))
         edit.blockSignals(False)
 
+    def typeaheadOf(self, edit: QLineEdit):
+        """
+        コード入力欄の入力補完を取得する
+
+        @param edit 大字、小字、街区のコード入力用ラインエディット
+        @return AzaTypeahead
+        """
+        return {
+            self.edit_ooaza: self.ooaza_typeahead,
+            self.edit_koaza: self.koaza_typeahead,
+            self.edit_gaiku: self.gaiku_typeahead,
+        }[edit]
+
+    def flushTypeahead(self):
+        """
+        確定待ちのコード入力を上位の階層から確定する
+        """
+        for typeahead in (self.ooaza_typeahead, self.koaza_typeahead, self.gaiku_typeahead):
+            typeahead.flush()
+
     def syncAzaComboBox(self, combobox: QComboBox, code):
         """
         変更シグナルを発行することなくコードをコンボボックスに設定する
@@ -385,9 +613,66 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         """
         if combobox.count() == 0 or code is None:
             combobox.setCurrentIndex(-1)
-        else:
-            index = combobox.findData(code)
+            return
+
+        index = self.findComboIndex(combobox, code)
+        if index >= 0 or not code or str(code).isdigit():
             combobox.setCurrentIndex(index)
+            return
+
+        # コード以外の入力は名称・ふりがなのあいまい検索で最も近いものを選択する
+        self.fuzzy_syncing = True
+        try:
+            combobox.setCurrentIndex(self.findFuzzyComboIndex(combobox, code))
+        finally:
+            self.fuzzy_syncing = False
+
+    def findFuzzyComboIndex(self, combobox: QComboBox, text):
+        """
+        名称・ふりがなが入力に最も近い項目のコンボボックスの項目位置を取得する
+        名称の索引が未作成の場合はバックグラウンドで作成し、作成後に改めて照合する
+
+        @param combobox 大字または小字のコンボボックス
+        @param text 入力
+        @return 項目位置。該当なしの場合は-1
+        """
+        parent_codes = {
+            self.combo_ooaza: (self.city_code_selected,),
+            self.combo_koaza: (self.city_code_selected, self.ooaza_code_selected),
+        }.get(combobox)
+        if parent_codes is None or None in parent_codes:
+            return -1
+        index = self.db_util.readyFuzzyIndex()
+        if index is None:
+            self.prefetch_worker.request("fuzzy_index", "prepareFuzzyIndex")
+            return -1
+        matches = index.search(text, parent_codes, limit=1)
+        if len(matches) == 0:
+            return -1
+        return self.findComboIndex(combobox, matches[0][0][len(parent_codes)])
+
+    def findComboIndex(self, combobox: QComboBox, code):
+        """
+        コードに対するコンボボックスの項目位置を取得する
+        リスト作成元のデータモデルの索引から求め、先頭の空行の分をずらす
+
+        @param combobox コンボボックス
+        @param code コード
+        @return 項目位置。該当なしの場合は-1
+        """
+        model = {
+            self.combo_city: self.city_data_model,
+            self.combo_ooaza: self.ooaza_data_model,
+            self.combo_koaza: self.koaza_data_model,
+            self.combo_gaiku: self.gaiku_data_model,
+        }.get(combobox)
+        if not isinstance(model, ResultTableModel) or combobox.count() != model.rowCount() + 1:
+            return combobox.findData(code)
+
+        row = model.findRow(self.column_code, code)
+        if row < 0:
+            return -1
+        return row + 1
 
     def findModelData(self, model: QAbstractItemModel, column: int, target):
         """
@@ -399,6 +684,9 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
 
         @return 行番号        
         """
+        if isinstance(model, ResultTableModel):
+            return model.findRow(column, target)
+
         for row in range(model.rowCount()):
             index = model.index(row, column)
             if model.data(index) == target:
@@ -438,6 +726,7 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
             is_enabled_locate_chiban = True
             break
         self.button_locate_chiban.setEnabled(is_enabled_locate_chiban)
+        self.button_zoom_all_chiban.setEnabled(self.model_chiban is not None and self.model_chiban.rowCount() > 0)
 
         # 市町村、大字、小字、街区、地番の使用可否設定
         self.edit_ooaza.setEnabled(self.city_code_selected is not None)
@@ -449,35 +738,75 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
 
     def showSelectAzaDialog(self):
         # ダイアログで大字コードを反映するため、このdockwidgetを設定
-        dlg = SelectAzaDialog(self.db_util, self)
+        if self.select_aza_dialog is None:
+            self.select_aza_dialog = SelectAzaDialog(self.db_util, self.db_worker, self)
+        dlg = self.select_aza_dialog
 
         dlg.prepare(self.city_code_selected)
             
         if dlg.exec() == SelectAzaDialog.Accepted:
-            if self.city_code_selected != dlg.citySelected():
-                self.city_code_selected = dlg.citySelected()
-                index = self.combo_city.findData(self.city_code_selected)
-                self.combo_city.setCurrentIndex(index)
-
-            if self.ooaza_code_selected != dlg.ooazaSelected():
-                self.ooaza_code_selected = dlg.ooazaSelected()
-                index = self.combo_ooaza.findData(self.ooaza_code_selected)
-                self.combo_ooaza.setCurrentIndex(index)
-
-            if self.koaza_code_selected != dlg.koazaSelected():
-                self.koaza_code_selected = dlg.koazaSelected()
-                index = self.combo_koaza.findData(self.koaza_code_selected)
-                self.combo_koaza.setCurrentIndex(index)
-
-            if self.gaiku_code_selected != dlg.gaikuSelected():
-                self.gaiku_code_selected = dlg.gaikuSelected()
-                index = self.combo_gaiku.findData(self.gaiku_code_selected)
-                self.combo_gaiku.setCurrentIndex(index)
+            self.selectAzaCodes(dlg.citySelected(), dlg.ooazaSelected(), dlg.koazaSelected(), dlg.gaikuSelected())
+
+    def selectAzaCodes(self, city_code, ooaza_code, koaza_code, gaiku_code):
+        """
+        市町村から街区までのコードを選択する
+        大字以下はリストの作成を待ってから選択する
+
+        @param city_code  市町村コード
+        @param ooaza_code 大字コード
+        @param koaza_code 小字コード
+        @param gaiku_code 街区コード
+        """
+        self.pending_codes = {
+            "ooaza": ooaza_code or None,
+            "koaza": koaza_code or None,
+            "gaiku": gaiku_code or None,
+        }
+        if self.city_code_selected != city_code:
+            # 市町村の変更により大字リストが作成された後で大字を選択する
+            index = self.findComboIndex(self.combo_city, city_code)
+            self.combo_city.setCurrentIndex(index)
+        else:
+            self.applyPendingCode("ooaza")
+
+    def applyPendingCode(self, level):
+        """
+        リスト作成を待っていたコードを選択する
+
+        @param level "ooaza"、"koaza"、"gaiku"のいずれか
+        """
+        if level not in self.pending_codes:
+            return
+        if self.db_worker.isPending(level):
+            # リスト作成中なので完了後に選択する
+            return
+
+        combobox, next_level = {
+            "ooaza": (self.combo_ooaza, "koaza"),
+            "koaza": (self.combo_koaza, "gaiku"),
+            "gaiku": (self.combo_gaiku, None),
+        }[level]
+
+        code = self.pending_codes.pop(level)
+        if code is None:
+            index = 0 if combobox.count() > 0 else -1
+        else:
+            index = self.findComboIndex(combobox, code)
+        if code is None or index < 0:
+            # 下位のコードは選択できない
+            self.pending_codes.clear()
+
+        if combobox.currentIndex() != index:
+            # 選択変更により下位のリストが作成された後で下位を選択する
+            combobox.setCurrentIndex(index)
+        elif next_level is not None:
+            self.applyPendingCode(next_level)
 
     def handleLocateAza(self):
         """
         大字のみ、大字＋小字のみで所在表示を行う
         """
+        self.flushTypeahead()
         if self.gaiku_code_selected is not None:
             self.locateAza(self.gaiku_code_selected, self.gaiku_data_model, self.koaza_scale)
         elif self.koaza_code_selected is not None:
@@ -495,16 +824,15 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         @param scale 縮尺
         @return 地図移動に成功すればTrueを、それ以外はFalseを返却する
         """
-        if code is None:
+        if code is None or model is None:
             return False
         
         x_coord = 0
         y_coord = 0
-        for row in range(model.rowCount()):
-            if model.data(model.index(row, self.column_code)) == code:
-                x_coord = model.data(model.index(row, self.column_pos_x))
-                y_coord = model.data(model.index(row, self.column_pos_y))
-                break
+        row = self.findModelData(model, self.column_code, code)
+        if row >= 0:
+            x_coord = model.data(model.index(row, self.column_pos_x))
+            y_coord = model.data(model.index(row, self.column_pos_y))
 
         self.moveMapCenter(x_coord, y_coord, scale)
         return True
@@ -540,6 +868,7 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         検索結果が1件ならその位置を地図表示
         複数なら一致した地番をリスト表示
         """
+        self.flushTypeahead()
         self.clearChiban()
 
         # 少なくとも大字以上の入力は必要
@@ -552,9 +881,35 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
             return
 
         # 地番データをDBから取得する
-        QgsApplication.setOverrideCursor(Qt.WaitCursor)
-        self.model_chiban = self.db_util.getChibanModel(self.city_code_selected, self.ooaza_code_selected, self.koaza_code_selected, self.gaiku_code_selected, chiban)
-        QgsApplication.restoreOverrideCursor()
+        # 先頭ページのみ取得し、続きはスクロールに合わせて取得する。該当件数は別に検索する
+        self.chiban_conditions = (self.city_code_selected, self.ooaza_code_selected, self.koaza_code_selected, self.gaiku_code_selected, chiban)
+        self.db_worker.request("chiban", "getChibanPage", *self.chiban_conditions, None, 0, self.chiban_page_size)
+        self.db_worker.request("chiban_count", "getChibanCount", *self.chiban_conditions)
+
+        # ボタンの状態を変更する
+        self.setChibanButtonStatus()
+
+    def handleSearchAddress(self):
+        """
+        住所の自由入力検索
+
+        入力を市町村～街区と地番に分割して検索し、候補を順位の高い順にリスト表示する
+        入力に市町村名がない場合は選択中の市町村で検索する
+        """
+        text = self.edit_address.text().strip()
+        if len(text) == 0:
+            return
+
+        self.clearChiban()
+        self.db_worker.request("address", "searchAddress", text, self.city_code_selected, self.address_candidate_limit)
+
+    def showChibanModel(self, model):
+        """
+        地番検索結果を表示する
+
+        @param model 地番データモデル
+        """
+        self.model_chiban = model
 
         if self.model_chiban is not None:
             count = self.model_chiban.rowCount()
@@ -562,7 +917,7 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
                 self.iface.messageBar().pushMessage("該当地番はありません", Qgis.Warning)
  
             elif count > 0:
-                self.model_chiban.setHeaderData(0, Qt.Horizontal, "町字名　地番")
+                self.showChibanCount()
                 self.table_view_chiban.setModel(self.model_chiban)
                 # テーブルビューの設定
                 for column in range(1, self.model_chiban.columnCount()):
@@ -570,6 +925,11 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
                 self.table_view_chiban.horizontalHeader().setStretchLastSection(True)
                 # 先頭行を選択する
                 self.table_view_chiban.selectRow(0)
+                # 検索結果をレイヤーに表示する（続きのページは取得時に追加する）
+                self.showResultRows(self.model_chiban, 0, count - 1)
+                if isinstance(self.model_chiban, ChibanResultModel):
+                    self.model_chiban.rowsInserted.connect(
+                        lambda parent, first, last, model=self.model_chiban: self.showResultRows(model, first, last))
 
                 if count == 1:
                 # １件しかない場合はユーザーの行選択を待たずに地図表示する
@@ -580,16 +940,67 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         # 地番データ行の選択によりボタンの状態を変更する
         self.setChibanButtonStatus()
 
+    def showResultRows(self, model: ResultTableModel, first: int, last: int):
+        """
+        検索結果の行を地番検索結果レイヤーに追加し、筆のジオメトリを要求する
+        地番検索は検索条件の大字、住所の自由入力検索は地番まで一致した候補の大字の筆を取得する
+
+        @param model 地番検索または住所の自由入力検索の結果
+        @param first 追加する先頭の行
+        @param last 追加する最後の行
+        """
+        if self.result_layer is None or model is not self.model_chiban:
+            return
+        columns = [model.fieldIndex(field) for field in ("address", "chiban", "x", "y", "city_code", "ooaza_code")]
+        level_column = model.fieldIndex("level")
+        results = []
+        for values in model.rows[first:last + 1]:
+            result = [values[column] if column >= 0 else None for column in columns]
+            if isinstance(model, ChibanResultModel):
+                result[4:6] = self.chiban_conditions[0:2]
+            elif level_column >= 0 and values[level_column] != "chiban":
+                # 階層の候補は筆を取得しない
+                result[4:6] = None, None
+            results.append(tuple(result))
+        self.result_layer.addResults(results)
+
+        groups = self.result_layer.parcelGroups()
+        if len(groups) > 0:
+            # 取得中の要求は破棄し、未取得の筆をまとめて要求する
+            self.db_worker.request("chiban_parcels", "getChibanParcels", groups)
+
+    def removeResultLayer(self):
+        """
+        地番検索結果レイヤーをプロジェクトから削除する
+        """
+        if self.result_layer is not None:
+            self.result_layer.remove()
+
+    def showChibanCount(self):
+        """
+        地番検索結果の見出しに該当件数を表示する
+        """
+        if self.model_chiban is None:
+            return
+        if self.chiban_count is None:
+            self.model_chiban.setHeaderData(0, Qt.Horizontal, "町字名　地番")
+        else:
+            if isinstance(self.model_chiban, ChibanResultModel):
+                self.model_chiban.setTotalCount(self.chiban_count)
+            self.model_chiban.setHeaderData(0, Qt.Horizontal, f"町字名　地番（{self.chiban_count}件）")
+
     def handleChibanClear(self):
         """
         地番検索クリア
 
         大字、小字、地番の入力と選択を解除し、検索結果をクリアする
         """
+        self.pending_codes.clear()
         self.combo_city.setCurrentIndex(-1)
         self.city_code_selected = None
 
         self.edit_chiban.clear()
+        self.edit_address.clear()
         self.clearChiban()
 
         self.clearOoaza()
@@ -602,84 +1013,244 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
     def handleLocateChiban(self):
         """
         地番による所在表示
+        選択行が1行の場合はその位置に移動し、複数行の場合はすべての位置が入る範囲を表示する
         """
         model = self.table_view_chiban.model()
-        if model is None:
+        selection_model = self.table_view_chiban.selectionModel()
+        if model is None or selection_model is None:
             return
-        
-        indexes = self.table_view_chiban.selectedIndexes()
-        count = len(indexes)
-        if 0 == count:
+
+        points = []
+        for index in selection_model.selectedRows():
+            x_coord = model.data(model.index(index.row(), self.column_pos_x))
+            y_coord = model.data(model.index(index.row(), self.column_pos_y))
+            if x_coord is not None and y_coord is not None:
+                points.append((float(x_coord), float(y_coord)))
+        if len(points) == 0:
             return
-        
-        elif 1 == count:
-            x_coord = model.data(model.index(indexes[0].row(), self.column_pos_x))
-            y_coord = model.data(model.index(indexes[0].row(), self.column_pos_y))
-            self.moveMapCenter(x_coord, y_coord, self.chiban_scale)
-
-        elif count > 1:
-            bounding_box = None
-            p1 = None
-            p2 = None
-
-            for index in indexes:
-                x_coord = model.data(model.index(index.row(), self.column_pos_x))
-                y_coord = model.data(model.index(index.row(), self.column_pos_y))
-
-                if p1 is None:
-                    p1 = QgsPointXY(x_coord, y_coord)
-                elif p2 is None:
-                    p2 = QgsPointXY(x_coord, y_coord)
-                    bounding_box = QgsRectangle(p1, p2)
-                else:
-                    bounding_box.combineExtentWith(QgsPointXY(x_coord, y_coord))
 
-            self.iface.mapCanvas().setExtent(bounding_box)
+        if len(points) == 1:
+            self.moveMapCenter(points[0][0], points[0][1], self.chiban_scale)
+            return
+
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        self.zoomToExtent(min(xs), min(ys), max(xs), max(ys))
+
+    def handleZoomAllChiban(self):
+        """
+        地番検索結果の全件表示
+
+        地番検索は未取得のページを含む該当範囲をDBで集計して表示する
+        住所の自由入力検索は候補すべての位置が入る範囲を表示する
+        """
+        if self.model_chiban is None or self.model_chiban.rowCount() == 0:
+            return
+
+        if isinstance(self.model_chiban, ChibanResultModel):
+            self.db_worker.request("chiban_extent", "getChibanExtent", *self.chiban_conditions)
+            return
+
+        xs = []
+        ys = []
+        for row in range(self.model_chiban.rowCount()):
+            x_coord = self.modelData(self.model_chiban, row, self.column_pos_x)
+            y_coord = self.modelData(self.model_chiban, row, self.column_pos_y)
+            if x_coord is not None and y_coord is not None:
+                xs.append(float(x_coord))
+                ys.append(float(y_coord))
+        if len(xs) == 0:
+            self.iface.messageBar().pushMessage("該当地点がありません", Qgis.Warning)
+            return
+        self.zoomToExtent(min(xs), min(ys), max(xs), max(ys))
+
+    def zoomToExtent(self, xmin, ymin, xmax, ymax):
+        """
+        指定範囲が入るように地図を表示する
+        範囲が1点の場合は地番の縮尺でその位置に移動する
+
+        @param xmin 最小X座標
+        @param ymin 最小Y座標
+        @param xmax 最大X座標
+        @param ymax 最大Y座標
+        """
+        extent = QgsRectangle(xmin, ymin, xmax, ymax)
+        if extent.width() == 0 and extent.height() == 0:
+            self.moveMapCenter(xmin, ymin, self.chiban_scale)
+            return
+        # 端の地番が地図の縁に重ならないよう余白を加える
+        extent.scale(1.1)
+        self.iface.mapCanvas().setExtent(extent)
+        self.iface.mapCanvas().refresh()
 
     def handleLandmarkSearch(self):
         """
         ランドマーク検索
+
+        カテゴリと名称（またはふりがな）の部分一致で検索し、順位の高い順にリスト表示する
+        市町村を選択している場合はその市町村内を検索する
         """
-        pass
-    
+        condition = self.getSearchCondition()
+        if not condition["category"] and not condition["text"]:
+            return
+        self.searchData(condition)
+
     def handleLandmarkClear(self):
         """
         ランドマーク検索クリア
         """
         self.combo_category.setCurrentIndex(-1)
         self.edit_landmark.clear()
+        self.clearLandmark()
+
+    def clearLandmark(self):
+        """
+        ランドマークの検索結果をクリア
+        """
+        self.db_worker.cancel("landmark", "landmark_count")
         self.table_view_landmark.setModel(None)
+        if isinstance(self.model_landmark, LandmarkResultModel):
+            self.model_landmark.release()
+        self.model_landmark = None
+        self.landmark_conditions = None
+        self.landmark_count = None
+        self.button_locate_landmark.setEnabled(False)
 
     def handleLandmarkLocate(self):
         """
         ランドマーク所在表示
         """
-        pass
+        row = self.chooseSelectedFeature()
+        if row < 0:
+            return
+        x_coord = self.modelData(self.model_landmark, row, self.column_pos_x)
+        y_coord = self.modelData(self.model_landmark, row, self.column_pos_y)
+        self.moveMapCenter(x_coord, y_coord, self.landmark_scale)
 
     def makeLandmarkCategory(self, city_code):
         """
         カテゴリリストを再作成する
+
+        リストは検索完了後にhandleQueryResultで作成する
+        @param city_code 市町村コード。Noneの場合はエリアのすべてのカテゴリ
+        """
+        self.db_worker.request("landmark_category", "getLandmarkCategories", city_code)
+
+    def makeCategoryCombobox(self, model):
+        """
+        カテゴリコンボボックスのリストを作成する
+        選択中のカテゴリがリストにあれば選択を維持する
+
+        @param model カテゴリのデータモデル。ランドマークのデータがない場合はNone
+        """
+        self.setLandmarkEnabled(model is not None)
+        if model is None:
+            return
+        current = self.combo_category.currentData()
+        self.combo_category.clear()
+        self.combo_category.addItem("（すべて）", None)
+        for (category, ) in model.rows:
+            self.combo_category.addItem(str(category), category)
+        index = self.combo_category.findData(current) if current is not None else -1
+        self.combo_category.setCurrentIndex(max(index, 0))
+
+    def setLandmarkEnabled(self, enabled):
         """
-        pass
+        ランドマーク検索の使用可否を設定する
 
-    def searchData(self):
-        pass
+        @param enabled 使用可能な場合はTrue
+        """
+        self.page_landmark.setEnabled(enabled)
+        self.toolBox.setItemEnabled(self.toolBox.indexOf(self.page_landmark), enabled)
+        if not enabled:
+            self.clearLandmark()
+            self.combo_category.clear()
+
+    def searchData(self, condition):
+        """
+        ランドマークを検索する
+        先頭ページのみ取得し、続きはスクロールに合わせて取得する。該当件数は別に検索する
 
+        @param condition getSearchConditionの検索条件
+        """
+        self.clearLandmark()
+        self.landmark_conditions = (condition["category"], condition["text"], condition["city_code"])
+        self.db_worker.request("landmark", "getLandmarkPage", *self.landmark_conditions, 0, self.landmark_page_size)
+        self.db_worker.request("landmark_count", "getLandmarkCount", *self.landmark_conditions)
+
+    def showLandmarkModel(self, model):
+        """
+        ランドマークの検索結果を表示する
+        1件の場合はその位置に移動する
+
+        @param model ランドマークのデータモデル
+        """
+        self.model_landmark = model
+        if model is None:
+            return
+        if model.rowCount() == 0:
+            self.iface.messageBar().pushMessage("該当するランドマークはありません", Qgis.Warning)
+            return
+
+        self.showLandmarkCount()
+        self.table_view_landmark.setModel(model)
+        # 名称とカテゴリのみ表示する
+        for column in range(model.columnCount()):
+            self.table_view_landmark.setColumnHidden(column, model.field_names[column] not in ("name", "category"))
+        self.table_view_landmark.horizontalHeader().setStretchLastSection(True)
+        self.table_view_landmark.selectRow(0)
+        self.button_locate_landmark.setEnabled(True)
+
+        if model.rowCount() == 1:
+            self.handleLandmarkLocate()
+
+    def showLandmarkCount(self):
+        """
+        ランドマークの検索結果の見出しに該当件数を表示する
+        """
+        if self.model_landmark is None:
+            return
+        model = self.model_landmark
+        model.setHeaderData(model.fieldIndex("category"), Qt.Horizontal, "カテゴリ")
+        if self.landmark_count is None:
+            model.setHeaderData(0, Qt.Horizontal, "名称")
+        else:
+            if isinstance(model, LandmarkResultModel):
+                model.setTotalCount(self.landmark_count)
+            model.setHeaderData(0, Qt.Horizontal, f"名称（{self.landmark_count}件）")
 
     def chooseSelectedFeature(self):
-        pass
+        """
+        ランドマークの検索結果の選択行を取得する
+
+        @return 行番号。選択がない場合は-1
+        """
+        selection_model = self.table_view_landmark.selectionModel()
+        if self.model_landmark is None or selection_model is None:
+            return -1
+        rows = selection_model.selectedRows()
+        if len(rows) == 0:
+            return -1
+        return rows[0].row()
 
     def getSearchCondition(self):
         """
         検索条件を取得
 
-        @return dict
+        @return dict カテゴリ(category)、名称またはふりがな(text)、市町村コード(city_code)
         """
-        return {}
+        return {
+            "category": self.combo_category.currentData(),
+            "text": self.edit_landmark.text().strip(),
+            "city_code": self.city_code_selected,
+        }
 
     #Viewをクリックしたときの行の位置を取得
     def viewClicked(self, indexClicked):
-        pass
+        """
+        ランドマークの検索結果をクリックしたときに所在表示ボタンを使用可能にする
+        """
+        self.button_locate_landmark.setEnabled(indexClicked.isValid())
 
     def clear(self):
         """
@@ -688,6 +1259,142 @@ class SearchZmapDockWidget(QDockWidget, FORM_CLASS):
         self.handleChibanClear()
         self.handleLandmarkClear()
 
+    def prepareArea(self, refresh=False):
+        """
+        選択エリアの検索用データ（重心座標、地番検索キー）を作成または更新する
+
+        @param refresh Trueの場合は作成済みのデータを更新する
+        """
+        area_name = self.combo_area.currentText()
+        if len(area_name) == 0:
+            return
+
+        if refresh:
+            message = f"{area_name}の検索用データをデータベースの内容で更新します。よろしいですか？"
+        else:
+            message = f"{area_name}の検索用データをデータベースに作成します。よろしいですか？"
+        if QMessageBox.question(self, "住宅地図検索", message) != QMessageBox.Yes:
+            return
+
+        if self.area_worker is None:
+            self.area_worker = DbQueryWorker(self.db_util, self, keep_connection=False)
+            self.area_worker.resultReady.connect(self.handleAreaPrepared)
+            self.area_worker.queryFailed.connect(lambda channel, message: self.handleAreaPrepared(channel, False))
+
+        self.area_worker.request(area_name, "refreshArea" if refresh else "prepareArea", area_name)
+        self.iface.messageBar().pushMessage("住宅地図検索", f"{area_name}の検索用データを作成しています", Qgis.Info)
+
+    def handleAreaPrepared(self, area_name, success):
+        """
+        エリアの検索用データ作成完了時処理
+
+        @param area_name エリア名（スキーマ名）
+        @param success 成功した場合はTrue
+        """
+        if success:
+            self.iface.messageBar().pushMessage("住宅地図検索", f"{area_name}の検索用データを作成しました", Qgis.Success)
+        else:
+            self.iface.messageBar().pushMessage("住宅地図検索", f"{area_name}の検索用データの作成に失敗しました", Qgis.Warning)
+
+    def exportArea(self):
+        """
+        選択エリアの住所データをローカルファイル（GeoPackage）に出力する
+        出力したファイルは設定ファイルの[DB] local_fileに指定すると、DBサーバーなしで検索できる
+        """
+        area_name = self.combo_area.currentText()
+        if len(area_name) == 0:
+            return
+        if self.db_util.backend is not None:
+            self.iface.messageBar().pushMessage("住宅地図検索", "ローカルファイルを検索中のため出力できません", Qgis.Warning)
+            return
+
+        path, _ = QFileDialog.getSaveFileName(self, "住宅地図検索", f"{area_name}.gpkg", "GeoPackage (*.gpkg)")
+        if len(path) == 0:
+            return
+
+        if self.export_worker is None:
+            self.export_worker = DbQueryWorker(self.db_util, self, keep_connection=False)
+            self.export_worker.resultReady.connect(self.handleAreaExported)
+            self.export_worker.queryFailed.connect(lambda channel, message: self.handleAreaExported(channel, False))
+
+        self.export_worker.request(area_name, "exportArea", area_name, path)
+        self.iface.messageBar().pushMessage("住宅地図検索", f"{area_name}をローカルファイルに出力しています", Qgis.Info)
+
+    def handleAreaExported(self, area_name, success):
+        """
+        エリアのローカルファイル出力完了時処理
+
+        @param area_name エリア名（スキーマ名）
+        @param success 成功した場合はTrue
+        """
+        if success:
+            self.iface.messageBar().pushMessage("住宅地図検索", f"{area_name}をローカルファイルに出力しました", Qgis.Success)
+        else:
+            self.iface.messageBar().pushMessage("住宅地図検索", f"{area_name}のローカルファイル出力に失敗しました", Qgis.Warning)
+
+    def geocodeCsv(self):
+        """
+        CSVファイルの住所を選択エリアで一括検索し、座標を付けたCSVファイルを出力する
+        """
+        area_name = self.combo_area.currentText()
+        if len(area_name) == 0:
+            return
+        if self.batch_worker is not None and self.batch_worker.isPending("geocode"):
+            self.iface.messageBar().pushMessage("住宅地図検索", "住所の一括検索を実行中です", Qgis.Warning)
+            return
+
+        input_path, _ = QFileDialog.getOpenFileName(self, "住宅地図検索", "", "CSV (*.csv)")
+        if len(input_path) == 0:
+            return
+        output_path, _ = QFileDialog.getSaveFileName(
+            self, "住宅地図検索", os.path.splitext(input_path)[0] + "_result.csv", "CSV (*.csv)")
+        if len(output_path) == 0:
+            return
+
+        if self.batch_worker is None:
+            self.batch_worker = DbQueryWorker(self.db_util, self, keep_connection=False)
+            self.batch_worker.resultReady.connect(self.handleCsvGeocoded)
+            self.batch_worker.queryFailed.connect(self.handleCsvGeocodeFailed)
+
+        self.batch_worker.request("geocode", "geocodeCsv", input_path, output_path)
+        self.iface.messageBar().pushMessage("住宅地図検索", f"{area_name}で住所を一括検索しています（進捗はログに出力します）", Qgis.Info)
+
+    def handleCsvGeocoded(self, channel, result):
+        """
+        住所の一括検索完了時処理
+
+        @param channel チャネル名
+        @param result 件数、一致件数、処理時間などの辞書
+        """
+        if result is None:
+            self.handleCsvGeocodeFailed(channel, "")
+            return
+        message = f"住所を一括検索しました（{result['rows']}件、地番一致 {result['matched']}件、{result['rows_per_sec']:.0f}件/秒）"
+        self.iface.messageBar().pushMessage("住宅地図検索", message, Qgis.Success)
+
+    def handleCsvGeocodeFailed(self, channel, message):
+        """
+        住所の一括検索失敗時処理
+        """
+        self.iface.messageBar().pushMessage("住宅地図検索", f"住所の一括検索に失敗しました {message}", Qgis.Warning)
+
+    def stopWorkers(self):
+        """
+        検索ワーカーを停止する
+        """
+        if self.select_aza_dialog is not None:
+            self.select_aza_dialog.release()
+        self.db_worker.stop()
+        self.prefetch_worker.stop()
+        self.db_util.background_prefetch = False
+        if self.area_worker is not None:
+            self.area_worker.stop()
+        if self.export_worker is not None:
+            self.export_worker.stop()
+        if self.batch_worker is not None:
+            self.batch_worker.stop()
+        self.db_util.clearPreparedQueries()
+
     def closeEvent(self, event):
         self.clear()
         self.closingPlugin.emit()
@@ -11,22 +11,24 @@
 """
 
 import os
+from collections import OrderedDict
 
 from PyQt5 import uic
-from PyQt5.QtCore import pyqtSignal, Qt, QSortFilterProxyModel, QRegExp, QModelIndex
+from PyQt5.QtCore import pyqtSignal, Qt, QSortFilterProxyModel, QModelIndex
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QDialog, QTableView, QStyledItemDelegate, QStyleOptionViewItem
-from PyQt5.QtSql import QSqlQueryModel
-
-from qgis.core import QgsApplication
 
 from .db_util import DbUtil
+from .db_worker import DbQueryWorker
+from .fuzzy_matcher import FuzzyNameIndex, foldName
+from .kana_index import KANA_DISC, KanaIndex
+from .result_model import ResultTableModel
 
 FORM_CLASS, _ = uic.loadUiType(os.path.join(
     os.path.dirname(__file__), 'select_aza_dialog_base.ui'))
 
-# 行とかなの辞書
-KANA_DISC = {"あ":"あいうえお", "か":"かきくけこ", "さ":"さしすせそ", "た":"たちつてと", "な":"なにぬねの", "は":"はひふへほ", "ま":"まみむめも", "や":"やゆよ", "ら":"らりるれろ", "わ":"わをん"}
+# 表示した階層を保持する数
+LEVEL_CACHE_SIZE = 32
 
 class SelectAzaDialog(QDialog, FORM_CLASS):
     """
@@ -35,11 +37,12 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
     # ダイアログクローズシグナル定義
     closingPlugin = pyqtSignal()
 
-    def __init__(self, db_util: DbUtil, parent=None):
+    def __init__(self, db_util: DbUtil, db_worker: DbQueryWorker, parent=None):
         """
         Constructor.
 
         :param db_util 
+        :param db_worker 検索用ワーカー
         """
         super(SelectAzaDialog, self).__init__(parent)
         # Set up the user interface from Designer.
@@ -51,6 +54,12 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
 
         self.db_util = db_util
 
+        # データ検索はワーカーで行い、完了時にテーブルビューを更新する
+        self.db_worker = db_worker
+        self.query_channel = f"select_aza_{id(self)}"
+        self.db_worker.resultReady.connect(self.handleQueryResult)
+        self.db_worker.queryFailed.connect(self.handleQueryFailed)
+
         # ボタンアイコン
         self.button_back.setIcon(QIcon(os.path.join(os.path.dirname(__file__), f"icons/back.png")))
         self.button_back_gaiku.setIcon(QIcon(os.path.join(os.path.dirname(__file__), f"icons/back.png")))
@@ -75,6 +84,9 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
         self.button_dan_o.clicked.connect(self.filterDan_o)
         self.button_dan_all.clicked.connect(self.filterDan_all)
 
+        # 名称・ふりがなのあいまい検索
+        self.edit_search.textChanged.connect(self.filterName)
+
         # Viewは並べ替え不可とする
         self.tableView.setSortingEnabled(False)
         # Viewは単一行選択モード
@@ -108,6 +120,16 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
 
         self.current_mode = ""
 
+        # 表示した階層のキャッシュ（戻る、再表示時はDBに問い合わせずに表示する）
+        # (スキーマ名, メソッド名, 引数...) -> {"model": データモデル, "kana_index": 50音索引, "fuzzy_index": 名称の索引,
+        #                                    "gyo": 行, "dan": 段, "scroll": スクロール位置}
+        self.level_cache = OrderedDict()
+        # 表示中の階層のキャッシュのキー
+        self.current_key = None
+        # 選択中の行、段（フィルターなしは空文字）
+        self.filter_gyo = ""
+        self.filter_dan = ""
+
         # テーブルビューヘッダ
         self.headers = {
             "city": [   {"name": "50音", "hidden": False, "field": "initial_group", "width": 50},
@@ -135,10 +157,13 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
 
         # 50音フィルターモデル
         self.fileter_proxy_model = JSyllabaryFilterProxyModel(self)
-        self.fileter_proxy_model.setFilterKeyColumn(3)
+        # 50音列は前行と同じなら表示しない
+        self.blank_delegate = EquivalentBlankColumnDelegate(self)
 
-        # かな行段ボタンの使用可否辞書初期化
-        self.clearInitalDict()
+        # 表示中のデータの50音索引（かな行段ボタンの使用可否とフィルターに使用する）
+        self.kana_index = KanaIndex()
+        # 表示中のデータの名称の索引（名称の検索欄の入力時に作成する）
+        self.fuzzy_index = None
 
         # かな行ボタン
         self.gyo_buttons = {
@@ -185,6 +210,9 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
 
         :param city_code 市町村コード。省略可
         """
+        self.select_ooaza_code = ""
+        self.select_koaza_code = ""
+        self.select_gaiku_code = ""
         if city_code is None or city_code == "":
             # 市町村選択から行う
             self.select_city_code = ""
@@ -198,21 +226,13 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
         """
         市町村データ表示
         """
-        QgsApplication.setOverrideCursor(Qt.WaitCursor)
-
         self.current_mode = "city"
 
         self.select_ooaza_code = ""
         self.select_koaza_code = ""
         self.select_gaiku_code = ""
 
-        query_model = self.db_util.getCityDataJSyllabary()
-        if query_model is None or query_model.rowCount() == 0:
-            self.tableView.setModel(None)
-        else:
-            self.updateTableView(query_model)
-        
-        QgsApplication.restoreOverrideCursor()
+        self.requestData("getCityDataJSyllabary")
 
     def setOoazaData(self):
         """
@@ -220,19 +240,11 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
 
         選択済みの市町村コードを使用して大字データをDBより取得し、テーブルビューに表示する
         """
-        QgsApplication.setOverrideCursor(Qt.WaitCursor)
-
         self.current_mode = "ooaza"
         self.select_koaza_code = ""
         self.select_gaiku_code = ""
 
-        query_model = self.db_util.getOoazaDataJSyllabary(self.select_city_code)
-        if query_model is None or query_model.rowCount() == 0:
-            self.tableView.setModel(None)
-        else:
-            self.updateTableView(query_model)
-
-        QgsApplication.restoreOverrideCursor()
+        self.requestData("getOoazaDataJSyllabary", self.select_city_code)
 
     def setKoazaData(self):
         """
@@ -241,21 +253,10 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
         選択済みの市町村コード、大字コードを使用して大字データをDBより取得し、テーブルビューに表示する
         ただし、小字データがなかったり、code=0の「小字なし」データしかない場合は街区データを表示する
         """
-        QgsApplication.setOverrideCursor(Qt.WaitCursor)
-
         self.current_mode = "koaza"
         self.select_gaiku_code = ""
  
-        query_model = self.db_util.getKoazaDataJSyllabary(self.select_city_code, self.select_ooaza_code)
-        if self.hasNonZero(query_model):
-            # code=0の「小字なし」以外に有効なデータがある場合はこのデータをテーブル表示する
-            self.updateTableView(query_model)
-        else:
-            # データがない場合、あるいは小字なしデータしかない場合は街区を設定
-            self.select_koaza_code = "0"
-            self.setGaikuData()
-
-        QgsApplication.restoreOverrideCursor()
+        self.requestData("getKoazaDataJSyllabary", self.select_city_code, self.select_ooaza_code)
 
     def setGaikuData(self):
         """
@@ -263,21 +264,154 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
 
         選択済みの市町村コード、大字コード、小字コードを使用して大字データをDBより取得し、テーブルビューに表示する
         """
-        QgsApplication.setOverrideCursor(Qt.WaitCursor)
-
         self.current_mode = "gaiku"
-        query_model = self.db_util.getGaikuData(self.select_city_code, self.select_ooaza_code, self.select_koaza_code)
-        if self.hasNonZero(query_model):
-            self.updateGaikuTableView(query_model)
-        else:
-            # code=0の「街区なし」以外に有効なデータがある場合はこのデータをテーブル表示する
-            self.tableView.setModel(None)
-            self.select_gaiku_code = "0"
-            self.accept()
+        self.requestData("getGaikuData", self.select_city_code, self.select_ooaza_code, self.select_koaza_code)
+
+    def requestData(self, method: str, *args):
+        """
+        データの検索をワーカーに要求する
+        検索中はテーブルビューを操作不可とする
+        表示したことのある階層はキャッシュから表示する
+        市町村配下の階層データを取得済みであればDBに問い合わせずに表示する
+
+        :param method DbUtilのメソッド名
+        :param args メソッドの引数
+        """
+        # 表示中の階層の状態を保存する
+        self.saveLevelState()
+
+        self.current_key = (self.db_util.schema_name, method) + tuple(args)
+        level = self.level_cache.get(self.current_key)
+        if level is not None:
+            self.db_worker.cancel(self.query_channel)
+            self.level_cache.move_to_end(self.current_key)
+            self.showLevel(level)
+            return
+
+        tree = self.db_util.readyTree(args[0]) if len(args) > 0 else None
+        if tree is not None:
+            self.db_worker.cancel(self.query_channel)
+            self.handleQueryResult(self.query_channel, getattr(tree, method)(*args))
+            return
+
+        self.tableView.setEnabled(False)
+        self.setCursor(Qt.BusyCursor)
+        self.db_worker.request(self.query_channel, method, *args)
+
+    def handleQueryResult(self, channel: str, query_model: ResultTableModel):
+        """
+        データ検索完了時の処理
 
-        QgsApplication.restoreOverrideCursor()
+        :param channel 検索要求のチャネル名
+        :param query_model 検索結果のデータモデル
+        """
+        if channel != self.query_channel:
+            return
+
+        self.tableView.setEnabled(True)
+        self.unsetCursor()
+
+        if query_model is not None and self.current_key is not None:
+            # スキーマが変わっていれば以前のスキーマのキャッシュは破棄する
+            if any(key[0] != self.current_key[0] for key in self.level_cache):
+                self.clearLevelCache()
+            self.level_cache[self.current_key] = {"model": query_model, "kana_index": None, "fuzzy_index": None,
+                                               "gyo": "", "dan": "", "scroll": 0}
+            while len(self.level_cache) > LEVEL_CACHE_SIZE:
+                self.level_cache.popitem(last=False)
+
+        self.showModel(query_model)
+
+    def showModel(self, query_model: ResultTableModel):
+        """
+        データモデルを現在の階層のテーブルビューに表示する
+
+        :param query_model 検索結果のデータモデル
+        """
+        if self.current_mode in ("city", "ooaza"):
+            if query_model is None or query_model.rowCount() == 0:
+                self.tableView.setModel(None)
+            else:
+                self.updateTableView(query_model)
+
+        elif self.current_mode == "koaza":
+            if self.hasNonZero(query_model):
+                # code=0の「小字なし」以外に有効なデータがある場合はこのデータをテーブル表示する
+                self.updateTableView(query_model)
+            else:
+                # データがない場合、あるいは小字なしデータしかない場合は街区を設定
+                self.select_koaza_code = "0"
+                self.setGaikuData()
+
+        elif self.current_mode == "gaiku":
+            if self.hasNonZero(query_model):
+                self.updateGaikuTableView(query_model)
+            else:
+                # code=0の「街区なし」以外に有効なデータがある場合はこのデータをテーブル表示する
+                self.tableView.setModel(None)
+                self.select_gaiku_code = "0"
+                self.accept()
+
+    def showLevel(self, level):
+        """
+        キャッシュした階層を表示し、フィルター、スクロール位置を復元する
+
+        :param level 階層のキャッシュ
+        """
+        key = self.current_key
+        self.tableView.setEnabled(True)
+        self.unsetCursor()
+        self.showModel(level["model"])
+        if self.current_key != key or self.tableView.model() is not self.fileter_proxy_model:
+            # 下位の階層に進んだ、または街区の表示
+            if self.current_key == key:
+                self.tableView.verticalScrollBar().setValue(level["scroll"])
+            return
+
+        if level["gyo"]:
+            self.gyo_buttons[level["gyo"]].setChecked(True)
+            self.filterGyo(level["gyo"])
+            if level["dan"]:
+                for button in self.dan_buttons:
+                    if button.isVisible() and button.text() == level["dan"]:
+                        button.setChecked(True)
+                        self.filterDan(level["dan"])
+                        break
+        self.tableView.verticalScrollBar().setValue(level["scroll"])
+
+    def saveLevelState(self):
+        """
+        表示中の階層のフィルター、スクロール位置をキャッシュに保存する
+        """
+        level = self.level_cache.get(self.current_key)
+        if level is None or self.tableView.model() is None:
+            return
+        level["gyo"] = self.filter_gyo
+        level["dan"] = self.filter_dan
+        level["scroll"] = self.tableView.verticalScrollBar().value()
+
+    def clearLevelCache(self):
+        """
+        表示した階層のキャッシュを破棄する
+        """
+        self.level_cache.clear()
+        self.current_key = None
+
+    def handleQueryFailed(self, channel: str, message: str):
+        """
+        データ検索失敗時の処理
 
-    def hasNonZero(self, model: QSqlQueryModel):
+        :param channel 検索要求のチャネル名
+        :param message エラーメッセージ
+        """
+        if channel != self.query_channel:
+            return
+
+        self.tableView.setEnabled(True)
+        self.unsetCursor()
+        self.tableView.setModel(None)
+
+    def hasNonZero(self, model: ResultTableModel):
         """
         「小字なし」「街区なし」以外のデータがあるか判定する
         :return 小字なし(code=0)以外のデータがある場合はTrueを、それ以外はFalseを返却する
@@ -288,13 +422,13 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
 
         has = False
         for row in range(model.rowCount()):
-            if str(model.record(row).value("code")) != "0":
+            if str(model.value(row, "code")) != "0":
                 has = True
                 break
         
         return has
 
-    def updateTableView(self, query_model: QSqlQueryModel):
+    def updateTableView(self, query_model: ResultTableModel):
         """
         テーブルビューに指定の50音順データモデルを設定する
 
@@ -304,8 +438,8 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
         self.tableView.setModel(None)
         self.fileter_proxy_model.setSourceModel(None)
 
-        # 行段の使用可否リストをクリア
-        self.clearInitalDict()
+        # 50音索引をクリア
+        self.kana_index = KanaIndex()
 
         if query_model is None:
             return
@@ -315,14 +449,23 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
         for i, h in enumerate(header):
             query_model.setHeaderData(i, Qt.Horizontal, h["name"])
 
-        # 頭文字の使用状況（＝かなフィルタボタンの使用可否）取得
-        for row in range(query_model.rowCount()):
-            initial_group = str(query_model.record(row).value("initial_group"))
-            self.initial_group_dict[initial_group] = True
-            initial = str(query_model.record(row).value("initial"))
-            self.initial_dict[initial] = True
+        # 50音索引（＝かなフィルタボタンの使用可否とフィルター対象行）作成
+        # キャッシュした階層は作成済みの索引を使用する
+        level = self.level_cache.get(self.current_key)
+        if level is not None and level["model"] is query_model:
+            if level["kana_index"] is None:
+                level["kana_index"] = KanaIndex(query_model)
+            self.kana_index = level["kana_index"]
+        else:
+            self.kana_index = KanaIndex(query_model)
+
+        # 名称の検索欄をクリア
+        self.fuzzy_index = None
+        self.clearSearchText()
+        self.edit_search.show()
 
         # フィルタ用のモデル
+        self.fileter_proxy_model.setKanaIndex(self.kana_index)
         self.fileter_proxy_model.setSourceModel(query_model)
         self.tableView.setModel(self.fileter_proxy_model)
 
@@ -333,7 +476,7 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
                 self.tableView.setColumnWidth(i, h.get("width", 0))
 
         # 50音列を前行と同じなら表示しないようにする
-        self.tableView.setItemDelegateForColumn(0, EquivalentBlankColumnDelegate())
+        self.tableView.setItemDelegateForColumn(0, self.blank_delegate)
 
         # 行段ボタンの使用可否を設定する
         self.resetGyoDanButtons()
@@ -342,7 +485,7 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
         # 選択を解除する
         self.tableView.clearSelection()
 
-    def updateGaikuTableView(self, query_model: QSqlQueryModel):
+    def updateGaikuTableView(self, query_model: ResultTableModel):
         """
         テーブルビューに指定の街区データモデルを設定する
 
@@ -363,45 +506,24 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
         for idx, h in enumerate(header):
             self.tableView.setColumnHidden(idx, h["hidden"])
 
-        # 行と段のボタンを非表示にする
+        # 行と段のボタン、名称の検索欄を非表示にする
         self.frame_gyo.hide()
         self.frame_dan.hide()
+        self.clearSearchText()
+        self.edit_search.hide()
         # 戻るボタン、確定ボタンを設定する
         self.setButtonStatus()
         # 選択を解除する
         self.tableView.clearSelection()
 
-    def clearInitalDict(self):
-        """
-        かな行段ボタンの使用可否を保持する辞書を初期化
-        """
-        # かな行ボタン使用可否辞書
-        self.initial_group_dict = {
-            'あ': False, 'か': False, 'さ': False, 'た': False, 'な': False,
-            'は': False, 'ま': False, 'や': False, 'ら': False, 'わ': False
-        }
-
-        # かな段ボタン使用可否辞書
-        self.initial_dict = {
-            'あ': False, 'い': False, 'う': False, 'え': False, 'お': False,
-            'か': False, 'き': False, 'く': False, 'け': False, 'こ': False,
-            'さ': False, 'し': False, 'す': False, 'せ': False, 'そ': False,
-            'た': False, 'ち': False, 'つ': False, 'て': False, 'と': False,
-            'な': False, 'に': False, 'ぬ': False, 'ね': False, 'の': False,
-            'は': False, 'ひ': False, 'ふ': False, 'へ': False, 'ほ': False,
-            'ま': False, 'み': False, 'む': False, 'め': False, 'も': False,
-            'や': False, 'ゆ': False, 'よ': False,
-            'ら': False, 'り': False, 'る': False, 'れ': False, 'ろ': False,
-            'わ': False, 'を': False, 'ん': False,
-        }
-
-
     def resetGyoDanButtons(self):
         """
         かな行段ボタンの状態をリセットする
         """
         # フィルタークリア
         self.fileter_proxy_model.clearFilter()
+        self.filter_gyo = ""
+        self.filter_dan = ""
         # すべて（行）、すべて（段）をチェック
         self.button_gyo_all.setChecked(True)
         self.button_dan_all.setChecked(True)
@@ -410,10 +532,8 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
         # 段は非表示
         self.frame_dan.hide()
 
-        for k, v in self.initial_group_dict.items():
-            button = self.gyo_buttons.get(k, None)
-            if button is not None:
-                button.setEnabled(v)
+        for gyo, button in self.gyo_buttons.items():
+            button.setEnabled(self.kana_index.hasGyo(gyo))
 
     def setButtonStatus(self):
         """
@@ -559,8 +679,11 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
 
         :param gyo_str あ、か、さ、...の行を表す文字
         """
-        # データを行でフィルター
+        # データを行でフィルター（名称の検索は解除）
+        self.clearSearchText()
         self.fileter_proxy_model.filterGyo(gyo_str)
+        self.filter_gyo = gyo_str
+        self.filter_dan = ""
 
         # 行に属する段ボタンのテキストと使用可否を決定する
         enabled_dan = list(KANA_DISC.get(gyo_str, ""))
@@ -571,8 +694,8 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
                 button.setVisible(True)
                 # 該当する仮名を表示する
                 button.setText(enabled_dan[idx])
-                # データ取得時に設定した頭文字の使用状況辞書を元にボタンの使用可否を決定する
-                button.setEnabled(self.initial_dict.get(enabled_dan[idx], False))
+                # データ取得時に作成した50音索引を元にボタンの使用可否を決定する
+                button.setEnabled(self.kana_index.hasInitial(enabled_dan[idx]))
             else:
                 # 使用する仮名の数より多い段ボタンは不可視にする
                 button.setVisible(False)
@@ -588,8 +711,64 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
         :type dan_str str
         """ 
         self.fileter_proxy_model.filterDan(kana)
+        self.filter_dan = kana
         self.tableView.scrollToTop()
 
+    def levelFuzzyIndex(self):
+        """
+        表示中の階層の名称・ふりがなのあいまい検索用の索引を取得する
+        索引は初回の検索時に作成し、階層のキャッシュに保持する
+
+        @return FuzzyNameIndex（項目の市町村コードの位置にデータモデルの行番号を保持する）
+        """
+        if self.fuzzy_index is not None:
+            return self.fuzzy_index
+        model = self.fileter_proxy_model.sourceModel()
+        name_column, kana_column = model.fieldIndex("name"), model.fieldIndex("kana")
+        self.fuzzy_index = FuzzyNameIndex(
+            (str(row), "", "", values[name_column], values[kana_column], None, None)
+            for row, values in enumerate(model.rows))
+        level = self.level_cache.get(self.current_key)
+        if level is not None and level["model"] is model:
+            if level["fuzzy_index"] is None:
+                level["fuzzy_index"] = self.fuzzy_index
+            self.fuzzy_index = level["fuzzy_index"]
+        return self.fuzzy_index
+
+    def filterName(self, text: str):
+        """
+        名称・ふりがなが入力に近い行でフィルターする
+        1、2文字の入力は前方一致のみ、それより長い入力は長さの1/3までの誤りを許容する
+
+        :param text 入力
+        """
+        if self.tableView.model() is not self.fileter_proxy_model or self.fileter_proxy_model.sourceModel() is None:
+            return
+        key = foldName(text)
+        if not key:
+            self.resetGyoDanButtons()
+            return
+
+        index = self.levelFuzzyIndex()
+        matches = index.search(text, (), limit=len(index), max_distance=len(key) // 3 + 0.5)
+        self.fileter_proxy_model.setAcceptedRows(frozenset(int(entry[0]) for entry, _ in matches))
+        self.filter_gyo = ""
+        self.filter_dan = ""
+        # 行段ボタンは「すべて」に戻す
+        self.button_gyo_all.blockSignals(True)
+        self.button_gyo_all.setChecked(True)
+        self.button_gyo_all.blockSignals(False)
+        self.frame_dan.hide()
+        self.tableView.scrollToTop()
+
+    def clearSearchText(self):
+        """
+        名称の検索欄をフィルターを変更せずにクリアする
+        """
+        self.edit_search.blockSignals(True)
+        self.edit_search.clear()
+        self.edit_search.blockSignals(False)
+
     def showEvent(self, event):
         """
         表示前に準備処理を行わなかった場合、市町村の選択から行う
@@ -597,6 +776,30 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
         if self.current_mode == "":
             self.prepare()
 
+    def done(self, result):
+        """
+        ダイアログ終了時に検索要求を破棄し、表示中の階層の状態を保存する
+        ダイアログは再表示に備えて破棄しない
+        """
+        self.db_worker.cancel(self.query_channel)
+        self.saveLevelState()
+        self.tableView.setEnabled(True)
+        self.unsetCursor()
+        super().done(result)
+
+    def release(self):
+        """
+        ワーカーとの接続を解除する
+        """
+        self.db_worker.forget(self.query_channel)
+        try:
+            self.db_worker.resultReady.disconnect(self.handleQueryResult)
+            self.db_worker.queryFailed.disconnect(self.handleQueryFailed)
+        except TypeError:
+            # 接続解除済み
+            pass
+        self.clearLevelCache()
+
     def closeEvent(self, event):
         """
         クローズシグナルを発生する
@@ -668,15 +871,76 @@ class SelectAzaDialog(QDialog, FORM_CLASS):
 class JSyllabaryFilterProxyModel(QSortFilterProxyModel):
     """
     かなでフィルターできる代替モデルクラス
+
+    表示する行は50音索引の行番号の集合で判定する
+    フィルター変更時に、group_columnが前の行と異なる（グループの先頭）かを行ごとに求めておく
     """
-    def __init__(self, parent):
+    def __init__(self, parent, group_column: int = 0):
         super().__init__(parent)
-    
+        self.kana_index = KanaIndex()
+        # 表示する行番号の集合。Noneの場合はすべて表示する
+        self.accepted_rows = None
+        # グループの先頭を判定する列と、表示行ごとの判定結果
+        self.group_column = group_column
+        self.group_starts = []
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        self.updateGroupStarts()
+
+    def setKanaIndex(self, kana_index: KanaIndex):
+        """
+        ソースモデルの50音索引を設定する
+
+        :param kana_index 50音索引
+        """
+        self.kana_index = kana_index
+        self.accepted_rows = None
+
+    def setAcceptedRows(self, rows):
+        """
+        表示する行番号の集合を設定し、フィルターを更新する
+        """
+        self.accepted_rows = rows
+        self.invalidateFilter()
+        self.updateGroupStarts()
+
+    def updateGroupStarts(self):
+        """
+        表示行ごとにグループの先頭かを求める
+        """
+        source = self.sourceModel()
+        self.group_starts = []
+        if source is None:
+            return
+        previous = None
+        for row in range(self.rowCount()):
+            source_row = self.mapToSource(self.index(row, self.group_column)).row()
+            value = str(source.data(source.index(source_row, self.group_column), Qt.DisplayRole))
+            self.group_starts.append(row == 0 or value != previous)
+            previous = value
+
+    def isGroupStart(self, row: int):
+        """
+        表示行がグループの先頭か判定する
+
+        :param row 表示行の行番号
+        :return グループの先頭の場合はTrue
+        """
+        if 0 <= row < len(self.group_starts):
+            return self.group_starts[row]
+        return True
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex):
+        if self.accepted_rows is None:
+            return True
+        return source_row in self.accepted_rows
+
     def clearFilter(self):
         """
         フィルター解除
         """
-        self.setFilterRegExp(QRegExp(""))
+        self.setAcceptedRows(None)
 
     def filterGyo(self, gyo: str):
         """
@@ -684,40 +948,39 @@ class JSyllabaryFilterProxyModel(QSortFilterProxyModel):
         :param gyo あ、か、さ...などの行をあらわす一文字
         :type gyo str
         """
-        # 行と段の辞書からこの行に属するかなを取得する
-        filter = KANA_DISC.get(gyo, "")
-        if filter == "":
+        if gyo not in KANA_DISC:
             # 有効な仮名がない場合フィルターを解除する
-            self.setFilterRegExp(QRegExp(""))
+            self.setAcceptedRows(None)
             return
-        # filterKeyColumnにこのかなのうち一つが見つかれば表示するように設定する
-        self.setFilterRegExp(QRegExp(f"[{filter}]"))
+        # この行に属するかなが頭文字の行を表示する
+        self.setAcceptedRows(self.kana_index.rowsOfGyo(gyo))
 
     def filterDan(self, dan: str):
         """
-        filterKeyColumnのデータが引数の文字に一致したら表示するように設定する
+        頭文字が引数の文字に一致したら表示するように設定する
 
         :param dan かな
         @type dan str
         """
-        self.setFilterRegExp(QRegExp(dan))
+        self.setAcceptedRows(self.kana_index.rowsOfInitial(dan))
 
 
 # -----------------------------------------------------------------------------------------------
 class EquivalentBlankColumnDelegate(QStyledItemDelegate):
     """
     前の行と同値なら表示しない列用スタイル描画委任クラス
+
+    JSyllabaryFilterProxyModelの場合は、フィルター変更時に求めたグループの先頭の判定を使用する
     """
-    def paint(self, painter, option: QStyleOptionViewItem, index: QModelIndex):
-        if index.row() > 0:
-            # 前行と値の比較をする
-            prev_index = index.model().index(index.row() - 1, index.column())
-            if str(index.model().data(prev_index, Qt.DisplayRole)) == str(index.model().data(index, Qt.DisplayRole)):
+    def initStyleOption(self, option: QStyleOptionViewItem, index: QModelIndex):
+        super().initStyleOption(option, index)
+        model = index.model()
+        if isinstance(model, JSyllabaryFilterProxyModel):
+            if not model.isGroupStart(index.row()):
                 # 前行と同じ値なら表示しない
-                new_option = QStyleOptionViewItem()
-                self.initStyleOption(new_option, index)
-                new_option.text = ""
-                super().paint(painter, new_option, index)
-                return
-
-        super().paint(painter, option, index)
+                option.text = ""
+        elif index.row() > 0:
+            # 前行と値の比較をする
+            prev_index = model.index(index.row() - 1, index.column())
+            if str(model.data(prev_index, Qt.DisplayRole)) == str(model.data(index, Qt.DisplayRole)):
+                option.text = ""
@@ -0,0 +1,35 @@
+-- 住所データの重心座標と外接矩形をマテリアライズドビューに保持する
+--
+-- 使用方法:
+--   psql -h <ホスト> -d <データベース> -U <ユーザー> -v schema=<スキーマ名> -f prepare_area.sql
+--
+-- <スキーマ>.address_centroid が存在する場合、プラグインはv_address_listの代わりにこれを検索し、
+-- 検索のたびに重心を計算しない。
+-- v_address_listのデータを更新した場合は次のSQL（またはプラグインの「エリアのデータ更新」）で更新する。
+--   REFRESH MATERIALIZED VIEW <スキーマ名>.address_centroid;
+
+\set ON_ERROR_STOP on
+
+BEGIN;
+
+DROP MATERIALIZED VIEW IF EXISTS :"schema".address_centroid;
+
+CREATE MATERIALIZED VIEW :"schema".address_centroid AS
+SELECT city_code, ooaza_code, koaza_code, gaiku_code, chiban, setai_name,
+       name, kana, header, address,
+       honban, edaban, magoban, himagoban, yasyagoban, kigo,
+       ST_X(ST_Centroid(the_geom)) AS x,
+       ST_Y(ST_Centroid(the_geom)) AS y,
+       ST_XMin(the_geom) AS xmin,
+       ST_YMin(the_geom) AS ymin,
+       ST_XMax(the_geom) AS xmax,
+       ST_YMax(the_geom) AS ymax
+  FROM :"schema".v_address_list;
+
+-- 市町村～街区の絞り込み
+CREATE INDEX address_centroid_code_idx ON :"schema".address_centroid
+    (city_code, ooaza_code, koaza_code, gaiku_code);
+
+COMMIT;
+
+ANALYZE :"schema".address_centroid;
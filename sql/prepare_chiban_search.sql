@@ -0,0 +1,47 @@
+-- 地番検索用の正規化キーと索引を作成する
+--
+-- 使用方法:
+--   psql -h <ホスト> -d <データベース> -U <ユーザー> -v schema=<スキーマ名> -f prepare_chiban_search.sql
+--
+-- <スキーマ>.chiban_search が存在する場合、プラグインはv_address_listの代わりにこれを検索する。
+-- v_address_listの地番データを更新した場合は次のSQLで再作成する。
+--   REFRESH MATERIALIZED VIEW <スキーマ名>.chiban_search;
+
+\set ON_ERROR_STOP on
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+BEGIN;
+
+DROP MATERIALIZED VIEW IF EXISTS :"schema".chiban_search;
+
+-- chiban_key: 地番のハイフン類を「‐」に統一した検索キー（プラグイン側の正規化と同じ変換）
+-- x, y: 重心座標（検索時の重心計算を不要にする）
+-- xmin, ymin, xmax, ymax: 外接矩形（検索結果の全件表示の範囲に使用する）
+CREATE MATERIALIZED VIEW :"schema".chiban_search AS
+SELECT city_code, ooaza_code, koaza_code, gaiku_code,
+       address, chiban,
+       honban, edaban, magoban, himagoban, yasyagoban, kigo,
+       TRANSLATE(chiban, '－−ー―‑', '‐‐‐‐‐') AS chiban_key,
+       ST_X(ST_Centroid(the_geom)) AS x,
+       ST_Y(ST_Centroid(the_geom)) AS y,
+       ST_XMin(the_geom) AS xmin,
+       ST_YMin(the_geom) AS ymin,
+       ST_XMax(the_geom) AS xmax,
+       ST_YMax(the_geom) AS ymax
+  FROM :"schema".v_address_list
+ WHERE chiban != '';
+
+-- 大字内の絞り込みと地番順の並べ替え（検索結果のページ取得のキーを兼ねる）
+-- NULLを含む列はプラグインの並び順（db_util.CHIBAN_ORDER_KEYS）と同じCOALESCEの式とする
+CREATE INDEX chiban_search_order_idx ON :"schema".chiban_search
+    (city_code, ooaza_code, COALESCE(honban, -1), COALESCE(edaban, -1), COALESCE(magoban, -1),
+     COALESCE(himagoban, -1), COALESCE(yasyagoban, -1), COALESCE(kigo, ''), COALESCE(address, ''));
+
+-- 部分一致検索（LIKE '%...%'）
+CREATE INDEX chiban_search_trgm_idx ON :"schema".chiban_search
+    USING gin (chiban_key gin_trgm_ops);
+
+COMMIT;
+
+ANALYZE :"schema".chiban_search;
@@ -0,0 +1,45 @@
+-- ランドマーク検索用の正規化キーと索引を作成する
+--
+-- 使用方法:
+--   psql -h <ホスト> -d <データベース> -U <ユーザー> -v schema=<スキーマ名> -f prepare_landmark_search.sql
+--
+-- ランドマークのビュー <スキーマ>.v_landmark_list（city_code, category, name, kana, address, the_geom）が必要。
+-- <スキーマ>.landmark_search が存在する場合、プラグインはv_landmark_listの代わりにこれを検索する。
+-- v_landmark_listのデータを更新した場合は次のSQL（またはプラグインの「エリアのデータ更新」）で更新する。
+--   REFRESH MATERIALIZED VIEW <スキーマ名>.landmark_search;
+--
+-- pg_trgmで日本語の部分一致に索引を使用するには、データベースのLC_CTYPEがC以外（ja_JP.UTF-8など）であること。
+
+\set ON_ERROR_STOP on
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+BEGIN;
+
+DROP MATERIALIZED VIEW IF EXISTS :"schema".landmark_search;
+
+-- kana_key: ふりがなのカタカナをひらがなに揃えた検索キー（プラグイン側の正規化と同じ変換）
+-- x, y: 重心座標（検索時の重心計算を不要にする）
+CREATE MATERIALIZED VIEW :"schema".landmark_search AS
+SELECT city_code, category, name, kana, address,
+       TRANSLATE(kana,
+                 'ァアィイゥウェエォオカガキギクグケゲコゴサザシジスズセゼソゾタダチヂッツヅテデトドナニヌネノハバパヒビピフブプヘベペホボポマミムメモャヤュユョヨラリルレロヮワヰヱヲンヴヵヶ',
+                 'ぁあぃいぅうぇえぉおかがきぎくぐけげこごさざしじすずせぜそぞただちぢっつづてでとどなにぬねのはばぱひびぴふぶぷへべぺほぼぽまみむめもゃやゅゆょよらりるれろゎわゐゑをんゔゕゖ') AS kana_key,
+       ST_X(ST_Centroid(the_geom)) AS x,
+       ST_Y(ST_Centroid(the_geom)) AS y
+  FROM :"schema".v_landmark_list
+ WHERE name IS NOT NULL AND name != '';
+
+-- カテゴリ一覧と市町村・カテゴリの絞り込み
+CREATE INDEX landmark_search_category_idx ON :"schema".landmark_search
+    (city_code, category);
+
+-- 名称・ふりがなの部分一致検索（LIKE '%...%'）
+CREATE INDEX landmark_search_name_trgm_idx ON :"schema".landmark_search
+    USING gin (name gin_trgm_ops);
+CREATE INDEX landmark_search_kana_trgm_idx ON :"schema".landmark_search
+    USING gin (kana_key gin_trgm_ops);
+
+COMMIT;
+
+ANALYZE :"schema".landmark_search;
@@ -0,0 +1,112 @@
+"""
+/***************************************************************************
+ test_address_parser
+                                 A QGIS plugin
+ 住所の自由入力検索のテスト
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import unittest
+
+try:
+    from ..address_parser import AddressSearch, addressKey, kanjiNumber, kanjiNumerals
+    from ..result_model import ResultTableModel
+except ImportError:
+    AddressSearch = None
+
+
+class HierarchyDbUtil:
+    """
+    階層のデータモデルのみを返すDbUtilの代わり
+    """
+    # 親のコード -> (名称, コード, X座標, Y座標)のリスト
+    CHILDREN = {
+        (): [("津市", "24201", 1.0, 1.0), ("津山市", "33203", 2.0, 2.0)],
+        ("24201",): [("丸之内", "001", 3.0, 3.0), ("大谷町", "002", 4.0, 4.0)],
+        ("24201", "001"): [("一丁目", "001", 3.0, 3.0)],
+        ("24201", "001", "001"): [("1番", "1", 5.0, 5.0), ("12番", "12", 6.0, 6.0)],
+        ("24201", "002"): [("東裏", "01", 7.0, 7.0)],
+        ("24201", "002", "01"): [],
+    }
+
+    def model(self, *parent_codes):
+        return ResultTableModel(["name", "code", "x", "y"], self.CHILDREN.get(parent_codes, []))
+
+    getCityModel = getOoazaModel = getKoazaModel = getGaikuModel = model
+
+
+@unittest.skipIf(AddressSearch is None, "QGISがありません")
+class KanjiNumberTest(unittest.TestCase):
+    def test_units(self):
+        self.assertEqual(kanjiNumber("二十三"), 23)
+        self.assertEqual(kanjiNumber("十"), 10)
+        self.assertEqual(kanjiNumber("百五"), 105)
+        self.assertEqual(kanjiNumber("千二百三十四"), 1234)
+
+    def test_positional(self):
+        self.assertEqual(kanjiNumber("一〇五"), 105)
+        self.assertEqual(kanjiNumber("三"), 3)
+
+    def test_numerals(self):
+        self.assertEqual(kanjiNumerals("八の二十"), "8の20")
+
+
+@unittest.skipIf(AddressSearch is None, "QGISがありません")
+class AddressKeyTest(unittest.TestCase):
+    def test_numerals_before_units(self):
+        # 単位の前の漢数字のみ算用数字に
+        self.assertEqual(addressKey("一丁目"), "1丁目")
+        self.assertEqual(addressKey("二十三番地"), "23")
+        self.assertEqual(addressKey("千代田"), "千代田")
+
+    def test_separators(self):
+        self.assertEqual(addressKey("１２－３"), "12-3")
+        self.assertEqual(addressKey("12ー3"), "12-3")
+        self.assertEqual(addressKey("1番地2"), "1-2")
+        self.assertEqual(addressKey("1番2号"), "1-2")
+        self.assertEqual(addressKey("1の2"), "1-2")
+
+    def test_suffix(self):
+        self.assertEqual(addressKey("12番"), "12")
+        self.assertEqual(addressKey("津市 丸之内 1番"), "津市丸之内1")
+
+
+@unittest.skipIf(AddressSearch is None, "QGISがありません")
+class AddressSearchParseTest(unittest.TestCase):
+    def setUp(self):
+        self.search = AddressSearch(HierarchyDbUtil())
+
+    def paths(self, text, city_code=None):
+        _, paths = self.search.parse(text, city_code)
+        return [(path.codes(), path.rest) for path in paths]
+
+    def test_key(self):
+        key, _ = self.search.parse("三重県津市丸之内一番地")
+        self.assertEqual(key, "津市丸之内1")
+
+    def test_gaiku(self):
+        paths = self.paths("津市丸之内一丁目12-3")
+        self.assertIn((["24201", "001", "001", "12"], "3"), paths)
+        # 「1」は「12」の先頭には一致させない
+        self.assertNotIn((["24201", "001", "001", "1"], "2-3"), paths)
+        # 下の階層を省略した入力の候補も残す
+        self.assertIn((["24201", "001", "001"], "12-3"), paths)
+        self.assertIn((["24201", "001"], "1丁目12-3"), paths)
+
+    def test_aza_prefix(self):
+        self.assertIn((["24201", "002", "01"], "5"), self.paths("津市大谷町字東裏5"))
+
+    def test_city_code(self):
+        # 入力に市町村名がない場合は指定の市町村
+        self.assertIn((["24201", "002"], "5"), self.paths("大谷町5", "24201"))
+        self.assertEqual(self.paths("大谷町5"), [])
+
+    def test_longest_city(self):
+        paths = self.paths("津山市")
+        self.assertEqual(paths, [(["33203"], "")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+/***************************************************************************
+ test_db_backend
+                                 A QGIS plugin
+ ローカルファイルの出力と検索のテスト
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import os
+import tempfile
+import unittest
+
+try:
+    from ..db_backend import EXPORT_CHIBAN_VIEW, EXPORT_FIELDS, EXPORT_TABLE, AreaExporter, SqliteBackend
+except ImportError:
+    AreaExporter = None
+
+
+def exportRow(ooaza_code, chiban, x, y, **values):
+    """
+    EXPORT_FIELDS、EXPORT_COORDINATE_FIELDSの順の行を作成する
+    """
+    values.update(city_code="24201", ooaza_code=ooaza_code, chiban=chiban)
+    bounds = (None,) * 4 if x is None else (x - 1, y - 1, x + 1, y + 1)
+    return tuple(values.get(field, "") for field in EXPORT_FIELDS) + (x, y) + bounds
+
+
+@unittest.skipIf(AreaExporter is None, "QGISがありません")
+class AreaExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "area.gpkg")
+        self.rows = [
+            exportRow("", "", 10.0, 20.0, name="津市"),
+            exportRow("001", "", 11.0, 21.0, name="丸之内"),
+            exportRow("001", "12－3", 12.0, 22.0, address="津市丸之内12－3", honban=12, edaban=3),
+            exportRow("001", "12", 13.0, 23.0, address="津市丸之内12", honban=12, edaban=None),
+            exportRow("002", "5", None, None, address="津市大谷町5", honban=5, edaban=None),
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def export(self):
+        exporter = AreaExporter(self.path, "ja_test", 6676, "", str.maketrans("－", "‐"))
+        exporter.addRows(self.rows)
+        exporter.finish("test")
+        return exporter
+
+    def test_round_trip(self):
+        exporter = self.export()
+        self.assertEqual(exporter.count, len(self.rows))
+        self.assertEqual(exporter.extent, [10.0, 20.0, 13.0, 23.0])
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+        backend = SqliteBackend(self.path)
+        try:
+            # 出力時のスキーマ名でATTACHする
+            self.assertEqual(backend.schemaNames(), ["ja_test"])
+            self.assertTrue(backend.hasRelation(EXPORT_TABLE, "ja_test"))
+            self.assertTrue(backend.hasRelation(EXPORT_CHIBAN_VIEW, "ja_test"))
+            self.assertFalse(backend.hasRelation(EXPORT_TABLE, "other"))
+            self.assertTrue(backend.hasColumn(EXPORT_CHIBAN_VIEW, "xmin", "ja_test"))
+            self.assertFalse(backend.hasColumn(EXPORT_CHIBAN_VIEW, "the_geom", "ja_test"))
+
+            fields, rows = backend.select(
+                f"SELECT {', '.join(EXPORT_FIELDS)}, x, y, xmin, ymin, xmax, ymax FROM ja_test.{EXPORT_TABLE} ORDER BY fid")
+            self.assertEqual(fields, EXPORT_FIELDS + ["x", "y", "xmin", "ymin", "xmax", "ymax"])
+            self.assertEqual(rows, self.rows)
+
+            # 地番検索ビューは地番の行のみ、地番検索キーは変換テーブルで揃える
+            _, rows = backend.select(
+                f"SELECT address, chiban_key FROM ja_test.{EXPORT_CHIBAN_VIEW}"
+                " WHERE city_code = :city_code ORDER BY address", {"city_code": "24201"})
+            self.assertEqual(rows, [("津市丸之内12", "12"), ("津市丸之内12－3", "12‐3"), ("津市大谷町5", "5")])
+
+            # 地番検索ビューの外接矩形（全件表示の範囲）
+            _, rows = backend.select(
+                f"SELECT MIN(xmin), MIN(ymin), MAX(xmax), MAX(ymax) FROM ja_test.{EXPORT_CHIBAN_VIEW}"
+                " WHERE ooaza_code = '001'")
+            self.assertEqual(rows, [(11.0, 21.0, 14.0, 24.0)])
+
+            _, rows = backend.select("SELECT value FROM ja_test.search_zmap_meta WHERE key = 'rows'")
+            self.assertEqual(rows, [(str(len(self.rows)),)])
+        finally:
+            backend.close()
+
+    def test_schema_name(self):
+        self.export()
+        backend = SqliteBackend(self.path, "ja_other")
+        try:
+            self.assertEqual(backend.schemaNames(), ["ja_other"])
+            _, rows = backend.select(f"SELECT COUNT(*) FROM ja_other.{EXPORT_TABLE}")
+            self.assertEqual(rows, [(len(self.rows),)])
+            self.assertIsNone(backend.select("SELECT * FROM ja_other.missing"))
+        finally:
+            backend.close()
+
+    def test_abort(self):
+        exporter = AreaExporter(self.path, "ja_test", 6676, "", {})
+        exporter.addRows(self.rows)
+        exporter.abort()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+/***************************************************************************
+ test_fuzzy_matcher
+                                 A QGIS plugin
+ 名称のあいまい検索のテスト
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import unittest
+
+from ..fuzzy_matcher import FuzzyNameIndex, editDistance, foldName
+
+
+ROWS = [
+    ("24201", "", "", "津市", "つし", 1.0, 1.0),
+    ("24201", "001", "", "丸之内", "まるのうち", 2.0, 2.0),
+    ("24201", "002", "", "大谷町", "おおたにちょう", 3.0, 3.0),
+    ("24201", "002", "01", "東裏", "ひがしうら", 4.0, 4.0),
+    ("24202", "", "", "四日市市", "よっかいちし", 5.0, 5.0),
+    ("24202", "001", "", "丸之内", "まるのうち", 6.0, 6.0),
+]
+
+
+class FoldNameTest(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(foldName(None), "")
+        self.assertEqual(foldName(""), "")
+
+    def test_kana(self):
+        # カタカナ・半角カナはひらがなに、小書きのかなは通常のかなに
+        self.assertEqual(foldName("マルノウチ"), "まるのうち")
+        self.assertEqual(foldName("ﾏﾙﾉｳﾁ"), "まるのうち")
+        self.assertEqual(foldName("ヨッカイチ"), "よつかいち")
+
+    def test_long_vowel(self):
+        # 長音記号は前のかなの母音（濁音は清音の母音）
+        self.assertEqual(foldName("ケーキ"), "けえき")
+        self.assertEqual(foldName("ゴーシ"), "ごおし")
+
+    def test_width_and_space(self):
+        self.assertEqual(foldName("大谷町　１丁目"), "大谷町1丁目")
+
+    def test_itaiji(self):
+        # 異体字は常用の字体に
+        self.assertEqual(foldName("丸之内"), foldName("丸の内"))
+        self.assertEqual(foldName("竜ケ崎"), foldName("龍ヶ﨑"))
+
+
+class EditDistanceTest(unittest.TestCase):
+    def test_distance(self):
+        self.assertEqual(editDistance("まるのうち", "まるのうち", 2), 0)
+        self.assertEqual(editDistance("まるのうち", "まるのうし", 2), 1)
+        self.assertEqual(editDistance("まるのうち", "まるうち", 2), 1)
+        self.assertEqual(editDistance("", "あい", 2), 2)
+
+    def test_limit(self):
+        # limitを超える場合はlimit + 1
+        self.assertEqual(editDistance("あいうえお", "かきくけこ", 2), 3)
+        self.assertEqual(editDistance("あ", "あいうえお", 2), 3)
+
+
+class FuzzyNameIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = FuzzyNameIndex(ROWS)
+
+    def test_len(self):
+        self.assertEqual(len(self.index), len(ROWS))
+
+    def test_exact(self):
+        results = self.index.search("大谷町")
+        self.assertEqual(results[0], (ROWS[2], 0))
+
+    def test_kana(self):
+        results = self.index.search("ヒガシウラ")
+        self.assertEqual(results[0], (ROWS[3], 0))
+
+    def test_typo(self):
+        results = self.index.search("まるのうし")
+        self.assertEqual([entry[3] for entry, _ in results], ["丸之内", "丸之内"])
+        self.assertTrue(all(distance == 1 for _, distance in results))
+
+    def test_prefix(self):
+        # 先頭の一致は完全一致より0.5下げる
+        results = self.index.search("よっかい")
+        self.assertEqual(results[0], (ROWS[4], 0.5))
+
+    def test_parent_codes(self):
+        self.assertEqual(self.index.search("丸之内", ("24202",)), [(ROWS[5], 0)])
+        self.assertEqual([entry for entry, _ in self.index.search("津市", ())], [ROWS[0]])
+        self.assertEqual(self.index.search("東裏", ("24201",)), [])
+
+    def test_limit(self):
+        self.assertEqual(len(self.index.search("丸之内", limit=1)), 1)
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search(""), [])
+        self.assertEqual(self.index.search("さくらがおか"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+/***************************************************************************
+ test_hierarchy_snapshot
+                                 A QGIS plugin
+ 階層スナップショットのテスト
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+try:
+    from ..hierarchy_snapshot import HierarchySnapshot
+except ImportError:
+    HierarchySnapshot = None
+
+
+# city_code, ooaza_code, koaza_code, gaiku_code, name, kana, header, initial, x, y
+ROWS = [
+    ("24201", "", "", "", "津市", "つし", "た", "つ", 1.0, 1.0),
+    ("24201", "001", "", "", "丸之内", "まるのうち", "ま", "ま", 2.0, 2.0),
+    ("24201", "002", "", "", "大谷町", "おおたにちょう", "あ", "お", 3.0, 3.0),
+    ("24201", "001", "001", "", "一丁目", "いっちょうめ", "あ", "い", 4.0, 4.0),
+    ("24201", "001", "001", "2", "2番", "", "", "", 5.0, 5.0),
+    ("24201", "001", "001", "1", "1番", "", "", "", 6.0, 6.0),
+    ("24201", "001", "001", "0", "", "", "", "", 7.0, 7.0),
+    ("24202", "", "", "", "四日市市", "よっかいちし", "や", "よ", 8.0, 8.0),
+]
+
+
+@unittest.skipIf(HierarchySnapshot is None, "QGISがありません")
+class HierarchySnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = HierarchySnapshot.snapshotPath(self.directory.name, "db:5432/zmap", "ja")
+        self.snapshot = HierarchySnapshot(self.path)
+
+    def tearDown(self):
+        self.snapshot.close()
+        self.directory.cleanup()
+
+    def test_path(self):
+        self.assertEqual(os.path.basename(self.path), "db_5432_zmap_ja.sqlite")
+
+    def test_not_built(self):
+        self.assertFalse(self.snapshot.open())
+        self.assertIsNone(self.snapshot.signature())
+
+    def test_signature(self):
+        self.snapshot.build(ROWS, "sig1", "hash1")
+        self.assertTrue(self.snapshot.isOpen())
+        self.assertFalse(self.snapshot.needsValidation(60))
+        self.assertEqual(self.snapshot.signature(), "sig1")
+        self.assertEqual(self.snapshot.contentHash(), "hash1")
+        self.snapshot.setSignature("sig2")
+        self.assertEqual(self.snapshot.signature(), "sig2")
+        self.assertEqual(self.snapshot.contentHash(), "hash1")
+
+        # 作成済みのファイルは開き直しても使用できる
+        snapshot = HierarchySnapshot(self.path)
+        self.assertTrue(snapshot.open())
+        self.assertTrue(snapshot.needsValidation(60))
+        self.assertEqual(snapshot.signature(), "sig2")
+        snapshot.close()
+
+    def test_version(self):
+        # 形式が異なるスナップショットは使用しない
+        self.snapshot.build(ROWS, "sig1")
+        self.snapshot.close()
+        conn = sqlite3.connect(self.path)
+        conn.execute("UPDATE meta SET value = '0' WHERE key = 'version'")
+        conn.commit()
+        conn.close()
+        self.assertFalse(self.snapshot.open())
+
+    def test_models(self):
+        self.snapshot.build(ROWS, "sig1")
+        self.assertEqual(self.snapshot.getCityModel().rows, [("津市", "24201", 1.0, 1.0), ("四日市市", "24202", 8.0, 8.0)])
+        self.assertEqual([row[1] for row in self.snapshot.getOoazaModel("24201").rows], ["001", "002"])
+        self.assertEqual([row[1] for row in self.snapshot.getKoazaModel("24201", "001").rows], ["001"])
+        self.assertEqual([row[1] for row in self.snapshot.getGaikuModel("24201", "001", "001").rows], ["0", "1", "2"])
+        # 街区データは街区コード0を除く
+        self.assertEqual(self.snapshot.getGaikuData("24201", "001", "001").rows, [("1番", "1"), ("2番", "2")])
+        self.assertEqual(len(self.snapshot.getCityRows("24201")), 7)
+
+    def test_names(self):
+        self.snapshot.build(ROWS, "sig1")
+        self.assertEqual(self.snapshot.getCityName("24202"), "四日市市")
+        self.assertEqual(self.snapshot.getOoazaName("24201", "002"), "大谷町")
+        self.assertEqual(self.snapshot.getKoazaName("24201", "001", "001"), "一丁目")
+        self.assertIsNone(self.snapshot.getCityName("99999"))
+
+    def test_syllabary(self):
+        self.snapshot.build(ROWS, "sig1")
+        model = self.snapshot.getOoazaDataJSyllabary("24201")
+        self.assertEqual([model.value(row, "name") for row in range(model.rowCount())], ["大谷町", "丸之内"])
+
+
+if __name__ == "__main__":
+    unittest.main()
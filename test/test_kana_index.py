@@ -0,0 +1,42 @@
+"""
+/***************************************************************************
+ test_kana_index
+                                 A QGIS plugin
+ 50音の索引のテスト
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import unittest
+
+from ..kana_index import kanaInitial
+
+
+class KanaInitialTest(unittest.TestCase):
+    def test_hiragana(self):
+        self.assertEqual(kanaInitial("つし"), "つ")
+
+    def test_katakana(self):
+        self.assertEqual(kanaInitial("マルノウチ"), "ま")
+        self.assertEqual(kanaInitial("ﾏﾙﾉｳﾁ"), "ま")
+
+    def test_voiced(self):
+        # 濁音・半濁音は清音
+        self.assertEqual(kanaInitial("ごしょ"), "こ")
+        self.assertEqual(kanaInitial("パーク"), "は")
+        self.assertEqual(kanaInitial("ヴィラ"), "う")
+
+    def test_small(self):
+        self.assertEqual(kanaInitial("ぁ"), "あ")
+        self.assertEqual(kanaInitial("ゐのくち"), "い")
+
+    def test_not_kana(self):
+        self.assertEqual(kanaInitial(None), "")
+        self.assertEqual(kanaInitial(""), "")
+        self.assertEqual(kanaInitial("丸之内"), "")
+        self.assertEqual(kanaInitial("1ちょうめ"), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
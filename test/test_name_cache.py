@@ -0,0 +1,67 @@
+"""
+/***************************************************************************
+ test_name_cache
+                                 A QGIS plugin
+ 名称のキャッシュのテスト
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import unittest
+
+from ..name_cache import NameCache
+
+
+class NameCacheTest(unittest.TestCase):
+    def test_make_key(self):
+        self.assertEqual(NameCache.makeKey("ja", "24201"), ("ja", "24201", "", ""))
+        self.assertEqual(NameCache.makeKey("ja", "24201", None, "01"), ("ja", "24201", "", "01"))
+
+    def test_get_put(self):
+        cache = NameCache(4)
+        key = NameCache.makeKey("ja", "24201")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "津市")
+        self.assertEqual(cache.get(key), "津市")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "size": 1})
+
+    def test_put_none(self):
+        cache = NameCache(4)
+        cache.put(("ja", "1", "", ""), None)
+        self.assertEqual(cache.stats()["size"], 0)
+        cache = NameCache(0)
+        cache.put(("ja", "1", "", ""), "a")
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_eviction(self):
+        # 上限を超えた場合は最も古く参照されたものから破棄する
+        cache = NameCache(2)
+        cache.put("a", "A")
+        cache.put("b", "B")
+        self.assertEqual(cache.get("a"), "A")
+        cache.put("c", "C")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "A")
+        self.assertEqual(cache.get("c"), "C")
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_put_refreshes(self):
+        cache = NameCache(2)
+        cache.put("a", "A")
+        cache.put("b", "B")
+        cache.put("a", "A2")
+        cache.put("c", "C")
+        self.assertEqual(cache.get("a"), "A2")
+        self.assertIsNone(cache.get("b"))
+
+    def test_clear(self):
+        cache = NameCache(2)
+        cache.put("a", "A")
+        cache.get("a")
+        cache.clear()
+        self.assertEqual(cache.stats(), {"hits": 0, "misses": 0, "size": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
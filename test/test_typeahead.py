@@ -0,0 +1,49 @@
+"""
+/***************************************************************************
+ test_typeahead
+                                 A QGIS plugin
+ 字コード入力欄の入力補完のテスト
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+"""
+import unittest
+
+try:
+    from ..typeahead import PrefixIndex
+except ImportError:
+    PrefixIndex = None
+
+
+ROWS = [("001", "丸之内"), ("002", "丸之内養正町"), ("010", "大谷町"), ("011", "マルヤマ"), (None, "未設定")]
+
+
+@unittest.skipIf(PrefixIndex is None, "QGISがありません")
+class PrefixIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = PrefixIndex(ROWS)
+
+    def test_len(self):
+        # コードがNoneの行は除き、コードと名称のキーを保持する
+        self.assertEqual(len(self.index), 8)
+
+    def test_code(self):
+        self.assertEqual(self.index.suggest("01"), [("010", "大谷町"), ("011", "マルヤマ")])
+        self.assertEqual(self.index.suggest("001"), [("001", "丸之内")])
+
+    def test_name(self):
+        # 一致したキーの短い順（完全一致が先頭）
+        self.assertEqual(self.index.suggest("丸の内"), [("001", "丸之内"), ("002", "丸之内養正町")])
+        self.assertEqual(self.index.suggest("まる"), [("011", "マルヤマ")])
+
+    def test_limit(self):
+        self.assertEqual(self.index.suggest("0", limit=2), [("001", "丸之内"), ("002", "丸之内養正町")])
+
+    def test_no_match(self):
+        self.assertEqual(self.index.suggest(""), [])
+        self.assertEqual(self.index.suggest("9"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+"""
+/***************************************************************************
+ typeahead
+                                 A QGIS plugin
+ 字コード入力欄の入力補完
+                              -------------------
+        copyright            : (C) 2023 by orbitalnet.inc
+ ***************************************************************************/
+
+ 大字・小字・街区のコード入力欄で、入力が一定時間止まってから候補を表示し、選択を確定する。
+ 候補はコンボボックスのリストのコードと名称の前方一致の索引から求め、DBには問い合わせない。
+ 確定（コンボボックスの選択と下位の階層の再作成）は入力が止まったとき、Enterキー、候補の選択時に1回だけ行う
+"""
+from bisect import bisect_left
+
+from qgis.PyQt.QtCore import pyqtSignal, Qt, QObject, QTimer, QStringListModel
+from qgis.PyQt.QtWidgets import QCompleter, QLineEdit
+
+from .fuzzy_matcher import foldName
+from .result_model import ResultTableModel
+
+
+# 候補の表示でコードと名称を区切る文字
+SUGGESTION_SEPARATOR = "　"
+
+
+class PrefixIndex:
+    """
+    コードと名称の前方一致の索引
+
+    コードと名称のキー（fuzzy_matcher.foldNameで揃えたもの）を並べ替えて保持し、
+    二分探索で入力から始まるキーの範囲を求める
+    """
+    def __init__(self, rows):
+        """
+        @param rows (コード, 名称)のリスト
+        """
+        items = []
+        for order, (code, name) in enumerate(rows):
+            if code is None:
+                continue
+            code = str(code)
+            items.append((foldName(code), order, code, name))
+            name_key = foldName(name)
+            if name_key:
+                items.append((name_key, order, code, name))
+        items.sort()
+        self.keys = [item[0] for item in items]
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def suggest(self, text, limit=10):
+        """
+        コードまたは名称が入力から始まる項目を取得する
+        一致したキーの短い順（完全一致が先頭）、同じ長さはリストの順に並べる
+
+        @param text 入力
+        @param limit 取得する最大件数
+        @return (コード, 名称)のリスト
+        """
+        key = foldName(text)
+        if not key:
+            return []
+        matches = {}
+        position = bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position].startswith(key):
+            item_key, order, code, name = self.items[position]
+            rank = (len(item_key), order)
+            if code not in matches or rank < matches[code][0]:
+                matches[code] = (rank, name)
+            position += 1
+        ranked = sorted(matches.items(), key=lambda match: match[1][0])
+        return [(code, name) for code, (_, name) in ranked[:limit]]
+
+
+class AzaTypeahead(QObject):
+    """
+    コード入力欄の入力補完クラス
+
+    入力のたびにタイマーを再開し、delayミリ秒入力がなければ候補を表示してsettledシグナルを発行する。
+    Enterキー、候補の選択時は待たずに発行する
+    """
+    # 入力の確定シグナル(入力またはコード)
+    settled = pyqtSignal(str)
+
+    def __init__(self, edit: QLineEdit, delay=300, limit=10, parent=None):
+        """
+        @param edit コード入力用ラインエディット
+        @param delay 入力が止まってから確定するまでの時間（ミリ秒）
+        @param limit 表示する候補の最大数
+        """
+        super().__init__(parent)
+        self.edit = edit
+        self.limit = limit
+        # 候補の元のデータモデルと、初回の候補表示時に作成する索引
+        self.model = None
+        self.index = None
+        # 確定待ちの入力
+        self.pending_text = None
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.handleTimeout)
+
+        # 候補は索引で絞り込み済みのため、入力による絞り込みは行わない
+        self.suggestion_model = QStringListModel(self)
+        self.completer = QCompleter(self.suggestion_model, self)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.setCaseSensitivity(Qt.CaseInsensitive)
+        self.completer.setWidget(edit)
+        self.completer.activated[str].connect(self.handleActivated)
+
+        edit.returnPressed.connect(self.flush)
+
+    def setModel(self, model):
+        """
+        候補の元のデータモデル（コンボボックスのリスト）を設定し、確定待ちの入力を破棄する
+
+        @param model name、code列を持つデータモデル。Noneの場合は候補なし
+        """
+        self.model = model
+        self.index = None
+        self.cancel()
+
+    def prefixIndex(self):
+        """
+        データモデルの前方一致の索引を取得する（初回に作成する）
+
+        @return PrefixIndex。データモデルがない場合はNone
+        """
+        if self.index is None and isinstance(self.model, ResultTableModel):
+            name_column, code_column = self.model.fieldIndex("name"), self.model.fieldIndex("code")
+            self.index = PrefixIndex((values[code_column], values[name_column]) for values in self.model.rows)
+        return self.index
+
+    def input(self, text: str):
+        """
+        入力を受け付け、確定を遅らせる
+
+        @param text 入力
+        """
+        self.pending_text = text
+        self.completer.popup().hide()
+        self.timer.start()
+
+    def isPending(self):
+        """
+        確定待ちの入力があるか判定する
+        """
+        return self.pending_text is not None
+
+    def cancel(self):
+        """
+        確定待ちの入力と候補の表示を破棄する
+        """
+        self.timer.stop()
+        self.pending_text = None
+        self.completer.popup().hide()
+
+    def flush(self):
+        """
+        確定待ちの入力があれば直ちに確定する
+        """
+        if self.pending_text is None:
+            return
+        self.timer.stop()
+        self.completer.popup().hide()
+        self.emitSettled(self.pending_text)
+
+    def handleTimeout(self):
+        """
+        入力が止まった時の処理
+        候補を表示し、入力を確定する
+        """
+        text = self.pending_text
+        if text is None:
+            return
+        self.showSuggestions(text)
+        self.emitSettled(text)
+
+    def showSuggestions(self, text: str):
+        """
+        入力に前方一致する候補を表示する
+        候補が入力と一致する1件のみの場合は表示しない
+
+        @param text 入力
+        """
+        index = self.prefixIndex()
+        suggestions = index.suggest(text, self.limit) if index is not None else []
+        if len(suggestions) == 0 or (len(suggestions) == 1 and suggestions[0][0] == text.strip()):
+            self.completer.popup().hide()
+            return
+        self.suggestion_model.setStringList([f"{code}{SUGGESTION_SEPARATOR}{name}" for code, name in suggestions])
+        self.completer.complete()
+
+    def handleActivated(self, suggestion: str):
+        """
+        候補の選択時の処理
+        選択した候補のコードを入力欄に設定して確定する
+
+        @param suggestion 候補の表示文字列
+        """
+        code = suggestion.split(SUGGESTION_SEPARATOR, 1)[0]
+        self.timer.stop()
+        self.edit.blockSignals(True)
+        self.edit.setText(code)
+        self.edit.blockSignals(False)
+        self.emitSettled(code)
+
+    def emitSettled(self, text: str):
+        """
+        入力を確定する
+
+        @param text 入力またはコード
+        """
+        self.pending_text = None
+        self.settled.emit(text)